@@ -44,4 +44,13 @@ def create_app(config_class=Config):
     # 启用请求支持
     CORS(app)
 
+    # 启动文档处理工作线程
+    # 调试模式下 Werkzeug 重载器会先启动一个监控进程，只在实际提供服务的子进程中启动
+    if Config.INGESTION_WORKERS_ENABLED and (
+        not Config.APP_DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+    ):
+        from app.services.ingestion_worker import ingestion_worker_pool
+
+        ingestion_worker_pool.start()
+
     return app
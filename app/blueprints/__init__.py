@@ -2,7 +2,7 @@
 蓝图模块
 """
 
-from app.blueprints import auth, knowledgebase, settings, document
+from app.blueprints import auth, knowledgebase, settings, document, retrieval
 from flask import Flask
 
 
@@ -11,6 +11,7 @@ def register_blueprints(app: Flask):
     app.register_blueprint(knowledgebase.bp)
     app.register_blueprint(settings.bp)
     app.register_blueprint(document.bp)
+    app.register_blueprint(retrieval.bp)
 
 
 # __all__ = ["auth", "knowledgebase", "settings"]
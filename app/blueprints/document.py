@@ -12,7 +12,12 @@ import os
 import logging
 
 # 从工具模块导入通用的响应和错误处理函数
-from app.blueprints.utils import success_response, error_response, handle_api_error
+from app.blueprints.utils import (
+    success_response,
+    error_response,
+    handle_api_error,
+    get_pagination_params,
+)
 
 # 导入文档服务，用于处理文档业务逻辑
 from app.services.document_service import document_service
@@ -23,6 +28,9 @@ from app.utils.auth import login_required
 
 # 导入知识库服务
 from app.services.knowledgebase_service import kb_service
+
+# 导入分块存储服务
+from app.services.chunk_service import chunk_service
 from app.models.document import Document as DocumentModel
 
 # 设置日志对象
@@ -65,12 +73,8 @@ def api_upload(kb_id):
             400,
         )
 
-    # 读取上传的文件内容
-    file_data = file.read()
-    print(f"Config.MAX_FILE_SIZE:{type(Config.MAX_FILE_SIZE)}")
-    print(f"len(file_data):{len(file_data)}")
-    # 检查文件大小是否超过上限
-    if len(file_data) > Config.MAX_FILE_SIZE:
+    # 如果客户端声明了文件大小，提前拒绝超过上限的文件
+    if file.content_length and file.content_length > Config.MAX_FILE_SIZE:
         return error_response(
             f"File size exceeds maximum {Config.MAX_FILE_SIZE} bytes", 400
         )
@@ -98,8 +102,8 @@ def api_upload(kb_id):
     if "." not in filename:
         return error_response("Filename must have an extension", 400)
 
-    # 调用文档服务上传，返回文档信息字典
-    doc_dict = document_service.upload(kb_id, file_data, filename)
+    # 调用文档服务上传，直接传入上传文件的流，大小和哈希在写入存储时计算
+    doc_dict = document_service.upload(kb_id, file.stream, filename)
     # 返回成功响应及新文档信息
     return success_response(doc_dict)
 
@@ -113,9 +117,9 @@ def api_process(doc_id):
     """处理文档"""
     try:
         # 调用文档服务方法，提交文档处理任务（异步）
-        document_service.process(doc_id)
+        job = document_service.process(doc_id)
         # 返回成功响应信息，提示任务已提交
-        return success_response({"message": "文档处理任务已提交"})
+        return success_response({"message": "文档处理任务已提交", "job_id": job["id"]})
     except ValueError as e:
         # 捕获业务异常（如找不到文档），返回404和错误信息
         return error_response(str(e), 404)
@@ -126,6 +130,70 @@ def api_process(doc_id):
         return error_response(f"处理文档失败: {str(e)}", 500)
 
 
+# 定义批量上传文档的 API 路由，POST 方法
+@bp.route("/api/v1/knowledgebases/<kb_id>/documents/batch", methods=["POST"])
+# 使用装饰器统一捕获和处理 API 错误
+@handle_api_error
+def api_upload_batch(kb_id):
+    """批量上传文档，支持多个文件和 zip 压缩包"""
+    # 获取所有上传的文件
+    files = [f for f in request.files.getlist("files") if f.filename]
+    if not files:
+        return error_response("No file selected", 400)
+
+    # 是否上传后立即处理，默认处理
+    process = request.form.get("process", "true").lower() != "false"
+
+    # 把普通文件和 zip 压缩包展开成 (文件名, 文件数据) 的生成器
+    def iter_files():
+        for file in files:
+            if file.filename.lower().endswith(".zip"):
+                yield from document_service.iter_zip_files(file.stream)
+            else:
+                yield file.filename, file.read(Config.MAX_FILE_SIZE + 1)
+
+    # 限制单次批量上传的文件数量
+    def limited(items):
+        for index, item in enumerate(items):
+            if index >= Config.MAX_BATCH_FILES:
+                raise ValueError(f"单次批量上传最多 {Config.MAX_BATCH_FILES} 个文件")
+            yield item
+
+    try:
+        result = document_service.upload_batch(
+            kb_id, limited(iter_files()), process=process
+        )
+    except ValueError as e:
+        return error_response(str(e), 400)
+    return success_response(result)
+
+
+# 定义批量提交文档处理任务的 API 路由
+@bp.route("/api/v1/knowledgebases/<kb_id>/documents/process", methods=["POST"])
+# 使用装饰器统一捕获和处理 API 错误
+@handle_api_error
+def api_process_batch(kb_id):
+    """批量处理文档，未指定 doc_ids 时处理所有待处理文档"""
+    data = request.get_json(silent=True) or {}
+    doc_ids = data.get("doc_ids")
+    if doc_ids is not None and not isinstance(doc_ids, list):
+        return error_response("doc_ids must be a list", 400)
+    result = document_service.process_batch(kb_id, doc_ids)
+    return success_response(result)
+
+
+# 定义查询批次进度的 API 路由
+@bp.route("/api/v1/batches/<batch_id>", methods=["GET"])
+# 使用装饰器统一捕获和处理 API 错误
+@handle_api_error
+def api_batch_progress(batch_id):
+    """查询批次处理进度"""
+    progress = document_service.batch_progress(batch_id)
+    if progress is None:
+        return error_response("批次不存在", 404)
+    return success_response(progress)
+
+
 # 路由：文档分块列表页面，URL中包含doc_id
 @bp.route("/documents/<doc_id>/chunks")
 # 需要用户登录
@@ -145,53 +213,70 @@ def document_chunks(doc_id):
     if not kb:
         flash("知识库不存在", "error")
         return redirect(url_for("knowledgebase.kb_list"))
+    # 获取分页参数
+    page, page_size = get_pagination_params(max_page_size=200)
     # 获取分块数据
     try:
-        # 动态导入向量数据库服务工厂方法
-        from app.services.vectordb.factory import get_vector_db_service
-
-        # 组合向量数据库中的 collection 名称
-        collection_name = f"kb_{doc.kb_id}"
-        # 获取向量数据库服务实例
-        vectordb = get_vector_db_service()
-        # 构建过滤条件，只获取当前文档的分块
-        filter_dict = {"doc_id": doc_id}
-        # 通过similarity_search_with_score方法，检索所有属于该文档的分块
-        results = vectordb.similarity_search_with_score(
-            collection_name=collection_name,
-            query="",  # 用空格作为查询内容，目的是获取所有分块
-            k=1000,  # 设置很大的k值来避免遗漏分块
-            filter=filter_dict,  # 应用文档ID过滤
+        # 从分块表中按分块序号分页读取，走 (doc_id, chunk_index) 索引
+        rows = chunk_service.list_by_document(
+            doc_id, offset=(page - 1) * page_size, limit=page_size
         )
-        print(f"vector_service查询到的结果:{len(results)}")
-        # 提取查询结果中的Document对象，准备排序
-        chunks = [doc for doc, _ in results]
-        # 按chunk_index进行排序，保证顺序和原始文档一致
-        chunks.sort(key=lambda d: d.metadata.get("chunk_index", 0))
-        # 初始化分块列表
-        chunks_data = []
-        # 遍历所有分块对象，整理为前端模板使用的字典格式
-        for chunk in chunks:
-            chunks_data.append(
+        chunks_data = [
+            {
+                # 分块ID
+                "id": row["id"],
+                # 分块文本内容
+                "content": row["content"],
+                # 分块在文档中的序号
+                "chunk_index": row["chunk_index"],
+                # 分块的位置信息
+                "metadata": {
+                    "page": row["page"],
+                    "start_offset": row["start_offset"],
+                    "end_offset": row["end_offset"],
+                },
+            }
+            for row in rows
+        ]
+        # 分块表上线之前处理的文档没有分块记录，从向量库中读取；
+        # 页码超出范围时当前页同样为空，只有文档完全没有分块记录时才回退
+        if not chunks_data and doc.chunk_count and not chunk_service.has_chunks(doc_id):
+            # 动态导入向量数据库服务工厂方法
+            from app.services.vectordb.factory import get_vector_db_service
+
+            chunks = get_vector_db_service().list_chunks(
+                collection_name=f"kb_{doc.kb_id}",
+                doc_id=doc_id,
+                offset=(page - 1) * page_size,
+                limit=page_size,
+            )
+            chunks_data = [
                 {
-                    # 分块ID，如果不存在则尝试兼容chunk_id字段
                     "id": chunk.metadata.get("id")
                     or chunk.metadata.get("chunk_id", ""),
-                    # 分块文本内容
                     "content": chunk.page_content,
-                    # 分块在文档中的序号
                     "chunk_index": chunk.metadata.get("chunk_index", 0),
-                    # 分块的原始元数据
                     "metadata": chunk.metadata,
                 }
-            )
+                for chunk in chunks
+            ]
     # 捕获异常，如果出错则记录日志，并展示空分块列表
     except Exception as e:
         logger.error(f"获取分块数据失败: {e}")
         chunks_data = []
+    # 分页信息，总数取文档记录中的分块数
+    pagination = {
+        "page": page,
+        "page_size": page_size,
+        "total": doc.chunk_count or 0,
+    }
     # 渲染模板，传递知识库、文档及分块列表数据给页面
     return render_template(
-        "document_chunks.html", kb=kb, document=doc.to_dict(), chunks=chunks_data
+        "document_chunks.html",
+        kb=kb,
+        document=doc.to_dict(),
+        chunks=chunks_data,
+        pagination=pagination,
     )
 
 
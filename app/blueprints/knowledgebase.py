@@ -20,13 +20,21 @@ from app.blueprints.utils import (
     get_pagination_params,
     get_current_user_or_error,
     check_ownership,
+    require_json_body,
 )
 from app.utils.auth import get_current_user, login_required, api_login_required
 from app.services.storage_service import storage_service
+from app.services.vector_service import vector_service
 
 # 导入文档服务
 from app.services.document_service import document_service
 
+# 导入关键词检索服务
+from app.services.keyword_service import keyword_service
+
+# 导入检索结果缓存失效函数
+from app.utils.query_cache import invalidate_kb
+
 logger = get_logger(__name__)
 
 bp = Blueprint("knowledgebase", __name__)
@@ -43,6 +51,8 @@ def api_create():
     description = request.form.get("description")
     chunk_size = request.form.get("chunk_size", 512)
     chunk_overlap = request.form.get("chunk_overlap", 50)
+    # 向量存储精度，只能在创建时设置
+    vector_precision = request.form.get("vector_precision") or None
     cover_image_data = None
     cover_image_filename = None
     # 判断请求传过来的请求文件中是否有cover_image
@@ -64,6 +74,7 @@ def api_create():
         chunk_overlap=chunk_overlap,
         cover_image_data=cover_image_data,
         cover_image_filename=cover_image_filename,
+        vector_precision=vector_precision,
     )
     return success_response(kb_dict)
 
@@ -93,6 +104,8 @@ def kb_list():
         search=search,
         sort_by=sort_by,
         sort_order=sort_order,
+        # 当前向量库后端支持的存储精度
+        vector_precisions=vector_service.SUPPORTED_PRECISIONS,
     )
 
 
@@ -118,6 +131,112 @@ def api_delete(kb_id):
     return success_response()
 
 
+@bp.route("/api/v1/kb/<kb_id>/warm-up", methods=["POST"])
+@api_login_required
+@handle_api_error
+def api_warm_up(kb_id):
+    current_user, error = get_current_user_or_error()
+    if error:
+        return error
+    kb_dict = kb_service.get_by_id(kb_id)
+    if not kb_dict:
+        return error_response("知识库未找到", 404)
+    has_permission, err = check_ownership(
+        kb_dict["user_id"], current_user["id"], "knowledgebase"
+    )
+    if not has_permission:
+        return err
+    kb_service.warm_up([kb_id])
+    return success_response()
+
+
+@bp.route("/api/v1/kb/<kb_id>/keyword-index/rebuild", methods=["POST"])
+@api_login_required
+@handle_api_error
+def api_rebuild_keyword_index(kb_id):
+    current_user, error = get_current_user_or_error()
+    if error:
+        return error
+    kb_dict = kb_service.get_by_id(kb_id)
+    if not kb_dict:
+        return error_response("知识库未找到", 404)
+    has_permission, err = check_ownership(
+        kb_dict["user_id"], current_user["id"], "knowledgebase"
+    )
+    if not has_permission:
+        return err
+    # 根据分块表重建关键词索引，并使检索缓存失效
+    doc_count = keyword_service.rebuild(kb_id)
+    invalidate_kb(kb_id)
+    return success_response({"doc_count": doc_count})
+
+
+@bp.route("/api/v1/kb/<kb_id>/search-params", methods=["PUT"])
+@api_login_required
+@handle_api_error
+def api_update_search_params(kb_id):
+    current_user, error = get_current_user_or_error()
+    if error:
+        return error
+    kb_dict = kb_service.get_by_id(kb_id)
+    if not kb_dict:
+        return error_response("知识库未找到", 404)
+    has_permission, err = check_ownership(
+        kb_dict["user_id"], current_user["id"], "knowledgebase"
+    )
+    if not has_permission:
+        return err
+    data, err = require_json_body()
+    if err:
+        return err
+    # 请求体即检索参数，如 {"nprobe": 32}，取值为 null 的参数使用系统设置
+    updated_kb = kb_service.update_search_params(kb_id, data)
+    return success_response(updated_kb, "更新检索参数成功")
+
+
+@bp.route("/api/v1/kb/<kb_id>/index-config", methods=["PUT"])
+@api_login_required
+@handle_api_error
+def api_update_index_config(kb_id):
+    current_user, error = get_current_user_or_error()
+    if error:
+        return error
+    kb_dict = kb_service.get_by_id(kb_id)
+    if not kb_dict:
+        return error_response("知识库未找到", 404)
+    has_permission, err = check_ownership(
+        kb_dict["user_id"], current_user["id"], "knowledgebase"
+    )
+    if not has_permission:
+        return err
+    data, err = require_json_body()
+    if err:
+        return err
+    # 如 {"index_type": "HNSW", "index_params": {"M": 16, "efConstruction": 200}}
+    updated_kb = kb_service.update_index_config(kb_id, data)
+    return success_response(updated_kb, "更新索引配置成功，重建向量索引后生效")
+
+
+@bp.route("/api/v1/kb/<kb_id>/vector-index/rebuild", methods=["POST"])
+@api_login_required
+@handle_api_error
+def api_rebuild_vector_index(kb_id):
+    current_user, error = get_current_user_or_error()
+    if error:
+        return error
+    kb_dict = kb_service.get_by_id(kb_id)
+    if not kb_dict:
+        return error_response("知识库未找到", 404)
+    has_permission, err = check_ownership(
+        kb_dict["user_id"], current_user["id"], "knowledgebase"
+    )
+    if not has_permission:
+        return err
+    # 按当前的索引配置原地重建，数据保留
+    kb_service.rebuild_vector_index(kb_id)
+    return success_response()
+
+
 @bp.route("/api/v1/kb/<kb_id>", methods=["PUT"])
 @api_login_required
 @handle_api_error
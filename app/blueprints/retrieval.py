@@ -0,0 +1,65 @@
+"""
+检索相关路由（API）
+"""
+
+from flask import Blueprint
+from app.utils.logger import get_logger
+from app.utils.auth import api_login_required
+from app.blueprints.utils import (
+    success_response,
+    error_response,
+    handle_api_error,
+    get_current_user_or_error,
+    check_ownership,
+    require_json_body,
+)
+from app.services.knowledgebase_service import kb_service
+from app.services.retrieval_service import retrieval_service
+
+logger = get_logger(__name__)
+
+bp = Blueprint("retrieval", __name__)
+
+
+@bp.route("/api/v1/knowledgebases/<kb_id>/retrieve", methods=["POST"])
+@api_login_required
+@handle_api_error
+def api_retrieve(kb_id):
+    """在知识库中检索，返回结果和各阶段耗时"""
+    current_user, error = get_current_user_or_error()
+    if error:
+        return error
+    kb_dict = kb_service.get_by_id(kb_id)
+    if not kb_dict:
+        return error_response("知识库未找到", 404)
+    has_permission, err = check_ownership(
+        kb_dict["user_id"], current_user["id"], "knowledgebase"
+    )
+    if not has_permission:
+        return err
+    data, err = require_json_body()
+    if err:
+        return err
+    query = (data.get("query") or "").strip()
+    if not query:
+        return error_response("query is required", 400)
+    result = retrieval_service.retrieve(
+        kb_id,
+        query,
+        mode=data.get("mode"),
+        top_k=data.get("top_k"),
+        vector_threshold=data.get("vector_threshold"),
+        keyword_threshold=data.get("keyword_threshold"),
+        vector_weight=data.get("vector_weight"),
+        fusion=data.get("fusion"),
+        filter={"doc_id": data["doc_ids"]} if data.get("doc_ids") else None,
+    )
+    return success_response(result)
+
+
+@bp.route("/api/v1/retrieval/cache/stats", methods=["GET"])
+@api_login_required
+@handle_api_error
+def api_cache_stats():
+    """检索结果缓存的命中率等统计信息"""
+    return success_response(retrieval_service.cache_stats())
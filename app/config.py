@@ -17,6 +17,8 @@ class Config:
     APP_DEBUG = os.environ.get("APP_DEBUG", "true").lower() == "true"
     # 上传的文件的最大文件大小
     MAX_FILE_SIZE = int(os.environ.get("MAX_FILE_SIZE", 104857600))  # 100M
+    # 单次批量上传的最大文件数
+    MAX_BATCH_FILES = int(os.environ.get("MAX_BATCH_FILES", 5000))
     # 允许 上传的文件
     ALLOWED_EXTENSIONS = {"pdf", "docx", "txt", "md"}
     # 允许 上传的图片的扩展名
@@ -58,15 +60,145 @@ class Config:
     MINIO_SECURE = os.environ.get("MINIO_SECURE", "false").lower() == "true"
     MINIO_REGION = os.environ.get("MINIO_REGION", None)
 
+    # Embedding 配置
+    # 本地 Embedding 模型运行的设备 cpu / cuda / mps
+    EMBEDDING_DEVICE = os.environ.get("EMBEDDING_DEVICE", "cpu")
+    # 是否启用分块向量的持久化缓存
+    EMBEDDING_CACHE_ENABLED = (
+        os.environ.get("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    )
+    # 向量缓存文件路径，为空时使用 STORAGE_DIR/cache/embedding_cache.db
+    EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "")
+    # 向量缓存的最大条目数
+    EMBEDDING_CACHE_MAX_ENTRIES = int(
+        os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 500000)
+    )
+    # 查询向量内存 LRU 缓存的最大条目数，0 表示不缓存查询向量
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", 2048))
+    # 是否通过向量缓存文件在多个进程之间共享查询向量
+    QUERY_EMBEDDING_CACHE_SHARED = (
+        os.environ.get("QUERY_EMBEDDING_CACHE_SHARED", "false").lower() == "true"
+    )
+
+    # 向量化时每批最多的分块数
+    EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 64))
+    # 向量化时每批最多的字符数
+    EMBED_BATCH_MAX_CHARS = int(os.environ.get("EMBED_BATCH_MAX_CHARS", 32000))
+    # 流式处理时，每次缓冲多少个批次的分块用于按长度排序
+    EMBED_BATCH_WINDOW = int(os.environ.get("EMBED_BATCH_WINDOW", 4))
+    # 文档处理流水线中向量化阶段的线程数
+    PIPELINE_EMBED_WORKERS = int(os.environ.get("PIPELINE_EMBED_WORKERS", 2))
+    # 文档处理流水线中写入向量库阶段的线程数
+    PIPELINE_UPSERT_WORKERS = int(os.environ.get("PIPELINE_UPSERT_WORKERS", 1))
+    # 文档处理流水线各阶段之间队列的容量（以批次计）
+    PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 2))
+
+    # 文档处理任务队列配置
+    # 是否在 Web 进程内启动文档处理工作线程
+    INGESTION_WORKERS_ENABLED = (
+        os.environ.get("INGESTION_WORKERS_ENABLED", "true").lower() == "true"
+    )
+    # 文档处理方式 thread(在工作线程中处理) process(在子进程中处理，绕开 GIL，适合多核 CPU)
+    # 注意：Chroma 的本地持久化目录不支持多进程同时写入，process 模式建议配合 Milvus 使用
+    INGESTION_WORKER_MODE = os.environ.get("INGESTION_WORKER_MODE", "thread")
+    # 文档处理工作线程数（process 模式下同时也是子进程数）
+    INGESTION_WORKERS = int(os.environ.get("INGESTION_WORKERS", 4))
+    # 每个知识库同时执行的最大任务数
+    KB_MAX_CONCURRENT_JOBS = int(os.environ.get("KB_MAX_CONCURRENT_JOBS", 2))
+    # 任务最大执行次数（含首次）
+    JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+    # 失败重试的基础退避时间（秒），按 2 的指数增长
+    JOB_RETRY_BACKOFF_SECONDS = int(os.environ.get("JOB_RETRY_BACKOFF_SECONDS", 30))
+    # 没有任务时的轮询间隔（秒）
+    JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 2))
+    # 每次领取任务时锁定的候选任务数
+    JOB_CLAIM_BATCH_SIZE = int(os.environ.get("JOB_CLAIM_BATCH_SIZE", 20))
+    # 执行中任务的租约时间（秒），超过该时间没有心跳视为中断
+    JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", 300))
+    # 执行中任务的心跳间隔（秒）
+    JOB_HEARTBEAT_SECONDS = int(os.environ.get("JOB_HEARTBEAT_SECONDS", 30))
+    # 连续空闲多少轮后回收一次中断的任务
+    JOB_RECOVER_EVERY_IDLE_ROUNDS = int(
+        os.environ.get("JOB_RECOVER_EVERY_IDLE_ROUNDS", 30)
+    )
+
     DEEPSEEK_CHAT_MODEL = os.environ.get("DEEPSEEK_CHAT_MODEL", "deepseek-chat")
     DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY")
     DEEPSEEK_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 
     # 指定向量数据库的类型
-    VECTOR_DB_TYPE = os.environ.get("VECTOR_DB_TYPE", "milvus")  # chroma 或 milvus
+    VECTOR_DB_TYPE = os.environ.get("VECTOR_DB_TYPE", "milvus")  # chroma、milvus 或 numpy
 
     # 指定 chroma向量数据库的本地存储目录
     CHROMA_PERSIST_DIRECTORY = os.environ.get("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
 
     MILVUS_HOST = os.environ.get("MILVUS_HOST", "localhost")
     MILVUS_PORT = os.environ.get("MILVUS_PORT", "19530")
+    # Milvus 分区方式：none 不分区；partition_key 以 doc_id 为分区键把文档哈希到固定数量的
+    # 分区（只在创建集合时生效）；document 每个文档一个分区，删除文档即删除分区
+    MILVUS_PARTITION_MODE = os.environ.get("MILVUS_PARTITION_MODE", "none")
+    # partition_key 方式下的分区数
+    MILVUS_NUM_PARTITIONS = int(os.environ.get("MILVUS_NUM_PARTITIONS", 64))
+
+    # 嵌入式 numpy 向量库的存储目录，为空时使用 STORAGE_DIR/vector_index
+    NUMPY_VECTOR_DIR = os.environ.get("NUMPY_VECTOR_DIR", "")
+    # 嵌入式 numpy 向量库新建集合的度量类型 cosine / ip / l2
+    NUMPY_VECTOR_METRIC = os.environ.get("NUMPY_VECTOR_METRIC", "cosine")
+    # 嵌入式 numpy 向量库新建集合的默认存储精度 float32 / float16 / int8 / pq，知识库可单独设置
+    NUMPY_VECTOR_DTYPE = os.environ.get("NUMPY_VECTOR_DTYPE", "float32")
+    # 集合的段数超过该值时在后台合并
+    NUMPY_VECTOR_MAX_SEGMENTS = int(os.environ.get("NUMPY_VECTOR_MAX_SEGMENTS", 16))
+    # 每次合并的最小段数
+    NUMPY_VECTOR_MERGE_FACTOR = int(os.environ.get("NUMPY_VECTOR_MERGE_FACTOR", 4))
+    # 段的已删除比例超过该值时重写
+    NUMPY_VECTOR_COMPACT_DEAD_RATIO = float(
+        os.environ.get("NUMPY_VECTOR_COMPACT_DEAD_RATIO", 0.3)
+    )
+    # 集合的存活分块数达到该值时训练 IVF 近似索引，0 表示始终精确检索
+    NUMPY_VECTOR_IVF_MIN_ROWS = int(os.environ.get("NUMPY_VECTOR_IVF_MIN_ROWS", 50000))
+    # IVF 倒排列表数，0 表示按 4 * sqrt(分块数) 自动选择
+    NUMPY_VECTOR_IVF_NLIST = int(os.environ.get("NUMPY_VECTOR_IVF_NLIST", 0))
+    # 检索时默认扫描的倒排列表数，可在系统设置和知识库中覆盖
+    NUMPY_VECTOR_NPROBE = int(os.environ.get("NUMPY_VECTOR_NPROBE", 16))
+    # pq 的子空间数，0 表示 维度 / 4
+    NUMPY_VECTOR_PQ_M = int(os.environ.get("NUMPY_VECTOR_PQ_M", 0))
+    # int8 / pq 存储时先取 k * 该值个候选，再用全精度向量重排，0 表示不重排
+    NUMPY_VECTOR_RERANK_FACTOR = int(os.environ.get("NUMPY_VECTOR_RERANK_FACTOR", 4))
+
+    # 向量库集合句柄缓存的最大数量
+    VECTOR_HANDLE_CACHE_SIZE = int(os.environ.get("VECTOR_HANDLE_CACHE_SIZE", 64))
+    # 集合句柄空闲多久（秒）后被淘汰
+    VECTOR_HANDLE_IDLE_SECONDS = int(os.environ.get("VECTOR_HANDLE_IDLE_SECONDS", 600))
+
+    # 关键词（BM25）索引目录，为空时使用 STORAGE_DIR/keyword_index
+    KEYWORD_INDEX_DIR = os.environ.get("KEYWORD_INDEX_DIR", "")
+    # BM25 词频饱和参数
+    BM25_K1 = float(os.environ.get("BM25_K1", 1.5))
+    # BM25 文档长度归一化参数
+    BM25_B = float(os.environ.get("BM25_B", 0.75))
+    # 关键词索引段数超过该值时合并
+    KEYWORD_MAX_SEGMENTS = int(os.environ.get("KEYWORD_MAX_SEGMENTS", 8))
+    # 关键词索引中已删除分块比例超过该值时合并
+    KEYWORD_COMPACT_DEAD_RATIO = float(
+        os.environ.get("KEYWORD_COMPACT_DEAD_RATIO", 0.3)
+    )
+
+    # 检索线程池大小（向量检索和关键词检索并发执行）
+    RETRIEVAL_WORKERS = int(os.environ.get("RETRIEVAL_WORKERS", 8))
+    # 混合检索时每一路取 top_k 的多少倍作为候选
+    RETRIEVAL_CANDIDATE_MULTIPLIER = int(
+        os.environ.get("RETRIEVAL_CANDIDATE_MULTIPLIER", 3)
+    )
+    # 混合检索的融合方式 weighted(加权求和) 或 rrf(倒数排名融合)
+    RETRIEVAL_FUSION = os.environ.get("RETRIEVAL_FUSION", "weighted")
+    # 倒数排名融合的平滑常数
+    RRF_K = int(os.environ.get("RRF_K", 60))
+
+    # 是否启用检索结果缓存
+    QUERY_CACHE_ENABLED = os.environ.get("QUERY_CACHE_ENABLED", "true").lower() == "true"
+    # 检索结果缓存的最大条目数
+    QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", 1024))
+    # 检索结果缓存的存活秒数
+    QUERY_CACHE_TTL = int(os.environ.get("QUERY_CACHE_TTL", 300))
+    # 知识库缓存代数文件路径，为空时使用 STORAGE_DIR/cache/kb_generation.db
+    QUERY_CACHE_GENERATION_PATH = os.environ.get("QUERY_CACHE_GENERATION_PATH", "")
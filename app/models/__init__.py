@@ -3,5 +3,16 @@ from app.models.user import User
 from app.models.knowledgebase import Knowledgebase
 from app.models.settings import Settings
 from app.models.document import Document
+from app.models.ingestion_job import IngestionJob
+from app.models.document_chunk import DocumentChunk
 
-__all__ = ["Base", "BaseModel", "User", "Knowledgebase", "Settings", "Document"]
+__all__ = [
+    "Base",
+    "BaseModel",
+    "User",
+    "Knowledgebase",
+    "Settings",
+    "Document",
+    "IngestionJob",
+    "DocumentChunk",
+]
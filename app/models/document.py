@@ -25,6 +25,8 @@ class Document(BaseModel):
     file_type = Column(String(32), nullable=False)
     # 文件大小
     file_size = Column(BigInteger, nullable=False)
+    # 文件内容的 sha256 哈希，上传时边读边计算
+    file_hash = Column(String(64), nullable=True, index=True)
     # 文档状态 刚开始的是pending 等待处理
     status = Column(String(32), nullable=False)
     # 文件分块数量
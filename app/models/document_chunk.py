@@ -0,0 +1,46 @@
+from sqlalchemy import (
+    Column,
+    String,
+    DateTime,
+    Integer,
+    Text,
+    ForeignKey,
+    UniqueConstraint,
+)
+from sqlalchemy.sql import func
+from app.models.base import BaseModel
+
+
+class DocumentChunk(BaseModel):
+    # 指定数据库表名为document_chunk
+    __tablename__ = "document_chunk"
+    # 指定__repr__显示的字段
+    __repr_fields__ = ["id", "doc_id", "chunk_index"]
+    # 同一文档内分块序号唯一，同时用于按文档有序分页
+    __table_args__ = (
+        UniqueConstraint("doc_id", "chunk_index", name="uq_chunk_doc_index"),
+    )
+    # 分块ID，与向量库中的ID一致，格式为 {doc_id}_{内容哈希前16位}[_{序号}]
+    id = Column(String(64), primary_key=True)
+    # 文档的主键，删除文档时级联删除分块
+    doc_id = Column(
+        String(32),
+        ForeignKey("document.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    # 知识库的主键，用于按知识库重建关键词索引
+    kb_id = Column(String(32), nullable=False, index=True)
+    # 分块在文档中的序号，处理过程中暂存的分块为 -(序号 + 1)，替换完成前对读取不可见
+    chunk_index = Column(Integer, nullable=False)
+    # 分块所在的页码（PDF 等分页文档），没有页码时为空
+    page = Column(Integer, nullable=True)
+    # 分块在所在页文本中的起始和结束字符偏移
+    start_offset = Column(Integer, nullable=True)
+    end_offset = Column(Integer, nullable=True)
+    # 分块文本的 sha256 哈希
+    text_hash = Column(String(64), nullable=False)
+    # 分块文本
+    content = Column(Text, nullable=False)
+    # 创建时间 默认为当前时间
+    created_at = Column(DateTime, default=func.now())
@@ -0,0 +1,56 @@
+from sqlalchemy import (
+    Column,
+    String,
+    DateTime,
+    Integer,
+    Text,
+    ForeignKey,
+    BigInteger,
+    Index,
+)
+from sqlalchemy.sql import func
+import uuid
+from app.models.base import BaseModel
+
+
+class IngestionJob(BaseModel):
+    # 指定数据库表名为ingestion_job
+    __tablename__ = "ingestion_job"
+    # 指定__repr__显示的字段
+    __repr_fields__ = ["id", "doc_id", "status"]
+    # 复合索引，用于工作线程按状态、优先级和可执行时间领取任务
+    __table_args__ = (
+        Index("idx_job_claim", "status", "priority", "next_run_at"),
+    )
+    id = Column(String(32), primary_key=True, default=lambda: uuid.uuid4().hex[:32])
+    # 文档的主键，删除文档时级联删除任务
+    doc_id = Column(
+        String(32),
+        ForeignKey("document.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    # 知识库的主键，用于限制每个知识库的并发数
+    kb_id = Column(String(32), nullable=False, index=True)
+    # 批次ID，批量提交的任务共享同一个批次，用于汇总进度
+    batch_id = Column(String(32), nullable=True, index=True)
+    # 任务状态 queued 排队中 running 执行中 succeeded 成功 failed 失败
+    status = Column(String(32), nullable=False, default="queued")
+    # 优先级，数值越小越先执行（默认使用文件大小，小文件优先）
+    priority = Column(BigInteger, nullable=False, default=0)
+    # 已执行次数
+    attempts = Column(Integer, nullable=False, default=0)
+    # 最大执行次数
+    max_attempts = Column(Integer, nullable=False, default=3)
+    # 最早可执行时间，重试时按退避时间推后
+    next_run_at = Column(DateTime, nullable=False)
+    # 领取任务的工作线程标识
+    locked_by = Column(String(128), nullable=True)
+    # 领取任务（或最近一次心跳）的时间，超过租约时间未更新视为中断
+    locked_at = Column(DateTime, nullable=True)
+    # 最近一次失败的错误信息
+    error_message = Column(Text, nullable=True)
+    # 创建时间 默认为当前时间 创建索引
+    created_at = Column(DateTime, default=func.now(), index=True)
+    # 更新时间 默认为当前时间，在数据更新的自动更新为当前最新的时间
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
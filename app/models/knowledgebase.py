@@ -4,6 +4,7 @@ from sqlalchemy import (
     DateTime,
     Integer,
     Text,
+    JSON,
     ForeignKey,
     UniqueConstraint,
 )
@@ -45,6 +46,16 @@ class Knowledgebase(BaseModel):
     chunk_size = Column(Integer, nullable=False, comment="分块大小")
     # 分块重叠大小
     chunk_overlap = Column(Integer, nullable=False, comment="分块重叠大小")
+    # 向量存储精度 float32 / float16 / int8 / pq，为空时使用向量库的默认值，只在创建集合时生效
+    vector_precision = Column(String(16), nullable=True, comment="向量存储精度")
+    # 向量度量类型 L2 / IP / COSINE，为空时使用向量库的默认值，只在创建集合时生效
+    metric_type = Column(String(16), nullable=True, comment="向量度量类型")
+    # Milvus 索引类型，如 HNSW / IVF_FLAT，为空时按存储精度选择
+    index_type = Column(String(32), nullable=True, comment="向量索引类型")
+    # 索引构建参数，如 {"M": 16, "efConstruction": 200} 或 {"nlist": 1024}
+    index_params = Column(JSON, nullable=True, comment="向量索引构建参数")
+    # 向量检索参数，如 {"nprobe": 32, "ef": 128}，覆盖系统设置中的默认值
+    search_params = Column(JSON, nullable=True, comment="向量检索参数")
     # 创建时间 默认为当前时间 创建索引
     created_at = Column(DateTime, default=func.now(), index=True)
     # 更新时间 默认为当前时间，在数据更新的自动更新为当前最新的时间
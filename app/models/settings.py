@@ -64,6 +64,13 @@ class Settings(BaseModel):
     )
     # 结果数量 ，可为空，默认值为5
     top_k = Column(Integer, nullable=True, default=5, comment="返回结果的数量")
+    # 近似向量索引的检索参数，知识库可以单独覆盖
+    # IVF 检索时扫描的倒排列表数，越大召回率越高、越慢
+    vector_nprobe = Column(
+        Integer, nullable=True, default=16, comment="IVF 检索扫描的倒排列表数"
+    )
+    # HNSW 检索时的候选队列长度，越大召回率越高、越慢
+    vector_ef = Column(Integer, nullable=True, default=64, comment="HNSW 检索的 ef")
     # 创建时间 默认为当前时间 创建索引
     created_at = Column(DateTime, default=func.now(), index=True)
     # 更新时间 默认为当前时间，在数据更新的自动更新为当前最新的时间
@@ -0,0 +1,299 @@
+"""
+分块存储服务
+文档处理时把分块文本和位置写入关系库，分块查看、关键词索引重建等不需要向量的读取
+直接按索引查询该表，不再从向量库中读取文本，也不需要重新下载和解析原始文件
+"""
+
+# 导入hashlib模块，用于计算分块文本哈希
+import hashlib
+
+# 导入类型提示
+from typing import Container, Dict, Iterable, Iterator, List, Tuple
+
+# 导入 LangChain 的 Document 类型
+from langchain_core.documents import Document
+
+# 导入BaseService基类
+from app.services.base_service import BaseService
+
+# 导入分块模型
+from app.models.document_chunk import DocumentChunk
+
+# 导入Document模型，重命名为DocumentModel
+from app.models.document import Document as DocumentModel
+
+# 每次批量写入的分块数
+CHUNK_BATCH_SIZE = 1000
+
+
+# 定义分块存储服务类
+class ChunkService(BaseService[DocumentChunk]):
+    """分块存储服务"""
+
+    # 暂存分块的序号：-(序号 + 1)，读取时只返回序号非负的分块
+    @staticmethod
+    def _staged_index(chunk_index: int) -> int:
+        return -chunk_index - 1
+
+    # 分块的位置信息
+    @staticmethod
+    def _position(chunk: dict) -> dict:
+        start = chunk["metadata"].get("start_index")
+        return {
+            "page": chunk["metadata"].get("page"),
+            "start_offset": start,
+            "end_offset": start + len(chunk["text"]) if start is not None else None,
+        }
+
+    # 删除上次处理失败时留下的暂存分块
+    def discard_staged(self, doc_id: str) -> int:
+        """
+        删除文档的暂存分块（处理中途失败时留下），返回删除的分块数
+
+        参数:
+            doc_id: 文档ID
+        """
+        with self.transaction() as session:
+            return (
+                session.query(DocumentChunk)
+                .filter(DocumentChunk.doc_id == doc_id, DocumentChunk.chunk_index < 0)
+                .delete(synchronize_session=False)
+            )
+
+    # 在分块流经时分批写入暂存分块
+    def iter_stage(
+        self,
+        kb_id: str,
+        doc_id: str,
+        chunks: Iterable[dict],
+        old_ids: Container[str],
+        retained: List[dict],
+    ) -> Iterator[dict]:
+        """
+        原样产出分块字典，同时把新分块按 CHUNK_BATCH_SIZE 分批写入分块表；
+        新分块以暂存序号写入，在 commit_document 之前对读取不可见，也不会与旧分块的
+        (doc_id, chunk_index) 冲突。已在分块表中的分块只记录新的序号和位置（不含文本），
+        由 commit_document 统一更新
+
+        参数:
+            kb_id: 知识库ID
+            doc_id: 文档ID
+            chunks: 分块字典，包含 id, text, chunk_index, metadata（TextSplitter 的输出）
+            old_ids: 分块表中该文档已有的分块ID
+            retained: 用于收集已有分块的新序号和位置
+        """
+        rows = []
+        for chunk in chunks:
+            staged_index = self._staged_index(chunk["chunk_index"])
+            if chunk["id"] in old_ids:
+                retained.append(
+                    {"id": chunk["id"], "chunk_index": staged_index, **self._position(chunk)}
+                )
+            else:
+                rows.append(
+                    {
+                        "id": chunk["id"],
+                        "doc_id": doc_id,
+                        "kb_id": kb_id,
+                        "chunk_index": staged_index,
+                        **self._position(chunk),
+                        "text_hash": hashlib.sha256(
+                            chunk["text"].encode("utf-8")
+                        ).hexdigest(),
+                        "content": chunk["text"],
+                    }
+                )
+                if len(rows) >= CHUNK_BATCH_SIZE:
+                    self._insert(rows)
+                    rows = []
+            yield chunk
+        if rows:
+            self._insert(rows)
+
+    # 在独立的事务中写入一批分块
+    def _insert(self, rows: List[dict]) -> None:
+        with self.transaction() as session:
+            session.bulk_insert_mappings(DocumentChunk, rows)
+
+    # 用暂存的分块原子地替换文档的旧分块
+    def commit_document(
+        self, doc_id: str, stale_ids: Iterable[str], retained: List[dict]
+    ) -> None:
+        """
+        在一个事务中删除消失的分块、更新保留分块的位置，并把所有暂存序号恢复为正常序号
+
+        参数:
+            doc_id: 文档ID
+            stale_ids: 新版本中已经不存在的分块ID
+            retained: iter_stage 收集的保留分块的新序号和位置
+        """
+        stale_ids = list(stale_ids)
+        with self.transaction() as session:
+            for i in range(0, len(stale_ids), CHUNK_BATCH_SIZE):
+                session.query(DocumentChunk).filter(
+                    DocumentChunk.id.in_(stale_ids[i : i + CHUNK_BATCH_SIZE])
+                ).delete(synchronize_session=False)
+            # 保留的分块先改为暂存序号，此时文档的所有分块都是暂存序号，恢复时不会冲突
+            for i in range(0, len(retained), CHUNK_BATCH_SIZE):
+                session.bulk_update_mappings(
+                    DocumentChunk, retained[i : i + CHUNK_BATCH_SIZE]
+                )
+            count = (
+                session.query(DocumentChunk)
+                .filter(DocumentChunk.doc_id == doc_id, DocumentChunk.chunk_index < 0)
+                .update(
+                    {DocumentChunk.chunk_index: -DocumentChunk.chunk_index - 1},
+                    synchronize_session=False,
+                )
+            )
+        self.logger.info(
+            f"已写入文档 {doc_id} 的 {count} 个分块, 删除 {len(stale_ids)} 个旧分块"
+        )
+
+    # 查询文档已写入的分块序号
+    def get_indexes(self, doc_id: str) -> Dict[str, int]:
+        """
+        查询文档已写入分块表的分块序号（只读取ID和序号，不读取文本）
+
+        参数:
+            doc_id: 文档ID
+
+        返回:
+            分块ID -> 分块序号
+        """
+        with self.session() as session:
+            rows = (
+                session.query(DocumentChunk.id, DocumentChunk.chunk_index)
+                .filter(DocumentChunk.doc_id == doc_id, DocumentChunk.chunk_index >= 0)
+                .all()
+            )
+            return {chunk_id: chunk_index for chunk_id, chunk_index in rows}
+
+    # 文档是否已有分块记录
+    def has_chunks(self, doc_id: str) -> bool:
+        """
+        文档是否已有分块记录（不含暂存的分块），分块表上线之前处理的文档没有分块记录
+
+        参数:
+            doc_id: 文档ID
+        """
+        with self.session() as session:
+            return (
+                session.query(DocumentChunk.id)
+                .filter(DocumentChunk.doc_id == doc_id, DocumentChunk.chunk_index >= 0)
+                .first()
+                is not None
+            )
+
+    # 按分块ID批量查询分块序号
+    def get_chunk_indexes(self, chunk_ids: List[str]) -> Dict[str, int]:
+        """
+        按分块ID批量查询分块序号，分块序号只保存在分块表中（向量库的元数据中没有序号）
+
+        参数:
+            chunk_ids: 分块ID列表
+
+        返回:
+            分块ID -> 分块序号，不在分块表中的分块不包含在内
+        """
+        if not chunk_ids:
+            return {}
+        with self.session() as session:
+            rows = (
+                session.query(DocumentChunk.id, DocumentChunk.chunk_index)
+                .filter(DocumentChunk.id.in_(chunk_ids), DocumentChunk.chunk_index >= 0)
+                .all()
+            )
+            return {chunk_id: chunk_index for chunk_id, chunk_index in rows}
+
+    # 按分块序号分页列出文档的分块
+    def list_by_document(self, doc_id: str, offset: int = 0, limit: int = 100) -> List[dict]:
+        """
+        按分块序号分页列出文档的分块，使用 (doc_id, chunk_index) 唯一索引
+
+        参数:
+            doc_id: 文档ID
+            offset: 跳过的分块数
+            limit: 最多返回的分块数
+
+        返回:
+            分块字典列表
+        """
+        with self.session() as session:
+            rows = (
+                session.query(DocumentChunk)
+                .filter(DocumentChunk.doc_id == doc_id, DocumentChunk.chunk_index >= 0)
+                .order_by(DocumentChunk.chunk_index)
+                .offset(offset)
+                .limit(limit)
+                .all()
+            )
+            return [row.to_dict() for row in rows]
+
+    # 按分块序号分批读取文档的分块
+    def iter_documents(self, doc_id: str, doc_name: str) -> Iterator[Document]:
+        """
+        按分块序号分批读取文档的分块，每批 CHUNK_BATCH_SIZE 个，只有当前一批在内存中；
+        Document 的元数据与写入向量库时一致，另外包含分块序号
+
+        参数:
+            doc_id: 文档ID
+            doc_name: 文档名称
+
+        返回:
+            分块 Document 的迭代器
+        """
+        last_index = -1
+        while True:
+            with self.session() as session:
+                rows = (
+                    session.query(
+                        DocumentChunk.id, DocumentChunk.chunk_index, DocumentChunk.content
+                    )
+                    .filter(
+                        DocumentChunk.doc_id == doc_id,
+                        DocumentChunk.chunk_index > last_index,
+                    )
+                    .order_by(DocumentChunk.chunk_index)
+                    .limit(CHUNK_BATCH_SIZE)
+                    .all()
+                )
+            for chunk_id, chunk_index, content in rows:
+                yield Document(
+                    id=chunk_id,
+                    page_content=content,
+                    metadata={
+                        "doc_id": doc_id,
+                        "doc_name": doc_name,
+                        "chunk_index": chunk_index,
+                        "id": chunk_id,
+                        "chunk_id": chunk_id,
+                    },
+                )
+            if len(rows) < CHUNK_BATCH_SIZE:
+                return
+            last_index = rows[-1][1]
+
+    # 按文档逐个读取知识库的所有分块
+    def iter_kb_documents(self, kb_id: str) -> Iterator[Tuple[str, Iterator[Document]]]:
+        """
+        按文档逐个产出知识库中的分块，每个文档的分块由 iter_documents 分批读取
+
+        参数:
+            kb_id: 知识库ID
+
+        返回:
+            (文档ID, 分块 Document 迭代器) 的迭代器，需要在读取下一个文档前消费完
+        """
+        with self.session() as session:
+            docs = (
+                session.query(DocumentModel.id, DocumentModel.name)
+                .filter(DocumentModel.kb_id == kb_id)
+                .all()
+            )
+        for doc_id, doc_name in docs:
+            yield doc_id, self.iter_documents(doc_id, doc_name)
+
+
+# 实例化分块存储服务
+chunk_service = ChunkService()
@@ -1,14 +1,23 @@
 # 导入os模块，用于处理文件和路径
 import os
 
+# 导入hashlib模块，用于计算文件哈希
+import hashlib
+
 # 导入uuid模块，用于生成唯一ID
 import uuid
 
-# 导入类型提示
-from typing import List, Optional, Dict
+# 导入zipfile模块，用于解析批量上传的压缩包
+import zipfile
+
+# 导入time模块，用于统计耗时
+import time
+
+# 导入BytesIO，用于把bytes包装成流
+from io import BytesIO
 
-# 导入线程池，用于异步处理文档
-from concurrent.futures import ThreadPoolExecutor
+# 导入类型提示
+from typing import BinaryIO, List, Optional, Dict, Iterable, Iterator, Set, Tuple, Union
 
 # 导入BaseService基类
 from app.services.base_service import BaseService
@@ -19,9 +28,15 @@ from app.models.document import Document as DocumentModel
 # 导入Knowledgebase知识库模型
 from app.models.knowledgebase import Knowledgebase
 
+# 导入任务队列服务
+from app.services.job_queue_service import job_queue_service
+
 # 导入存储服务
 from app.services.storage_service import storage_service
 
+# 导入关键词检索服务
+from app.services.keyword_service import keyword_service
+
 # 导入解析服务
 from app.services.parser_service import parser_service
 
@@ -31,6 +46,24 @@ from app.config import Config
 # 导入文本分块器
 from app.utils.text_splitter import TextSplitter
 
+# 导入边读边计算哈希的流包装器
+from app.utils.hashing_stream import HashingStream
+
+# 导入 Embedding 批处理器
+from app.utils.embedding_batcher import EmbeddingBatcher
+
+# 导入多阶段流水线执行器
+from app.utils.pipeline import StagedPipeline
+
+# 导入检索结果缓存失效函数
+from app.utils.query_cache import invalidate_kb
+
+# 导入分块存储服务
+from app.services.chunk_service import chunk_service
+
+# 导入 Embedding 工厂，用于计算模型标识
+from app.utils.embedding_factory import EmbeddingFactory
+
 # 导入LangChain文档对象
 from langchain_core.documents import Document
 from app.services.vector_service import vector_service
@@ -40,19 +73,48 @@ from app.services.vector_service import vector_service
 class DocumentService(BaseService[DocumentModel]):
     """文档服务"""
 
-    def __init__(self):
-        """初始化服务 开启多线程"""
-        super().__init__()
-        self.executor = ThreadPoolExecutor(max_workers=4)
+    # 校验文件名并返回小写的扩展名
+    @staticmethod
+    def _get_file_ext(filename: str) -> str:
+        """
+        校验文件名并返回不带点号的小写扩展名
+
+        参数:
+            filename: 文件名
+
+        返回:
+            文件扩展名
+        """
+        # 检查文件名是否为空或者没有扩展名
+        if not filename or "." not in filename:
+            raise ValueError(f"文件名必须包含扩展名: {filename}")
+
+        # 获取文件扩展名
+        file_ext = os.path.splitext(filename)[1]
+        # 如果有后缀，去掉点号并转为小写
+        if file_ext:
+            file_ext = file_ext[1:].lower()
+        else:
+            # 如果没有文件后缀，抛出异常
+            raise ValueError(f"文件名必须包含扩展名: {filename}")
+
+        # 检查文件类型是否合法
+        if not file_ext or file_ext not in Config.ALLOWED_EXTENSIONS:
+            raise ValueError(
+                f"不支持的文件类型: '{file_ext}'。允许类型: {', '.join(Config.ALLOWED_EXTENSIONS)}"
+            )
+        return file_ext
 
     # 上传文档方法
-    def upload(self, kb_id: str, file_data: bytes, filename: str) -> dict:
+    def upload(
+        self, kb_id: str, file_data: Union[bytes, BinaryIO], filename: str
+    ) -> dict:
         """
-        上传文档
+        上传文档，文件以流的方式写入存储，同时计算大小和哈希
 
         参数:
             kb_id: 知识库ID
-            file_data: 文件数据
+            file_data: 文件数据，可以是 bytes 或可读的二进制流
             filename: 文件名
 
         返回:
@@ -75,24 +137,8 @@ class DocumentService(BaseService[DocumentModel]):
                 if not kb:
                     raise ValueError(f"知识库 {kb_id} 不存在")
 
-            # 检查文件名是否为空或者没有扩展名
-            if not filename or "." not in filename:
-                raise ValueError(f"文件名必须包含扩展名: {filename}")
-
-            # 获取文件扩展名
-            file_ext = os.path.splitext(filename)[1]
-            # 如果有后缀，去掉点号并转为小写
-            if file_ext:
-                file_ext = file_ext[1:].lower()
-            else:
-                # 如果没有文件后缀，抛出异常
-                raise ValueError(f"文件名必须包含扩展名: {filename}")
-
-            # 检查文件类型是否合法
-            if not file_ext or file_ext not in Config.ALLOWED_EXTENSIONS:
-                raise ValueError(
-                    f"不支持的文件类型: '{file_ext}'。允许类型: {', '.join(Config.ALLOWED_EXTENSIONS)}"
-                )
+            # 校验文件名并获取文件扩展名
+            file_ext = self._get_file_ext(filename)
 
             # 生成文档ID，用于标识唯一文档
             doc_id = uuid.uuid4().hex[:32]
@@ -100,13 +146,24 @@ class DocumentService(BaseService[DocumentModel]):
             # 构建文件存储路径，便于后续文件操作
             file_path = f"documents/{kb_id}/{doc_id}/{filename}"
 
+            # bytes 包装成流，统一走流式上传
+            if isinstance(file_data, (bytes, bytearray)):
+                file_data = BytesIO(file_data)
+            # 边读边计算文件大小和哈希，超过大小上限时中止上传
+            reader = HashingStream(file_data, max_size=Config.MAX_FILE_SIZE)
+
             # 优先将文件上传到本地/云存储，保证文件存在再创建记录
             try:
-                storage_service.upload_file(file_path, file_data)
+                storage_service.upload_stream(file_path, reader)
                 file_uploaded = True
             except Exception as storage_error:
                 # 上传存储失败时写入日志并抛出异常
                 self.logger.error(f"上传文件到存储时发生错误: {storage_error}")
+                # 尝试清理可能残留的不完整文件
+                try:
+                    storage_service.delete_file(file_path)
+                except Exception:
+                    pass
                 raise ValueError(f"文件上传失败: {str(storage_error)}")
 
             # 在数据库中创建文档记录
@@ -117,7 +174,8 @@ class DocumentService(BaseService[DocumentModel]):
                     name=filename,
                     file_path=file_path,
                     file_type=file_ext,
-                    file_size=len(file_data),
+                    file_size=reader.size,
+                    file_hash=reader.hexdigest(),
                     status="pending",
                 )
                 # 添加文档记录到会话
@@ -145,6 +203,164 @@ class DocumentService(BaseService[DocumentModel]):
             # 重新抛出异常
             raise
 
+    # 批量上传文档方法
+    def upload_batch(
+        self, kb_id: str, files: Iterable[Tuple[str, bytes]], process: bool = True
+    ) -> dict:
+        """
+        批量上传文档：逐个写入存储，然后在一个事务中创建所有文档记录，
+        并把处理任务作为同一个批次提交到任务队列
+
+        参数:
+            kb_id: 知识库ID
+            files: (文件名, 文件数据) 的可迭代对象，可以是生成器
+            process: 是否立即提交处理任务
+
+        返回:
+            包含 batch_id, documents, skipped 的字典
+        """
+        # 使用数据库会话，判断知识库是否存在
+        with self.session() as session:
+            kb = session.query(Knowledgebase).filter(Knowledgebase.id == kb_id).first()
+            if not kb:
+                raise ValueError(f"知识库 {kb_id} 不存在")
+
+        # 生成批次ID
+        batch_id = uuid.uuid4().hex[:32]
+        # 已写入存储的文件
+        uploaded = []
+        # 被跳过的文件及原因
+        skipped = []
+        try:
+            for filename, file_data in files:
+                try:
+                    # 校验文件名和大小
+                    file_ext = self._get_file_ext(filename)
+                    if not file_data:
+                        raise ValueError("文件为空")
+                    if len(file_data) > Config.MAX_FILE_SIZE:
+                        raise ValueError(
+                            f"文件大小超过上限 {Config.MAX_FILE_SIZE} 字节"
+                        )
+                    doc_id = uuid.uuid4().hex[:32]
+                    file_path = f"documents/{kb_id}/{doc_id}/{filename}"
+                    storage_service.upload_file(file_path, file_data)
+                    uploaded.append(
+                        {
+                            "id": doc_id,
+                            "name": filename,
+                            "file_path": file_path,
+                            "file_type": file_ext,
+                            "file_size": len(file_data),
+                            "file_hash": hashlib.sha256(file_data).hexdigest(),
+                        }
+                    )
+                except Exception as e:
+                    self.logger.warning(f"批量上传跳过文件 {filename}: {e}")
+                    skipped.append({"name": filename, "error": str(e)})
+
+            # 在一个事务中创建所有文档记录并提交处理任务
+            with self.transaction() as session:
+                docs = [
+                    DocumentModel(kb_id=kb_id, status="pending", **item)
+                    for item in uploaded
+                ]
+                session.add_all(docs)
+                session.flush()
+                if process and docs:
+                    job_queue_service.enqueue_many(
+                        [doc.id for doc in docs], session=session, batch_id=batch_id
+                    )
+                doc_dicts = [doc.to_dict() for doc in docs]
+        except Exception:
+            # 事务失败时，删除已经写入存储的文件
+            for item in uploaded:
+                try:
+                    storage_service.delete_file(item["file_path"])
+                except Exception as delete_error:
+                    self.logger.warning(f"删除已上传文件时出错: {delete_error}")
+            raise
+
+        self.logger.info(
+            f"批量上传完成: 批次 {batch_id}, 成功 {len(doc_dicts)} 个, 跳过 {len(skipped)} 个"
+        )
+        return {
+            "batch_id": batch_id if process and doc_dicts else None,
+            "documents": doc_dicts,
+            "skipped": skipped,
+        }
+
+    # 展开 zip 压缩包中的文件
+    def iter_zip_files(self, file_obj) -> Iterator[Tuple[str, bytes]]:
+        """
+        逐个读取 zip 压缩包中的文件，跳过目录、隐藏文件和超过大小上限的文件
+
+        参数:
+            file_obj: zip 文件对象（支持 seek）
+
+        返回:
+            (文件名, 文件数据) 的生成器
+        """
+        with zipfile.ZipFile(file_obj) as archive:
+            for info in archive.infolist():
+                # 跳过目录
+                if info.is_dir():
+                    continue
+                # 只保留文件名，去掉压缩包内的目录
+                filename = os.path.basename(info.filename)
+                # 跳过隐藏文件和 macOS 生成的元数据文件
+                if not filename or filename.startswith(".") or "__MACOSX" in info.filename:
+                    continue
+                # 根据声明的解压后大小提前拒绝过大的文件
+                if info.file_size > Config.MAX_FILE_SIZE:
+                    self.logger.warning(f"压缩包中的文件 {filename} 超过大小上限，已跳过")
+                    continue
+                with archive.open(info) as entry:
+                    # 多读一个字节，防止声明的大小与实际不符
+                    data = entry.read(Config.MAX_FILE_SIZE + 1)
+                yield filename, data
+
+    # 批量处理文档方法
+    def process_batch(self, kb_id: str, doc_ids: Optional[List[str]] = None) -> dict:
+        """
+        批量提交文档处理任务
+
+        参数:
+            kb_id: 知识库ID
+            doc_ids: 文档ID列表，为空时处理知识库中所有待处理的文档
+
+        返回:
+            包含 batch_id、本批次新建的任务数和已有未结束任务的文档数的字典，
+            所有文档都已有任务时 batch_id 为 None（进度只统计本批次创建的任务）
+        """
+        batch_id = uuid.uuid4().hex[:32]
+        with self.transaction() as session:
+            query = session.query(DocumentModel.id).filter(DocumentModel.kb_id == kb_id)
+            if doc_ids:
+                query = query.filter(DocumentModel.id.in_(doc_ids))
+            else:
+                query = query.filter(DocumentModel.status == "pending")
+            ids = [doc_id for (doc_id,) in query.all()]
+            jobs = job_queue_service.enqueue_many(
+                ids, session=session, batch_id=batch_id
+            )
+        # 已有未结束任务的文档返回的是其他批次的任务，不计入本批次
+        created = [job for job in jobs if job["batch_id"] == batch_id]
+        self.logger.info(
+            f"批量提交处理任务: 批次 {batch_id}, 新建任务数 {len(created)}, "
+            f"已有任务数 {len(jobs) - len(created)}"
+        )
+        return {
+            "batch_id": batch_id if created else None,
+            "job_count": len(created),
+            "existing_count": len(jobs) - len(created),
+        }
+
+    # 查询批次处理进度
+    def batch_progress(self, batch_id: str) -> Optional[dict]:
+        """查询批次处理进度，批次不存在时返回 None"""
+        return job_queue_service.batch_progress(batch_id)
+
     # 定义根据知识库ID获取文档列表的方法
     def list_by_kb(
         self,
@@ -171,44 +387,26 @@ class DocumentService(BaseService[DocumentModel]):
             )
 
     # 定义处理单个文档的方法（手动触发处理）
-    def process(self, doc_id: str):
+    def process(self, doc_id: str) -> dict:
         """
-        处理文档（手动触发）
+        处理文档（手动触发），提交到持久化任务队列，由工作线程异步执行
         :param doc_id: 文档id
+        :return: 任务字典
         """
-        # 创建数据库会话，检查文档是否存在
-        with self.session() as session:
-            # 根据doc_id查询文档对象
-            doc = session.query(DocumentModel.id == doc_id).first()
-            if not doc:
-                raise ValueError(f"文档{doc_id}不存在")
-
         # 记录已经提交文档处理任务的日志
         self.logger.info(f"提交文档处理任务: {doc_id}")
+        # 提交任务，文档不存在时抛出 ValueError
+        return job_queue_service.enqueue(doc_id)
 
-        # 在线程池中异步提交处理任务
-        future = self.executor.submit(self._process_document, doc_id)
-
-        # 定义异常回调函数，用于捕获子线程中的异常
-        def exception_callback(future):
-            try:
-                # 获取异步线程的执行结果，发生异常会在此抛出
-                future.result()
-            except Exception as e:
-                # 记录错误日志及异常堆栈信息
-                self.logger.error(
-                    f"文档处理任务异常: {doc_id}, 错误: {e}", exc_info=True
-                )
-
-        # 给future对象添加回调函数，任务结束时自动处理异常
-        future.add_done_callback(exception_callback)
-
-    # 文档实际处理方法（在子线程中执行，异步）
-    def _process_document(self, doc_id: str):
+    # 文档实际处理方法（由任务队列的工作线程执行）
+    def _process_document(self, doc_id: str) -> int:
         """
-        处理文档（异步）
+        处理文档（异步），失败时重新抛出异常，由任务队列决定重试或将文档标记为失败
         :param doc_id: 文档ID
+        :return: 分块数
         """
+        # 知识库ID，查询到文档后赋值
+        kb_id = None
         try:
             # 日志：文档处理任务开始
             self.logger.info(f"开始处理文档: {doc_id}")
@@ -224,7 +422,7 @@ class DocumentService(BaseService[DocumentModel]):
                 # 未找到文档则输出日志并返回
                 if not doc:
                     self.logger.error(f"未找到文档 {doc_id}")
-                    return
+                    return 0
                 # 若文档已被处理过（完成或失败），则需重置状态
                 need_cleanup = doc.status in ["completed", "failed"]
                 if need_cleanup:
@@ -242,7 +440,6 @@ class DocumentService(BaseService[DocumentModel]):
                 file_path = doc.file_path
                 file_type = doc.file_type
                 doc_name = doc.name
-                collection_name = f"kb_{doc.kb_id}" if need_cleanup else None
                 # 查询知识库配置
                 kb = (
                     session.query(Knowledgebase)
@@ -255,69 +452,88 @@ class DocumentService(BaseService[DocumentModel]):
                 # 获取知识库分块参数
                 kb_chunk_size = kb.chunk_size
                 kb_chunk_overlap = kb.chunk_overlap
-            # 如果需要清理旧分块和向量，则在事务作用域外先进行删除，避免占用数据库连接
-            if need_cleanup:
-                try:
-                    # 调用向量服务，删除指定集合、指定文档ID下的所有向量数据
-                    vector_service.delete_documents(
-                        collection_name=collection_name, filter={"doc_id": doc_id}
-                    )
-                except Exception as e:
-                    self.logger.warning(f"删除向量时出错: {e}")
 
             # 日志：文档已标记为处理中
             self.logger.info(f"文档 {doc_id} 已标记为处理中")
 
-            # 从存储中下载文件内容
-            file_data = storage_service.download_file(file_path)
-            # 解析文件，根据类型抽取原始文本内容
-            langchain_docs = parser_service.parse(file_data, file_type)
-            # 若抽取出的文本为空，则抛出异常
-            if not langchain_docs:
-                raise ValueError("未能抽取到任何文本内容")
-
             # 创建文本分块器，指定知识库参数
             splitter = TextSplitter(
                 chunk_size=kb_chunk_size,  # 块大小
                 chunk_overlap=kb_chunk_overlap,  # 块之间的重叠字符数
             )
-            # 将文档内容分块
-            try:
-                chunks = splitter.split_documents(langchain_docs, doc_id=doc_id)
-            except Exception as e:
-                print(f"分块错误e{e}")
-
-            # 如果分块失败，抛出异常
-            if not chunks:
-                raise ValueError("文档未能成功分块")
-
-            # 初始化一个列表用于存放转换后的 LangChain Document 对象
-            documents = []
-            # 遍历所有分块，将每个分块转换为 LangChain Document 对象
-            for chunk in chunks:
-                # 创建一个 LangChain Document，包含文本内容和相关元数据
-                doc_obj = Document(
-                    page_content=chunk["text"],
-                    metadata={
-                        "doc_id": doc_id,  # 文档ID
-                        "doc_name": doc_name,  # 文档名称
-                        "chunk_index": chunk["chunk_index"],  # 分块索引
-                        "id": chunk["id"],  # 分块ID
-                        "chunk_id": chunk["id"],  # 分块ID
-                    },
-                )
-                # 将生成的 Document 对象加入到 documents 列表
-                documents.append(doc_obj)
             # 构造向量库集合名称，格式为 kb_知识库ID
             collection_name = f"kb_{kb_id}"
-            # 提取所有分块的ID，用于向量存储
-            ids = [chunk["id"] for chunk in chunks]
-            # 调用向量服务，将分块后的文档写入向量库
-            vector_service.add_documents(
-                collection_name=collection_name,  # 集合名称
-                documents=documents,  # 文档列表
-                ids=ids,  # 分块ID列表
+
+            # 整个文档使用同一个 Embedding 模型，避免处理过程中模型切换
+            embeddings = vector_service.embeddings
+            # 查询该文档已经写入向量库的分块ID（首次处理时为空，失败重试时为已写入的部分）
+            # 分块ID由内容和模型标识决定，重新处理时只写入新增的分块，删除消失的分块，其余保持不动；
+            # 切换 Embedding 模型后所有分块ID都会变化，整个文档重新向量化
+            existing_ids = set(
+                vector_service.get_ids(collection_name, {"doc_id": doc_id})
+            )
+            # 清理上次处理失败时留下的暂存分块
+            chunk_service.discard_staged(doc_id)
+            # 上次处理时各分块的序号；分块序号只保存在分块表中，序号变化时向量库不需要改动
+            old_indexes = chunk_service.get_indexes(doc_id)
+            # 本次处理产生的所有分块ID（只保留ID，文本写入分块表后不再留在内存中）
+            current_ids: Set[str] = set()
+            # 分块表中已有的分块的新序号和位置（不含文本），处理完成后统一更新
+            retained_chunks: List[dict] = []
+
+            # 以流水线的方式处理：逐页解析、分块、分批（数据源线程）-> 向量化 -> 写入向量库
+            # 各阶段并行执行，阶段之间通过有界队列背压，内存中只保留少量批次
+            with storage_service.open_local_file(file_path) as local_path:
+                # 逐页解析文件
+                pages = parser_service.iter_parse(local_path, file_type)
+                # 增量分块
+                chunks = splitter.iter_split(
+                    pages,
+                    doc_id=doc_id,
+                    model_key=EmbeddingFactory.model_key(embeddings),
+                )
+                # 新分块分批写入分块表（暂存，处理完成后生效）
+                chunks = chunk_service.iter_stage(
+                    kb_id, doc_id, chunks, old_indexes, retained_chunks
+                )
+                # 转换为 (LangChain Document, 分块ID) 数据流
+                pairs = self._iter_chunk_documents(chunks, doc_id, doc_name)
+                # 跳过向量库中已存在的分块
+                pairs = self._iter_new_chunks(pairs, existing_ids, current_ids)
+                # 按长度分组、按数量和字符数分批
+                batches = EmbeddingBatcher().iter_batches(pairs)
+                # 运行流水线
+                inserted_count, pipeline_stats = self._index_batches(
+                    batches, collection_name, embeddings
+                )
+            # 分块数为本次处理产生的所有分块（包括未变化的分块）
+            chunk_count = len(current_ids)
+            # 如果没有产生任何分块，抛出异常
+            if not chunk_count:
+                raise ValueError("未能抽取到任何文本内容，文档未能成功分块")
+            # 删除新版本中已经不存在的分块
+            stale_ids = list(existing_ids - current_ids)
+            if stale_ids:
+                vector_service.delete_documents(
+                    collection_name=collection_name, ids=stale_ids
+                )
+                vector_service.flush(collection_name)
+            self.logger.info(
+                f"文档 {doc_id} 向量化完成: 新增 {inserted_count} 个分块, "
+                f"删除 {len(stale_ids)} 个分块, "
+                f"保留 {chunk_count - inserted_count} 个分块, "
+                f"{pipeline_stats}"
+            )
+            # 用文档当前版本的所有分块原子地替换分块表中的旧分块
+            chunk_service.commit_document(
+                doc_id, old_indexes.keys() - current_ids, retained_chunks
+            )
+            # 用文档当前版本的所有分块替换关键词索引中的旧分块，分块从分块表中分批读回
+            keyword_service.index_document(
+                kb_id, doc_id, chunk_service.iter_documents(doc_id, doc_name)
             )
+            # 知识库内容已变化，使其检索缓存失效
+            invalidate_kb(kb_id)
             # 再次开启事务，更新文档状态和分块数
             with self.transaction() as session:
                 doc = (
@@ -327,17 +543,126 @@ class DocumentService(BaseService[DocumentModel]):
                 )
                 if doc:
                     doc.status = "completed"
-                    doc.chunk_count = len(chunks)  # 分块数
+                    doc.chunk_count = chunk_count  # 分块数
             # 日志：处理完成，输出分块数
-            self.logger.info(f"文档处理完成: {doc_id}, 分块数量: {len(chunks)}")
+            self.logger.info(f"文档处理完成: {doc_id}, 分块数量: {chunk_count}")
+            return chunk_count
         except Exception as e:
-            # 记录处理失败的日志
+            # 记录处理失败的日志，文档状态由任务队列根据剩余重试次数更新
             self.logger.error(f"处理文档 {doc_id} 时发生错误: {e}")
+            # 失败前可能已经写入或删除了部分向量，同样使检索缓存失效
+            if kb_id is not None:
+                invalidate_kb(kb_id)
+            raise
+
+    # 通过多阶段流水线向量化并写入向量库
+    def _index_batches(
+        self,
+        batches: Iterable[Tuple[List[Document], List[str]]],
+        collection_name: str,
+        embeddings,
+    ) -> Tuple[int, dict]:
+        """
+        数据源（解析/分块/分批）、向量化、写入向量库三个阶段并行执行：
+        解析第 N+1 页、向量化第 N 批和写入第 N-1 批可以同时进行
+
+        :param batches: (Document 列表, ID列表) 批次的可迭代对象
+        :param collection_name: 向量库集合名称
+        :param embeddings: 用于向量化的 Embedding 模型（与分块ID中的模型标识一致）
+        :return: (写入的分块数, 各阶段统计信息)
+        """
+
+        # 向量化阶段：计算一批分块的向量
+        def embed_batch(batch):
+            batch_docs, batch_ids = batch
+            start = time.perf_counter()
+            vectors = embeddings.embed_documents([d.page_content for d in batch_docs])
+            self.logger.info(
+                f"批次向量化: {len(batch_docs)} 个分块, "
+                f"耗时 {(time.perf_counter() - start) * 1000:.1f} ms"
+            )
+            return batch_docs, batch_ids, vectors
+
+        # 写入阶段：将一批向量写入向量库
+        def upsert_batch(batch):
+            batch_docs, batch_ids, vectors = batch
+            vector_service.add_embeddings(
+                collection_name=collection_name,  # 集合名称
+                documents=batch_docs,  # 本批文档列表
+                embeddings=vectors,  # 本批向量
+                ids=batch_ids,  # 本批分块ID列表
+            )
+            return len(batch_docs)
+
+        pipeline = (
+            StagedPipeline(name=f"ingest-{collection_name}")
+            .add_stage(
+                "embed",
+                embed_batch,
+                workers=Config.PIPELINE_EMBED_WORKERS,
+                queue_size=Config.PIPELINE_QUEUE_SIZE,
+            )
+            .add_stage(
+                "upsert",
+                upsert_batch,
+                workers=Config.PIPELINE_UPSERT_WORKERS,
+                queue_size=Config.PIPELINE_QUEUE_SIZE,
+            )
+        )
+        chunk_count = sum(pipeline.run(batches))
+        # 所有批次写入后统一刷新一次
+        if chunk_count:
+            vector_service.flush(collection_name)
+        return chunk_count, pipeline.stats()
+
+    # 将分块流转换为 LangChain Document 流
+    @staticmethod
+    def _iter_chunk_documents(
+        chunks: Iterable[dict], doc_id: str, doc_name: str
+    ) -> Iterator[Tuple[Document, str]]:
+        """
+        将分块字典逐个转换为 (LangChain Document, 分块ID)
+
+        :param chunks: 分块字典的可迭代对象
+        :param doc_id: 文档ID
+        :param doc_name: 文档名称
+        """
+        for chunk in chunks:
+            # 创建一个 LangChain Document，包含文本内容和相关元数据
+            doc_obj = Document(
+                page_content=chunk["text"],
+                metadata={
+                    "doc_id": doc_id,  # 文档ID
+                    "doc_name": doc_name,  # 文档名称
+                    "id": chunk["id"],  # 分块ID
+                    "chunk_id": chunk["id"],  # 分块ID
+                },
+            )
+            yield doc_obj, chunk["id"]
+
+    # 跳过向量库中已存在的分块
+    @staticmethod
+    def _iter_new_chunks(
+        pairs: Iterable[Tuple[Document, str]],
+        existing_ids: set,
+        current_ids: Set[str],
+    ) -> Iterator[Tuple[Document, str]]:
+        """
+        只产出向量库中还不存在的分块，同时把所有分块ID记录到 current_ids
+
+        :param pairs: (LangChain Document, 分块ID) 的可迭代对象
+        :param existing_ids: 向量库中已存在的分块ID
+        :param current_ids: 用于收集本次处理产生的所有分块ID
+        """
+        for doc_obj, chunk_id in pairs:
+            current_ids.add(chunk_id)
+            if chunk_id not in existing_ids:
+                yield doc_obj, chunk_id
 
     def delete(self, doc_id):
         """
         删除文档
-        包括：删除向量数据库中的向量数据、删除存储中的文件、删除数据库记录
+        包括：删除向量数据库中的向量数据、删除关键词索引、删除存储中的文件、删除数据库记录
         """
         with self.session() as session:
             doc = (
@@ -353,14 +678,20 @@ class DocumentService(BaseService[DocumentModel]):
 
         # 1. 删除向量数据库中的相关向量数据
         try:
-            vector_service.delete_documents(
+            deleted = vector_service.delete_documents(
                 collection_name=collection_name, filter={"doc_id": doc_id}
             )
-            self.logger.info(f"已删除文档{doc_id}的向量数据")
+            self.logger.info(f"已删除文档{doc_id}的{deleted}条向量数据")
         except Exception as e:
             self.logger.warning(f"删除向量数据失败:{e}")
 
-        # 2. 删除存储中的文件
+        # 2. 删除关键词索引中的分块
+        try:
+            keyword_service.delete_document(kb_id, doc_id)
+        except Exception as e:
+            self.logger.warning(f"删除关键词索引失败:{e}")
+
+        # 3. 删除存储中的文件
         if file_path:
             try:
                 storage_service.delete_file(file_path)
@@ -368,7 +699,10 @@ class DocumentService(BaseService[DocumentModel]):
             except Exception as e:
                 self.logger.warning(f"删除存储文件失败:{e}")
 
-        # 3. 删除数据库记录
+        # 知识库内容已变化，使其检索缓存失效
+        invalidate_kb(kb_id)
+
+        # 4. 删除数据库记录
         with self.transaction() as session:
             doc = (
                 session.query(DocumentModel).filter(DocumentModel.id == doc_id).first()
@@ -0,0 +1,221 @@
+"""
+文档处理工作线程
+从持久化任务队列中领取任务并执行文档处理
+"""
+
+# 导入多进程模块，用于创建 spawn 方式的进程池
+import multiprocessing
+
+# 导入os模块，用于获取进程号
+import os
+
+# 导入socket模块，用于获取主机名
+import socket
+
+# 导入线程模块
+import threading
+
+# 导入进程池
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# 导入类型提示
+from typing import List, Optional
+
+# 导入任务队列服务
+from app.services.job_queue_service import job_queue_service
+
+# 导入文档服务
+from app.services.document_service import document_service
+
+# 导入配置项
+from app.config import Config
+
+# 导入日志
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+# 子进程初始化函数：每个子进程持有自己的数据库连接池和预热好的 Embedding 模型
+def _init_worker_process() -> None:
+    from app.utils.db import engine
+    from app.utils.embedding_factory import embedding_registry
+
+    # 丢弃从父进程继承的数据库连接（fork 方式时），子进程重新建立连接
+    engine.dispose(close=False)
+    # 预热 Embedding 模型，避免第一个任务承担模型加载时间
+    embedding_registry.get_embeddings()
+    logger.info(f"文档处理子进程已就绪: {os.getpid()}")
+
+
+# 在子进程中处理文档：只传入文档ID，结果直接写入数据库和向量库，只返回分块数
+def _process_document_in_subprocess(doc_id: str) -> int:
+    from app.utils.embedding_factory import embedding_registry
+
+    # 设置变更只会切换 Web 进程中的模型，子进程在每个任务开始前按需同步
+    embedding_registry.reload()
+    return document_service._process_document(doc_id)
+
+
+# 定义文档处理工作线程池
+class IngestionWorkerPool:
+    """文档处理工作线程池"""
+
+    def __init__(
+        self,
+        num_workers: int = None,
+        poll_interval: float = None,
+        mode: str = None,
+        refresh_embeddings: bool = False,
+    ):
+        """
+        初始化工作线程池
+
+        参数:
+            num_workers: 工作线程数，为 None 时使用 Config.INGESTION_WORKERS
+            poll_interval: 没有任务时的轮询间隔（秒），为 None 时使用 Config.JOB_POLL_INTERVAL
+            mode: 执行方式，thread 在工作线程中直接处理，process 提交到进程池处理以绕开 GIL，
+                为 None 时使用 Config.INGESTION_WORKER_MODE
+            refresh_embeddings: 每个任务开始前是否按数据库中的设置同步 Embedding 模型，
+                独立运行的工作进程需要开启
+        """
+        self.num_workers = num_workers or Config.INGESTION_WORKERS
+        self.poll_interval = poll_interval or Config.JOB_POLL_INTERVAL
+        self.mode = (mode or Config.INGESTION_WORKER_MODE).lower()
+        if self.mode not in ("thread", "process"):
+            raise ValueError(f"不支持的工作线程模式: {self.mode}")
+        self.refresh_embeddings = refresh_embeddings
+        # 进程模式下的进程池，每个子进程持有自己的 Embedding 模型
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._process_pool_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        # 工作线程标识前缀：主机名:进程号
+        self._worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    # 启动工作线程
+    def start(self) -> None:
+        """启动工作线程，启动前先恢复中断的任务"""
+        if self._threads:
+            return
+        if self.mode == "process":
+            self._get_process_pool()
+        try:
+            job_queue_service.recover_interrupted()
+        except Exception as e:
+            logger.warning(f"恢复中断的任务失败: {e}")
+        for n in range(self.num_workers):
+            thread = threading.Thread(
+                target=self._run,
+                args=(f"{self._worker_prefix}:{n}",),
+                name=f"ingestion-worker-{n}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"已启动 {self.num_workers} 个文档处理工作线程, 模式: {self.mode}")
+
+    # 停止工作线程
+    def stop(self, timeout: float = None) -> None:
+        """通知工作线程停止，并等待正在执行的任务结束"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        with self._process_pool_lock:
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=True)
+                self._process_pool = None
+
+    # 获取（必要时创建）进程池
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        with self._process_pool_lock:
+            if self._process_pool is None:
+                # 使用 spawn 方式创建子进程，避免 fork 继承父进程中的线程和连接
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.num_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker_process,
+                )
+            return self._process_pool
+
+    # 丢弃已损坏的进程池（子进程异常退出），下次使用时重新创建
+    def _reset_process_pool(self, pool: ProcessPoolExecutor) -> None:
+        with self._process_pool_lock:
+            if self._process_pool is pool:
+                self._process_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    # 处理文档，按模式选择在当前线程或子进程中执行
+    def _process(self, doc_id: str) -> int:
+        if self.mode == "process":
+            pool = self._get_process_pool()
+            try:
+                return pool.submit(_process_document_in_subprocess, doc_id).result()
+            except BrokenProcessPool:
+                logger.error("文档处理子进程异常退出，重建进程池")
+                self._reset_process_pool(pool)
+                raise
+        if self.refresh_embeddings:
+            from app.utils.embedding_factory import embedding_registry
+
+            embedding_registry.reload()
+        return document_service._process_document(doc_id)
+
+    # 工作线程主循环
+    def _run(self, worker_id: str) -> None:
+        idle_rounds = 0
+        while not self._stop.is_set():
+            try:
+                job = job_queue_service.claim(worker_id)
+            except Exception as e:
+                logger.error(f"领取任务失败: {e}")
+                job = None
+            if not job:
+                idle_rounds += 1
+                # 空闲时定期回收租约过期的任务（其他进程崩溃遗留）
+                if idle_rounds % Config.JOB_RECOVER_EVERY_IDLE_ROUNDS == 0:
+                    try:
+                        job_queue_service.recover_interrupted()
+                    except Exception as e:
+                        logger.warning(f"恢复中断的任务失败: {e}")
+                self._stop.wait(self.poll_interval)
+                continue
+            idle_rounds = 0
+            self._execute(job, worker_id)
+
+    # 执行一个任务
+    def _execute(self, job: dict, worker_id: str) -> None:
+        job_id = job["id"]
+        doc_id = job["doc_id"]
+        logger.info(
+            f"{worker_id} 开始执行任务 {job_id}, 文档: {doc_id}, 第 {job['attempts']} 次"
+        )
+        # 执行期间定期刷新租约
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.wait(Config.JOB_HEARTBEAT_SECONDS):
+                try:
+                    job_queue_service.heartbeat(job_id, worker_id)
+                except Exception as e:
+                    logger.warning(f"任务 {job_id} 心跳失败: {e}")
+
+        heartbeat_thread = threading.Thread(
+            target=heartbeat, name=f"heartbeat-{job_id}", daemon=True
+        )
+        heartbeat_thread.start()
+        try:
+            self._process(doc_id)
+        except Exception as e:
+            job_queue_service.fail(job_id, str(e))
+        else:
+            job_queue_service.complete(job_id)
+        finally:
+            done.set()
+            heartbeat_thread.join()
+
+
+# 实例化工作线程池
+ingestion_worker_pool = IngestionWorkerPool()
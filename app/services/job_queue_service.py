@@ -0,0 +1,316 @@
+"""
+文档处理任务队列服务
+基于数据库的持久化任务队列，支持优先级、按知识库限制并发、失败重试和中断恢复
+"""
+
+# 导入datetime，用于计算重试时间和租约
+from datetime import datetime, timedelta
+
+# 导入类型提示
+from typing import List, Optional
+
+# 导入SQLAlchemy的聚合函数
+from sqlalchemy import func, select
+
+# 导入BaseService基类
+from app.services.base_service import BaseService
+
+# 导入任务模型
+from app.models.ingestion_job import IngestionJob
+
+# 导入Document模型，重命名为DocumentModel
+from app.models.document import Document as DocumentModel
+
+# 导入Knowledgebase知识库模型
+from app.models.knowledgebase import Knowledgebase
+
+# 导入配置项
+from app.config import Config
+
+# 尚未结束的任务状态
+ACTIVE_STATUSES = ("queued", "running")
+
+
+# 定义任务队列服务类
+class JobQueueService(BaseService[IngestionJob]):
+    """文档处理任务队列服务"""
+
+    # 提交文档处理任务
+    def enqueue(self, doc_id: str, session=None, batch_id: Optional[str] = None) -> dict:
+        """
+        提交文档处理任务，同一文档已有未结束的任务时直接返回该任务
+
+        参数:
+            doc_id: 文档ID
+            session: 可选的数据库会话，传入时在调用方的事务中创建任务
+            batch_id: 可选的批次ID
+
+        返回:
+            任务字典
+        """
+        jobs = self.enqueue_many([doc_id], session=session, batch_id=batch_id)
+        if not jobs:
+            raise ValueError(f"文档{doc_id}不存在")
+        return jobs[0]
+
+    # 批量提交文档处理任务
+    def enqueue_many(
+        self, doc_ids: List[str], session=None, batch_id: Optional[str] = None
+    ) -> List[dict]:
+        """
+        批量提交文档处理任务，一次查询文档和已有任务，一次写入所有新任务
+
+        参数:
+            doc_ids: 文档ID列表，不存在的文档会被忽略
+            session: 可选的数据库会话，传入时在调用方的事务中创建任务
+            batch_id: 可选的批次ID
+
+        返回:
+            任务字典列表（已有未结束任务的文档返回已有的任务）
+        """
+        if session is not None:
+            return self._enqueue_many(session, doc_ids, batch_id)
+        with self.transaction() as session:
+            return self._enqueue_many(session, doc_ids, batch_id)
+
+    def _enqueue_many(
+        self, session, doc_ids: List[str], batch_id: Optional[str]
+    ) -> List[dict]:
+        if not doc_ids:
+            return []
+        # 查询文档，获取知识库和文件大小
+        docs = (
+            session.query(DocumentModel.id, DocumentModel.kb_id, DocumentModel.file_size)
+            .filter(DocumentModel.id.in_(doc_ids))
+            .all()
+        )
+        # 已有排队中或执行中的任务，不重复提交
+        existing = {
+            job.doc_id: job
+            for job in session.query(IngestionJob).filter(
+                IngestionJob.doc_id.in_(doc_ids),
+                IngestionJob.status.in_(ACTIVE_STATUSES),
+            )
+        }
+        now = datetime.now()
+        jobs = []
+        new_jobs = []
+        for doc_id, kb_id, file_size in docs:
+            if doc_id in existing:
+                jobs.append(existing[doc_id])
+                continue
+            # 创建任务，小文件优先
+            job = IngestionJob(
+                doc_id=doc_id,
+                kb_id=kb_id,
+                batch_id=batch_id,
+                status="queued",
+                priority=file_size or 0,
+                attempts=0,
+                max_attempts=Config.JOB_MAX_ATTEMPTS,
+                next_run_at=now,
+            )
+            jobs.append(job)
+            new_jobs.append(job)
+        session.add_all(new_jobs)
+        session.flush()
+        self.logger.info(
+            f"已提交 {len(new_jobs)} 个文档处理任务, 已存在 {len(existing)} 个, 批次: {batch_id}"
+        )
+        return [job.to_dict() for job in jobs]
+
+    # 获取批次进度
+    def batch_progress(self, batch_id: str) -> Optional[dict]:
+        """
+        汇总批次中各状态的任务数
+
+        参数:
+            batch_id: 批次ID
+
+        返回:
+            进度字典，批次不存在时返回 None
+        """
+        with self.session() as session:
+            rows = (
+                session.query(IngestionJob.status, func.count(IngestionJob.id))
+                .filter(IngestionJob.batch_id == batch_id)
+                .group_by(IngestionJob.status)
+                .all()
+            )
+        if not rows:
+            return None
+        counts = {status: 0 for status in ("queued", "running", "succeeded", "failed")}
+        counts.update({status: count for status, count in rows})
+        total = sum(counts.values())
+        finished = counts["succeeded"] + counts["failed"]
+        return {
+            "batch_id": batch_id,
+            "total": total,
+            "finished": finished,
+            "progress": finished / total if total else 1.0,
+            "done": finished == total,
+            **counts,
+        }
+
+    # 领取一个可执行的任务
+    def claim(self, worker_id: str) -> Optional[dict]:
+        """
+        领取一个可执行的任务：按优先级和创建时间排序，跳过被其他工作线程锁定的行，
+        并保证同一知识库执行中的任务数不超过 Config.KB_MAX_CONCURRENT_JOBS
+
+        参数:
+            worker_id: 工作线程标识
+
+        返回:
+            任务字典，没有可执行的任务时返回 None
+        """
+        with self.transaction() as session:
+            now = datetime.now()
+            # 锁定一批候选任务，已被其他工作线程锁定的行直接跳过
+            candidates = (
+                session.query(IngestionJob)
+                .filter(
+                    IngestionJob.status == "queued",
+                    IngestionJob.next_run_at <= now,
+                )
+                .order_by(IngestionJob.priority.asc(), IngestionJob.created_at.asc())
+                .limit(Config.JOB_CLAIM_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            for job in candidates:
+                # 锁定知识库行，串行化同一知识库的并发数检查
+                session.query(Knowledgebase.id).filter(
+                    Knowledgebase.id == job.kb_id
+                ).with_for_update().first()
+                running = (
+                    session.query(func.count(IngestionJob.id))
+                    .filter(
+                        IngestionJob.kb_id == job.kb_id,
+                        IngestionJob.status == "running",
+                    )
+                    .scalar()
+                )
+                if running >= Config.KB_MAX_CONCURRENT_JOBS:
+                    continue
+                # 标记为执行中
+                job.status = "running"
+                job.attempts += 1
+                job.locked_by = worker_id
+                job.locked_at = now
+                session.flush()
+                return job.to_dict()
+        return None
+
+    # 任务心跳，刷新租约
+    def heartbeat(self, job_id: str, worker_id: str) -> None:
+        """刷新任务的租约时间，避免长时间运行的任务被当作中断任务回收"""
+        with self.transaction() as session:
+            session.query(IngestionJob).filter(
+                IngestionJob.id == job_id,
+                IngestionJob.locked_by == worker_id,
+                IngestionJob.status == "running",
+            ).update({IngestionJob.locked_at: datetime.now()})
+
+    # 标记任务成功
+    def complete(self, job_id: str) -> None:
+        """标记任务成功"""
+        with self.transaction() as session:
+            job = session.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+            if job:
+                job.status = "succeeded"
+                job.locked_by = None
+                job.locked_at = None
+                job.error_message = None
+
+    # 标记任务失败，必要时安排重试
+    def fail(self, job_id: str, error: str) -> None:
+        """
+        标记任务失败：未达到最大次数时按指数退避重新排队，文档回到待处理状态；
+        否则任务和文档都标记为失败
+
+        参数:
+            job_id: 任务ID
+            error: 错误信息
+        """
+        with self.transaction() as session:
+            job = session.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+            if job:
+                self._fail_job(session, job, error)
+
+    # 在调用方的事务中标记任务及其文档失败，返回是否会重试
+    def _fail_job(self, session, job: IngestionJob, error: str) -> bool:
+        job.error_message = error
+        job.locked_by = None
+        job.locked_at = None
+        if job.attempts < job.max_attempts:
+            # 指数退避：base, base*2, base*4 ...
+            delay = Config.JOB_RETRY_BACKOFF_SECONDS * (2 ** (job.attempts - 1))
+            job.status = "queued"
+            job.next_run_at = datetime.now() + timedelta(seconds=delay)
+            self.logger.warning(
+                f"任务 {job.id} 第 {job.attempts} 次执行失败，{delay} 秒后重试: {error}"
+            )
+            # 还会重试，文档保持待处理状态，错误信息保留最近一次失败的原因
+            self._set_document_status(session, job.doc_id, "pending", error)
+            return True
+        job.status = "failed"
+        self.logger.error(f"任务 {job.id} 已失败 {job.attempts} 次，不再重试: {error}")
+        # 重试次数用尽才将文档标记为失败，否则会被当作卡住的文档重新提交
+        self._set_document_status(session, job.doc_id, "failed", error)
+        return False
+
+    # 在调用方的事务中更新文档状态
+    def _set_document_status(self, session, doc_id: str, status: str, error: str) -> None:
+        session.query(DocumentModel).filter(DocumentModel.id == doc_id).update(
+            {DocumentModel.status: status, DocumentModel.error_message: error},
+            synchronize_session=False,
+        )
+
+    # 恢复中断的任务
+    def recover_interrupted(self) -> int:
+        """
+        恢复中断的任务：
+        1. 租约过期的执行中任务（进程崩溃或重启）按失败处理：未达到最大次数时重新排队，
+           文档回到待处理状态；否则标记任务和文档为失败，避免导致进程崩溃的文档被无限重试
+        2. 状态为处理中但没有未结束任务的文档（旧版本遗留）补交任务
+
+        返回:
+            恢复的任务数
+        """
+        expired_before = datetime.now() - timedelta(seconds=Config.JOB_LEASE_SECONDS)
+        with self.transaction() as session:
+            # 租约过期的执行中任务，已被其他进程锁定的行跳过
+            expired = (
+                session.query(IngestionJob)
+                .filter(
+                    IngestionJob.status == "running",
+                    IngestionJob.locked_at < expired_before,
+                )
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            error = "任务执行中断（租约过期），工作进程可能已崩溃或重启"
+            recovered = sum(self._fail_job(session, job, error) for job in expired)
+            session.flush()
+            # 卡在处理中状态、且没有未结束任务的文档
+            active_doc_ids = select(IngestionJob.doc_id).where(
+                IngestionJob.status.in_(ACTIVE_STATUSES)
+            )
+            stuck_docs = (
+                session.query(DocumentModel.id)
+                .filter(
+                    DocumentModel.status == "processing",
+                    ~DocumentModel.id.in_(active_doc_ids),
+                )
+                .all()
+            )
+            self._enqueue_many(session, [doc_id for (doc_id,) in stuck_docs], None)
+            recovered += len(stuck_docs)
+        if recovered:
+            self.logger.info(f"已恢复 {recovered} 个中断的文档处理任务")
+        return recovered
+
+
+# 实例化JobQueueService
+job_queue_service = JobQueueService()
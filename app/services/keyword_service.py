@@ -0,0 +1,144 @@
+"""
+关键词检索服务
+每个知识库维护一个 BM25 索引，文档处理完成时写入，删除文档或知识库时失效
+"""
+
+# 导入os模块，用于处理文件和路径
+import os
+
+# 导入shutil模块，用于删除索引目录
+import shutil
+
+# 导入线程模块，用于保护索引缓存
+import threading
+
+# 导入类型提示
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 导入 LangChain 的 Document 类型
+from langchain_core.documents import Document
+
+# 导入全局配置
+from app.config import Config
+
+# 导入 BM25 索引
+from app.utils.bm25_index import BM25Index
+
+# 导入日志工具
+from app.utils.logger import get_logger
+
+
+class KeywordService:
+    """关键词检索服务"""
+
+    def __init__(self):
+        self.logger = get_logger(self.__class__.__name__)
+        # 知识库ID -> 已加载的索引
+        self._indexes: Dict[str, BM25Index] = {}
+        self._lock = threading.Lock()
+
+    # 索引根目录，相对路径基于项目根目录
+    @staticmethod
+    def get_index_root() -> str:
+        path = Config.KEYWORD_INDEX_DIR or os.path.join(
+            Config.STORAGE_DIR, "keyword_index"
+        )
+        if not os.path.isabs(path):
+            path = os.path.join(Config.BASE_DIR, path)
+        return path
+
+    # 获取知识库的索引（懒加载，进程内共享）
+    def get_index(self, kb_id: str) -> BM25Index:
+        with self._lock:
+            index = self._indexes.get(kb_id)
+            if index is None:
+                index = BM25Index(
+                    os.path.join(self.get_index_root(), f"kb_{kb_id}"),
+                    k1=Config.BM25_K1,
+                    b=Config.BM25_B,
+                    max_segments=Config.KEYWORD_MAX_SEGMENTS,
+                    compact_dead_ratio=Config.KEYWORD_COMPACT_DEAD_RATIO,
+                )
+                self._indexes[kb_id] = index
+            return index
+
+    def index_document(
+        self, kb_id: str, doc_id: str, documents: Iterable[Document]
+    ) -> None:
+        """
+        写入文档当前版本的所有分块，替换该文档之前的分块
+
+        参数:
+            kb_id: 知识库ID
+            doc_id: 文档ID
+            documents: 分块 Document，分块ID保存在 Document.id 或元数据 chunk_id 中
+        """
+        self.get_index(kb_id).add_document(doc_id, documents)
+        self.logger.info(f"已更新文档 {doc_id} 的关键词索引")
+
+    def delete_document(self, kb_id: str, doc_id: str) -> None:
+        """从关键词索引中删除文档"""
+        self.get_index(kb_id).delete_document(doc_id)
+        self.logger.info(f"已从关键词索引中删除文档 {doc_id}")
+
+    def delete_index(self, kb_id: str) -> None:
+        """删除整个知识库的关键词索引"""
+        with self._lock:
+            self._indexes.pop(kb_id, None)
+        shutil.rmtree(
+            os.path.join(self.get_index_root(), f"kb_{kb_id}"), ignore_errors=True
+        )
+        self.logger.info(f"已删除知识库 {kb_id} 的关键词索引")
+
+    def rebuild(self, kb_id: str) -> int:
+        """
+        根据关系库中保存的分块重建整个知识库的关键词索引（不读取向量库和原始文件）
+
+        返回:
+            重建的文档数
+        """
+        # 延迟导入，避免服务模块之间的循环导入
+        from app.services.chunk_service import chunk_service
+
+        self.delete_index(kb_id)
+        index = self.get_index(kb_id)
+        count = 0
+        for doc_id, documents in chunk_service.iter_kb_documents(kb_id):
+            index.add_document(doc_id, documents)
+            count += 1
+        index.compact()
+        self.logger.info(f"已重建知识库 {kb_id} 的关键词索引: {count} 个文档")
+        return count
+
+    def search(
+        self,
+        kb_id: str,
+        query: str,
+        k: int = 5,
+        filter: Optional[Dict] = None,
+    ) -> List[Tuple[Document, float]]:
+        """
+        关键词检索
+
+        参数:
+            kb_id: 知识库ID
+            query: 查询文本
+            k: 返回结果数量
+            filter: 过滤条件，目前支持 {"doc_id": 文档ID 或 文档ID列表}
+
+        返回:
+            按分数从高到低排序的 (Document, BM25 分数) 列表
+        """
+        doc_ids = None
+        if filter and "doc_id" in filter:
+            value = filter["doc_id"]
+            doc_ids = value if isinstance(value, (list, tuple, set)) else [value]
+        return self.get_index(kb_id).search(query, k=k, doc_ids=doc_ids)
+
+    def stats(self, kb_id: str) -> dict:
+        """返回知识库关键词索引的统计信息"""
+        return self.get_index(kb_id).stats()
+
+
+# 实例化关键词检索服务
+keyword_service = KeywordService()
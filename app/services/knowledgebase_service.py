@@ -2,9 +2,23 @@ from app.models.knowledgebase import Knowledgebase
 from app.services.base_service import BaseService
 import os
 from app.services.storage_service import storage_service
+from app.services.vector_service import vector_service
+from app.services.vectordb.base import INDEX_TYPES, METRIC_TYPES
+from app.services.keyword_service import keyword_service
+from app.utils.query_cache import invalidate_kb
 from app.config import Config
 from sqlalchemy.exc import IntegrityError
 
+# 向量检索参数 -> 系统设置中对应的默认值字段
+SEARCH_PARAM_SETTINGS = {"nprobe": "vector_nprobe", "ef": "vector_ef"}
+# 知识库的索引配置字段 -> 集合选项名称
+INDEX_OPTION_FIELDS = {
+    "vector_precision": "precision",
+    "metric_type": "metric_type",
+    "index_type": "index_type",
+    "index_params": "index_params",
+}
+
 
 class KnowledgebaseService(BaseService[Knowledgebase]):
     def create(
@@ -16,7 +30,14 @@ class KnowledgebaseService(BaseService[Knowledgebase]):
         chunk_overlap,
         cover_image_data,
         cover_image_filename,
+        vector_precision=None,
     ):
+        # 只接受当前向量库后端实际支持的精度，避免设置了不生效的精度
+        precisions = vector_service.SUPPORTED_PRECISIONS
+        if vector_precision and vector_precision not in precisions:
+            raise ValueError(
+                f"不支持的向量存储精度:{vector_precision},支持的精度为{', '.join(precisions)}"
+            )
         if cover_image_data and cover_image_filename:
             # 获取不带.的文件扩展名
             file_ext_without_dot = (
@@ -45,6 +66,7 @@ class KnowledgebaseService(BaseService[Knowledgebase]):
                     description=description,
                     chunk_size=chunk_size,
                     chunk_overlap=chunk_overlap,
+                    vector_precision=vector_precision or None,
                 )
                 # 将知识库对象添加到session
                 session.add(kb)
@@ -117,7 +139,23 @@ class KnowledgebaseService(BaseService[Knowledgebase]):
                 return False
             session.delete(kb)
             self.logger.info(f"删除知识库:{kb_id} {kb.name}")
-            return True
+        # 删除该知识库的向量集合（同时释放集合的缓存句柄）
+        try:
+            deleted = vector_service.delete_collection(f"kb_{kb_id}")
+            self.logger.info(f"已删除知识库 {kb_id} 的 {deleted} 个向量")
+        except Exception as e:
+            self.logger.warning(f"删除知识库 {kb_id} 的向量集合失败: {e}")
+            vector_service.release_collection(f"kb_{kb_id}")
+        # 删除该知识库的关键词索引
+        keyword_service.delete_index(kb_id)
+        # 使该知识库的检索缓存失效
+        invalidate_kb(kb_id)
+        return True
+
+    def warm_up(self, kb_ids):
+        """预热知识库对应的向量集合，提前完成句柄创建和集合加载"""
+        vector_service.warm_up([f"kb_{kb_id}" for kb_id in kb_ids])
+        self.logger.info(f"已预热知识库:{kb_ids}")
 
     #   def get_by_id(self, kb_id):
     #       kb = super().get_by_id(Knowledgebase, kb_id)
@@ -175,4 +213,170 @@ class KnowledgebaseService(BaseService[Knowledgebase]):
             return kb_dict
 
 
+    def get_index_options(self, kb_id: str) -> dict:
+        """
+        读取知识库向量集合的创建选项，向量库创建集合句柄时调用
+
+        参数:
+            kb_id: 知识库ID
+
+        返回:
+            选项字典，如 {"precision": "int8", "index_type": "HNSW"}，只包含已设置的选项
+        """
+        with self.session() as session:
+            row = (
+                session.query(
+                    Knowledgebase.vector_precision,
+                    Knowledgebase.metric_type,
+                    Knowledgebase.index_type,
+                    Knowledgebase.index_params,
+                )
+                .filter(Knowledgebase.id == kb_id)
+                .first()
+            )
+        if row is None:
+            return {}
+        options = {
+            "precision": row.vector_precision,
+            "metric_type": row.metric_type,
+            "index_type": row.index_type,
+            "index_params": row.index_params,
+        }
+        return {key: value for key, value in options.items() if value}
+
+    def update_index_config(self, kb_id: str, data: dict):
+        """
+        修改知识库的向量索引配置，需要调用 rebuild_vector_index 重建后才会应用到已有数据。
+        当前后端无法应用到已有集合的选项（如 numpy 的度量类型、Chroma 的所有选项），
+        在集合创建后不能修改
+
+        参数:
+            kb_id: 知识库ID
+            data: 可包含 vector_precision、metric_type、index_type、index_params，
+                取值为 None 表示使用默认值，未包含的字段保持不变
+
+        返回:
+            更新后的知识库字典，知识库不存在时返回 None
+        """
+        allowed = {
+            "vector_precision": vector_service.SUPPORTED_PRECISIONS,
+            "metric_type": METRIC_TYPES,
+            "index_type": INDEX_TYPES,
+        }
+        updates = {}
+        for key, value in data.items():
+            if key in allowed:
+                if value is not None and value not in allowed[key]:
+                    raise ValueError(
+                        f"不支持的{key}:{value},支持的取值为{', '.join(allowed[key])}"
+                    )
+                updates[key] = value or None
+            elif key == "index_params":
+                if value is not None and (
+                    not isinstance(value, dict)
+                    or not all(
+                        isinstance(v, (int, float, str)) and not isinstance(v, bool)
+                        for v in value.values()
+                    )
+                ):
+                    raise ValueError("索引构建参数必须是取值为数字或字符串的对象")
+                updates[key] = value or None
+            else:
+                raise ValueError(f"不支持的索引配置:{key}")
+        collection_name = f"kb_{kb_id}"
+        with self.transaction() as session:
+            kb = session.query(Knowledgebase).filter(Knowledgebase.id == kb_id).first()
+            if not kb:
+                return None
+            fixed = [
+                key
+                for key, value in updates.items()
+                if INDEX_OPTION_FIELDS[key] in vector_service.FIXED_OPTIONS
+                and getattr(kb, key) != value
+            ]
+            if fixed and vector_service.collection_exists(collection_name):
+                raise ValueError(
+                    f"当前向量库不支持修改已创建集合的{', '.join(fixed)}，请新建知识库"
+                )
+            for key, value in updates.items():
+                setattr(kb, key, value)
+            session.flush()
+            kb_dict = kb.to_dict()
+        # 集合句柄在创建时读取选项，释放后下次使用时重新读取
+        vector_service.release_collection(collection_name)
+        self.logger.info(f"更新知识库 {kb_id} 的索引配置: {updates}")
+        return kb_dict
+
+    def rebuild_vector_index(self, kb_id: str) -> None:
+        """按知识库当前的索引配置原地重建向量索引，并使检索缓存失效"""
+        vector_service.rebuild_index(f"kb_{kb_id}")
+        invalidate_kb(kb_id)
+        self.logger.info(f"已重建知识库 {kb_id} 的向量索引")
+
+    def get_search_params(self, kb_id: str, settings: dict) -> dict:
+        """
+        解析知识库的向量检索参数：系统设置中的默认值，被知识库自己的 search_params 覆盖
+
+        参数:
+            kb_id: 知识库ID
+            settings: 系统设置字典
+
+        返回:
+            检索参数字典，如 {"nprobe": 16, "ef": 64}
+        """
+        params = {
+            key: int(settings[field])
+            for key, field in SEARCH_PARAM_SETTINGS.items()
+            if settings.get(field)
+        }
+        with self.session() as session:
+            overrides = (
+                session.query(Knowledgebase.search_params)
+                .filter(Knowledgebase.id == kb_id)
+                .scalar()
+            )
+        params.update(overrides or {})
+        return params
+
+    def update_search_params(self, kb_id: str, params: dict):
+        """
+        设置知识库的向量检索参数
+
+        参数:
+            kb_id: 知识库ID
+            params: 检索参数，只支持 nprobe 和 ef，取值为正整数，为 None 时使用系统设置
+
+        返回:
+            更新后的知识库字典，知识库不存在时返回 None
+        """
+        if not isinstance(params, dict):
+            raise ValueError("检索参数必须是对象")
+        cleaned = {}
+        for key, value in params.items():
+            if key not in SEARCH_PARAM_SETTINGS:
+                raise ValueError(
+                    f"不支持的检索参数:{key},支持的参数为{', '.join(SEARCH_PARAM_SETTINGS)}"
+                )
+            if value is None:
+                continue
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"检索参数 {key} 必须是正整数")
+            if value <= 0:
+                raise ValueError(f"检索参数 {key} 必须是正整数")
+            cleaned[key] = value
+        with self.transaction() as session:
+            kb = session.query(Knowledgebase).filter(Knowledgebase.id == kb_id).first()
+            if not kb:
+                return None
+            kb.search_params = cleaned or None
+            session.flush()
+            kb_dict = kb.to_dict()
+        # 检索参数影响近似检索的结果，使检索缓存失效
+        invalidate_kb(kb_id)
+        self.logger.info(f"更新知识库 {kb_id} 的检索参数: {cleaned}")
+        return kb_dict
+
+
 kb_service = KnowledgebaseService()
@@ -7,7 +7,7 @@
 import logging
 
 # 导入类型注解 List
-from typing import List
+from typing import Iterator, List
 
 # 导入 LangChain 的 Document 类型
 from langchain_core.documents import Document
@@ -40,6 +40,20 @@ class ParserService:
         # 调用文档加载器，加载文档并返回 Document 列表
         return DocumentLoader.load(file_data, file_type)
 
+    # 惰性解析接口，按页产出 LangChain Document
+    def iter_parse(self, file_path: str, file_type: str) -> Iterator[Document]:
+        """
+        惰性解析本地文件（逐页产出 LangChain Document）
+
+        Args:
+            file_path: 本地文件路径
+            file_type: 文件类型（pdf/docx/txt/md）
+
+        Yields:
+            LangChain Document
+        """
+        return DocumentLoader.lazy_load(file_path, file_type.lower())
+
 
 # 创建 ParserService 的单例实例
 parser_service = ParserService()
@@ -0,0 +1,362 @@
+"""
+检索服务
+根据系统设置执行向量检索、关键词检索或混合检索
+"""
+
+# 导入copy模块，用于复制缓存结果
+import copy
+
+# 导入time模块，用于统计各阶段耗时
+import time
+
+# 导入线程池，用于并发执行向量检索和关键词检索
+from concurrent.futures import ThreadPoolExecutor
+
+# 导入类型提示
+from typing import Dict, List, Optional, Tuple
+
+# 导入numpy，用于分数归一化和融合
+import numpy as np
+
+# 导入 LangChain 的 Document 类型
+from langchain_core.documents import Document
+
+# 导入全局配置
+from app.config import Config
+
+# 导入分块存储服务，分块序号从分块表中查询
+from app.services.chunk_service import chunk_service
+
+# 导入关键词检索服务
+from app.services.keyword_service import keyword_service
+
+# 导入知识库服务，用于解析知识库的向量检索参数
+from app.services.knowledgebase_service import kb_service
+
+# 导入设置服务
+from app.services.settings_service import settings_service
+
+# 导入向量数据库服务
+from app.services.vector_service import vector_service
+
+# 导入日志工具
+from app.utils.logger import get_logger
+
+# 导入检索结果缓存
+from app.utils.query_cache import (
+    get_generation_store,
+    get_query_cache,
+    normalize_query,
+)
+
+# 支持的检索模式，hybird 为设置中历史遗留的拼写
+RETRIEVAL_MODES = {"vector": "vector", "keyword": "keyword", "hybrid": "hybrid", "hybird": "hybrid"}
+# 支持的融合方式：加权求和、倒数排名融合
+FUSION_METHODS = ("weighted", "rrf")
+
+
+class RetrievalService:
+    """检索服务"""
+
+    def __init__(self):
+        self.logger = get_logger(self.__class__.__name__)
+        # 进程内共享的线程池，避免每次检索创建线程
+        self._executor = ThreadPoolExecutor(
+            max_workers=Config.RETRIEVAL_WORKERS, thread_name_prefix="retrieval"
+        )
+
+    def retrieve(
+        self,
+        kb_id: str,
+        query: str,
+        mode: Optional[str] = None,
+        top_k: Optional[int] = None,
+        vector_threshold: Optional[float] = None,
+        keyword_threshold: Optional[float] = None,
+        vector_weight: Optional[float] = None,
+        fusion: Optional[str] = None,
+        filter: Optional[Dict] = None,
+    ) -> dict:
+        """
+        在知识库中检索，未指定的参数使用系统设置
+
+        参数:
+            kb_id: 知识库ID
+            query: 查询文本
+            mode: 检索模式 vector / keyword / hybrid
+            top_k: 返回结果数量
+            vector_threshold: 向量检索相关度阈值（归一化到 [0, 1] 后）
+            keyword_threshold: 关键词检索相关度阈值（归一化到 [0, 1] 后）
+            vector_weight: 混合检索时向量检索的权重
+            fusion: 混合检索的融合方式 weighted / rrf
+            filter: 元数据过滤条件，例如 {"doc_id": "xxx"}
+
+        返回:
+            包含 results、mode、fusion 和 timings（毫秒）的字典
+        """
+        start = time.perf_counter()
+        settings = settings_service.get()
+        mode = RETRIEVAL_MODES.get(
+            (mode or settings.get("retrieval_mode") or "vector").lower()
+        )
+        if mode is None:
+            raise ValueError("检索模式必须是 vector、keyword 或 hybrid")
+        fusion = (fusion or Config.RETRIEVAL_FUSION).lower()
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"融合方式必须是 {' 或 '.join(FUSION_METHODS)}")
+        top_k = int(top_k if top_k is not None else settings.get("top_k") or 5)
+        if top_k < 1:
+            raise ValueError("top_k 必须是正整数")
+        vector_threshold = float(
+            vector_threshold
+            if vector_threshold is not None
+            else settings.get("vector_threshold") or 0.0
+        )
+        keyword_threshold = float(
+            keyword_threshold
+            if keyword_threshold is not None
+            else settings.get("keyword_threshold") or 0.0
+        )
+        vector_weight = float(
+            vector_weight
+            if vector_weight is not None
+            else settings.get("vector_weight")
+            if settings.get("vector_weight") is not None
+            else 0.5
+        )
+        for name, value in (
+            ("vector_threshold", vector_threshold),
+            ("keyword_threshold", keyword_threshold),
+            ("vector_weight", vector_weight),
+        ):
+            if not 0.0 <= value <= 1.0:
+                raise ValueError(f"{name} 必须在 [0, 1] 范围内")
+        # 向量检索参数（nprobe / ef），知识库的设置覆盖系统设置
+        search_params = (
+            kb_service.get_search_params(kb_id, settings)
+            if mode in ("vector", "hybrid")
+            else {}
+        )
+        timings: Dict[str, float] = {}
+
+        # 查询缓存：键包含知识库代数，文档处理或删除后旧结果自然失效
+        cache_key = None
+        if Config.QUERY_CACHE_ENABLED:
+            cache_key = (
+                kb_id,
+                get_generation_store().get(kb_id),
+                normalize_query(query),
+                mode,
+                top_k,
+                vector_threshold,
+                keyword_threshold,
+                vector_weight,
+                fusion,
+                repr(sorted((filter or {}).items())),
+                repr(sorted(search_params.items())),
+                settings.get("embedding_provider"),
+                settings.get("embedding_model_name"),
+            )
+            cached = get_query_cache().get(cache_key)
+            if cached is not None:
+                result = copy.deepcopy(cached)
+                result["cached"] = True
+                result["timings"] = {
+                    "total_ms": round((time.perf_counter() - start) * 1000, 2)
+                }
+                return result
+
+        # 混合检索时每一路多取一些候选，融合后再截断
+        candidate_k = (
+            top_k * Config.RETRIEVAL_CANDIDATE_MULTIPLIER if mode == "hybrid" else top_k
+        )
+
+        # 向量检索和关键词检索并发执行，总耗时取决于较慢的一路
+        vector_future = keyword_future = None
+        if mode in ("vector", "hybrid"):
+            vector_future = self._executor.submit(
+                self._vector_search,
+                kb_id,
+                query,
+                candidate_k,
+                filter,
+                search_params,
+                timings,
+            )
+        if mode in ("keyword", "hybrid"):
+            keyword_future = self._executor.submit(
+                self._keyword_search, kb_id, query, candidate_k, filter, timings
+            )
+        vector_hits = vector_future.result() if vector_future else []
+        keyword_hits = keyword_future.result() if keyword_future else []
+
+        # 过滤低于阈值的结果并融合
+        fusion_start = time.perf_counter()
+        vector_hits = [hit for hit in vector_hits if hit[1] >= vector_threshold]
+        keyword_hits = [hit for hit in keyword_hits if hit[1] >= keyword_threshold]
+        if mode == "vector":
+            results = self._to_results(vector_hits, vector_hits, [], top_k)
+        elif mode == "keyword":
+            results = self._to_results(keyword_hits, [], keyword_hits, top_k)
+        else:
+            results = self._fuse(vector_hits, keyword_hits, vector_weight, fusion, top_k)
+        # 向量库的元数据中没有分块序号，统一从分块表中补齐
+        indexes = chunk_service.get_chunk_indexes([item["chunk_id"] for item in results])
+        for item in results:
+            item["chunk_index"] = indexes.get(item["chunk_id"], item["chunk_index"])
+        timings["fusion_ms"] = (time.perf_counter() - fusion_start) * 1000
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+        timings = {key: round(value, 2) for key, value in timings.items()}
+        self.logger.info(
+            f"检索完成: 知识库 {kb_id}, 模式 {mode}, 结果 {len(results)} 个, 耗时 {timings}"
+        )
+        result = {
+            "results": results,
+            "mode": mode,
+            "fusion": fusion if mode == "hybrid" else None,
+            "timings": timings,
+            "cached": False,
+        }
+        if cache_key is not None:
+            get_query_cache().put(cache_key, copy.deepcopy(result))
+        return result
+
+    def cache_stats(self) -> dict:
+        """返回检索结果缓存的命中率等统计信息"""
+        return get_query_cache().stats()
+
+    # 向量检索，返回 [0, 1] 的相关度
+    def _vector_search(
+        self,
+        kb_id: str,
+        query: str,
+        k: int,
+        filter: Optional[Dict],
+        search_params: Dict,
+        timings: Dict[str, float],
+    ) -> List[Tuple[Document, float]]:
+        collection_name = f"kb_{kb_id}"
+        start = time.perf_counter()
+        vector = vector_service.embed_query(query)
+        timings["embed_ms"] = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        hits = vector_service.search_by_vector(
+            collection_name, vector, k=k, filter=filter, search_params=search_params
+        )
+        relevance = vector_service.relevance_scores(
+            collection_name, [score for _, score in hits]
+        )
+        timings["vector_ms"] = (time.perf_counter() - start) * 1000
+        return [(doc, float(score)) for (doc, _), score in zip(hits, relevance)]
+
+    # 关键词检索，BM25 分数除以本次检索的最高分，归一化到 [0, 1]
+    def _keyword_search(
+        self,
+        kb_id: str,
+        query: str,
+        k: int,
+        filter: Optional[Dict],
+        timings: Dict[str, float],
+    ) -> List[Tuple[Document, float]]:
+        start = time.perf_counter()
+        hits = keyword_service.search(kb_id, query, k=k, filter=filter)
+        scores = np.asarray([score for _, score in hits], dtype=np.float32)
+        if len(scores) and scores.max() > 0:
+            scores = scores / scores.max()
+        timings["keyword_ms"] = (time.perf_counter() - start) * 1000
+        return [(doc, float(score)) for (doc, _), score in zip(hits, scores)]
+
+    # 分块ID：优先使用元数据中的 chunk_id
+    @staticmethod
+    def _chunk_id(doc: Document) -> str:
+        return doc.metadata.get("chunk_id") or doc.metadata.get("id") or doc.id
+
+    # 融合两路结果
+    def _fuse(
+        self,
+        vector_hits: List[Tuple[Document, float]],
+        keyword_hits: List[Tuple[Document, float]],
+        vector_weight: float,
+        fusion: str,
+        top_k: int,
+    ) -> List[dict]:
+        # 两路结果按分块ID合并
+        docs: Dict[str, Document] = {}
+        for doc, _ in vector_hits + keyword_hits:
+            docs.setdefault(self._chunk_id(doc), doc)
+        if not docs:
+            return []
+        ids = list(docs)
+        position = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        vector_scores = np.zeros(len(ids), dtype=np.float32)
+        keyword_scores = np.zeros(len(ids), dtype=np.float32)
+        # 排名从 1 开始，未命中的一路排名为无穷大
+        vector_ranks = np.full(len(ids), np.inf, dtype=np.float32)
+        keyword_ranks = np.full(len(ids), np.inf, dtype=np.float32)
+        for rank, (doc, score) in enumerate(vector_hits, start=1):
+            i = position[self._chunk_id(doc)]
+            vector_scores[i], vector_ranks[i] = score, rank
+        for rank, (doc, score) in enumerate(keyword_hits, start=1):
+            i = position[self._chunk_id(doc)]
+            keyword_scores[i], keyword_ranks[i] = score, rank
+
+        if fusion == "rrf":
+            k = Config.RRF_K
+            fused = vector_weight / (k + vector_ranks) + (1 - vector_weight) / (
+                k + keyword_ranks
+            )
+        else:
+            fused = vector_weight * vector_scores + (1 - vector_weight) * keyword_scores
+
+        order = np.argsort(-fused, kind="stable")[:top_k]
+        return [
+            self._to_result(
+                docs[ids[i]],
+                float(fused[i]),
+                float(vector_scores[i]) if np.isfinite(vector_ranks[i]) else None,
+                float(keyword_scores[i]) if np.isfinite(keyword_ranks[i]) else None,
+            )
+            for i in order
+        ]
+
+    # 将单路检索结果转换为返回格式
+    def _to_results(
+        self,
+        hits: List[Tuple[Document, float]],
+        vector_hits: List[Tuple[Document, float]],
+        keyword_hits: List[Tuple[Document, float]],
+        top_k: int,
+    ) -> List[dict]:
+        return [
+            self._to_result(
+                doc,
+                score,
+                score if vector_hits else None,
+                score if keyword_hits else None,
+            )
+            for doc, score in hits[:top_k]
+        ]
+
+    # 单个结果的返回格式
+    def _to_result(
+        self,
+        doc: Document,
+        score: float,
+        vector_score: Optional[float],
+        keyword_score: Optional[float],
+    ) -> dict:
+        metadata = doc.metadata
+        return {
+            "chunk_id": self._chunk_id(doc),
+            "doc_id": metadata.get("doc_id"),
+            "doc_name": metadata.get("doc_name"),
+            "chunk_index": metadata.get("chunk_index"),
+            "content": doc.page_content,
+            "score": round(score, 6),
+            "vector_score": None if vector_score is None else round(vector_score, 6),
+            "keyword_score": None if keyword_score is None else round(keyword_score, 6),
+        }
+
+
+# 实例化检索服务
+retrieval_service = RetrievalService()
@@ -35,6 +35,8 @@ class SettingsService(BaseService[Settings]):
             "keyword_threshold": 0.0,  # 关键词检索阈值
             "vector_weight": 0.7,  # 检索混合权重
             "top_k": 5,  # 返回结果数量
+            "vector_nprobe": 16,  # IVF 检索扫描的倒排列表数
+            "vector_ef": 64,  # HNSW 检索的 ef
         }
 
     def update(self, data):
@@ -48,7 +50,17 @@ class SettingsService(BaseService[Settings]):
                     setattr(settings, key, value)
             session.flush()
             session.refresh(settings)
-            return settings.to_dict()
+            settings_dict = settings.to_dict()
+        # 事务提交后，如果 Embedding 相关字段发生变化，则切换共享的 Embedding 模型
+        # 在函数内导入，避免与 embedding_factory 循环导入
+        from app.utils.embedding_factory import embedding_registry
+
+        if embedding_registry.is_embedding_change(data):
+            try:
+                embedding_registry.reload(settings_dict)
+            except Exception as e:
+                self.logger.error(f"切换 Embedding 模型失败，继续使用旧模型: {e}")
+        return settings_dict
 
 
 settings_service = SettingsService()
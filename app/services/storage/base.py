@@ -2,8 +2,14 @@
 存储服务抽象接口
 """
 
+import os
 from abc import ABC, abstractmethod
-from typing import Optional
+from contextlib import contextmanager
+from tempfile import NamedTemporaryFile
+from typing import BinaryIO, Iterator, Optional
+
+# 流式读写时每次处理的数据块大小 1M
+STREAM_CHUNK_SIZE = 1024 * 1024
 
 
 class StorageInterface(ABC):
@@ -59,3 +65,57 @@ class StorageInterface(ABC):
         Return 文件URL
         """
         pass
+
+    def upload_stream(self, file_path, stream: BinaryIO, length: int = -1):
+        """
+        以流的方式上传文件，不在内存中缓存完整内容
+
+        默认实现读取整个流后调用 upload_file，子类应覆盖为真正的流式写入
+
+        :param file_path: 文件路径 相对路径
+        :param stream: 可读的二进制流
+        :param length: 数据长度，未知时为 -1
+
+        return: 文件路径
+        """
+        return self.upload_file(file_path, stream.read())
+
+    def download_stream(
+        self, file_path, chunk_size: int = STREAM_CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        """
+        以数据块的方式下载文件
+
+        默认实现下载整个文件后分块返回，子类应覆盖为真正的流式读取
+
+        :param file_path: 文件路径 相对路径
+        :param chunk_size: 每个数据块的大小
+
+        return: 数据块生成器
+        """
+        data = self.download_file(file_path)
+        for start in range(0, len(data), chunk_size):
+            yield data[start : start + chunk_size]
+
+    @contextmanager
+    def open_local_file(self, file_path) -> Iterator[str]:
+        """
+        获取文件在本地文件系统中的路径，供需要按路径读取的解析器使用
+
+        默认实现把文件下载到临时文件，退出上下文时删除；
+        子类可以覆盖此方法以避免多余的拷贝
+
+        :param file_path: 文件路径 相对路径
+
+        return: 本地文件的绝对路径
+        """
+        suffix = os.path.splitext(file_path)[1]
+        with NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+            for chunk in self.download_stream(file_path):
+                tmp_file.write(chunk)
+            tmp_path = tmp_file.name
+        try:
+            yield tmp_path
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
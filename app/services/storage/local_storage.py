@@ -1,6 +1,7 @@
-from app.services.storage.base import StorageInterface
+from app.services.storage.base import StorageInterface, STREAM_CHUNK_SIZE
 from app.config import Config
 import os
+from contextlib import contextmanager
 from pathlib import Path
 from app.utils.logger import get_logger
 
@@ -32,6 +33,50 @@ class LocalStorage(StorageInterface):
         logger.info(f"文件已经上传:{file_path}")
         return file_path
 
+    def upload_stream(self, file_path, stream, length=-1):
+        """
+        分块把流写入文件，先写临时文件再重命名，避免中途失败留下不完整的文件
+
+        :param file_path: 文件路径 相对路径
+        :param stream: 可读的二进制流
+        :param length: 数据长度，本地存储不需要
+        """
+        full_path = self._get_full_path(file_path)
+        # 保证文件路径的父目录是存在
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = full_path.with_name(full_path.name + ".part")
+        try:
+            with open(tmp_path, "wb") as f:
+                while True:
+                    chunk = stream.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            os.replace(tmp_path, full_path)
+        except Exception:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+        logger.info(f"文件已经上传:{file_path}")
+        return file_path
+
+    def download_stream(self, file_path, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        分块读取文件
+
+        :param file_path: 文件路径 相对路径
+        :param chunk_size: 每个数据块的大小
+
+        return: 数据块生成器
+        """
+        full_path = self._get_full_path(file_path)
+        with open(full_path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
     def download_file(self, file_path):
         """
         下载文件
@@ -50,6 +95,20 @@ class LocalStorage(StorageInterface):
             logger.error(f"文件下载出错:{e}")
             raise
 
+    @contextmanager
+    def open_local_file(self, file_path):
+        """
+        本地存储的文件本身就在磁盘上，直接返回其路径，无需拷贝
+
+        :param file_path: 文件路径 相对路径
+
+        return: 本地文件的绝对路径
+        """
+        full_path = self._get_full_path(file_path)
+        if not full_path.exists():
+            raise FileNotFoundError(f"文件不存在:{full_path}")
+        yield str(full_path)
+
     def delete_file(self, file_path):
         """
         删除文件
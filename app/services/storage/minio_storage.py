@@ -1,7 +1,9 @@
-from app.services.storage.base import StorageInterface
+from app.services.storage.base import StorageInterface, STREAM_CHUNK_SIZE
 from app.config import Config
 import os
+from contextlib import contextmanager
 from pathlib import Path
+from tempfile import NamedTemporaryFile
 from app.utils.logger import get_logger
 from minio import Minio
 from minio.error import S3Error
@@ -9,6 +11,9 @@ from io import BytesIO
 
 logger = get_logger(__name__)
 
+# 未知长度上传时的分片大小，MinIO 要求最小 5M
+MULTIPART_PART_SIZE = 10 * 1024 * 1024
+
 
 class MinIOStorage(StorageInterface):
     def __init__(self):
@@ -48,6 +53,45 @@ class MinIOStorage(StorageInterface):
             logger.error(f"上传文件到minio服务器时报错:{e}")
             raise
 
+    def upload_stream(self, file_path, stream, length=-1):
+        """
+        以流的方式上传文件，长度未知时使用分片上传
+
+        :param file_path: 文件路径 相对路径
+        :param stream: 可读的二进制流
+        :param length: 数据长度，未知时为 -1
+        """
+        try:
+            self.client.put_object(
+                self.bucket_name,
+                file_path,
+                stream,
+                length=length,
+                part_size=MULTIPART_PART_SIZE if length < 0 else 0,
+            )
+            logger.info(f"上传到mino文件{file_path}成功")
+            return file_path
+        except Exception as e:
+            logger.error(f"上传文件到minio服务器时报错:{e}")
+            raise
+
+    def download_stream(self, file_path, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        分块读取对象数据
+
+        :param file_path: 文件路径 相对路径
+        :param chunk_size: 每个数据块的大小
+
+        return: 数据块生成器
+        """
+        response = self.client.get_object(self.bucket_name, file_path)
+        try:
+            yield from response.stream(chunk_size)
+        finally:
+            # 关闭响应并释放连接
+            response.close()
+            response.release_conn()
+
     def download_file(self, file_path):
         """
         下载文件
@@ -71,6 +115,26 @@ class MinIOStorage(StorageInterface):
             logger.error(f"文件下载出错:{e}")
             raise
 
+    @contextmanager
+    def open_local_file(self, file_path):
+        """
+        将对象流式下载到临时文件（不在内存中缓存完整内容），退出上下文时删除
+
+        :param file_path: 文件路径 相对路径
+
+        return: 本地临时文件的路径
+        """
+        suffix = os.path.splitext(file_path)[1]
+        with NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+            tmp_path = tmp_file.name
+        try:
+            self.client.fget_object(self.bucket_name, file_path, tmp_path)
+            logger.info(f"从mino中下载文件{file_path}到{tmp_path}成功")
+            yield tmp_path
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
     def delete_file(self, file_path):
         """
         删除文件
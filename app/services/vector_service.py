@@ -5,5 +5,18 @@
 
 from app.services.vectordb.factory import get_vector_db_service
 
+
+
+# 知识库集合的创建选项（存储精度等），集合名称为 kb_<知识库ID>
+def _collection_options(collection_name: str) -> dict:
+    if not collection_name.startswith("kb_"):
+        return {}
+    # 在函数内导入，避免与 knowledgebase_service 循环导入
+    from app.services.knowledgebase_service import kb_service
+
+    return kb_service.get_index_options(collection_name[len("kb_") :])
+
+
 # 创建默认实例（使用全局设置）
 vector_service = get_vector_db_service()
+vector_service.set_options_resolver(_collection_options)
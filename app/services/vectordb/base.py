@@ -2,24 +2,142 @@
 向量数据库抽象接口
 """
 
+# 导入日志模块
+import logging
+
 # 导入 abc 库，定义抽象基类和抽象方法
 from abc import ABC, abstractmethod
 
+# 导入线程池，用于多集合并发检索
+from concurrent.futures import ThreadPoolExecutor
+
 # 导入类型提示：列表、字典、可选和任意类型
-from typing import List, Dict, Optional, Any
+from typing import Callable, Iterable, List, Dict, Optional, Any, Tuple
+
+# 导入numpy，用于批量归一化分数
+import numpy as np
 
 # 导入 LangChain 的 Document 类，用于文档对象
 from langchain_core.documents import Document
 
+# 导入 LangChain 的 Embeddings 类型
+from langchain_core.embeddings import Embeddings
+
+# 导入带缓存的 Embeddings 包装类和不经缓存的批量查询向量化函数
+from app.utils.embedding_cache import CachedEmbeddings, embed_queries_uncached
+
+# 导入嵌入模型工厂
+from app.utils.embedding_factory import EmbeddingFactory
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 集合支持的向量存储精度：全精度、半精度、按维度缩放的 int8、乘积量化
+VECTOR_PRECISIONS = ("float32", "float16", "int8", "pq")
+# 集合支持的度量类型
+METRIC_TYPES = ("L2", "IP", "COSINE")
+# 可以按集合配置的 Milvus 索引类型，其他后端忽略
+INDEX_TYPES = (
+    "AUTOINDEX",
+    "FLAT",
+    "IVF_FLAT",
+    "IVF_SQ8",
+    "IVF_PQ",
+    "HNSW",
+    "SCANN",
+    "DISKANN",
+)
+
 
 # 定义一个向量数据库的抽象接口，继承自 ABC 抽象基类
 class VectorDBInterface(ABC):
     """向量数据库抽象接口"""
 
+    # 后端实际支持的存储精度，创建知识库时按当前后端校验
+    SUPPORTED_PRECISIONS: Tuple[str, ...] = VECTOR_PRECISIONS
+
+    # 只在创建集合时生效、rebuild_index 无法应用到已有集合的选项（collection_options 的字段）
+    FIXED_OPTIONS: Tuple[str, ...] = ()
+
+    # 集合选项解析函数：集合名称 -> 选项字典（如 {"precision": "int8"}），由服务层注册
+    _options_resolver: Optional[Callable[[str], Dict]] = None
+
+    # 当前生效的 Embedding 模型，由进程级注册表统一管理，所有后端共享同一个实例
+    @property
+    def embeddings(self) -> Embeddings:
+        return EmbeddingFactory.get_embeddings()
+
     @abstractmethod
     def get_or_create_collection(self, collection_name: str) -> Any:
         pass
 
+    def set_options_resolver(self, resolver: Callable[[str], Dict]) -> None:
+        """
+        注册集合选项解析函数，后端创建集合时用它读取集合的存储精度等选项
+
+        Args:
+            resolver: 集合名称 -> 选项字典
+        """
+        self._options_resolver = resolver
+
+    def collection_options(self, collection_name: str) -> Dict:
+        """
+        读取集合的创建选项，只在创建集合句柄时调用；解析失败时使用默认选项
+
+        Args:
+            collection_name: 集合名称
+
+        Returns:
+            选项字典，可能包含 precision（VECTOR_PRECISIONS 之一）、metric_type
+            （METRIC_TYPES 之一）、index_type（INDEX_TYPES 之一）和 index_params（索引构建参数）
+        """
+        if self._options_resolver is None:
+            return {}
+        try:
+            return self._options_resolver(collection_name) or {}
+        except Exception as e:
+            logger.warning(f"读取集合 {collection_name} 的选项失败，使用默认选项: {e}")
+            return {}
+
+    def collection_exists(self, collection_name: str) -> bool:
+        """
+        集合是否已经创建，用于判断 FIXED_OPTIONS 中的选项能否修改；
+        默认认为已创建，这些选项始终不能修改
+
+        Args:
+            collection_name: 集合名称
+        """
+        return True
+
+    def rebuild_index(self, collection_name: str) -> None:
+        """
+        按集合当前的选项原地重建向量索引，数据保留，用于修改索引类型、构建参数或存储精度之后
+
+        Args:
+            collection_name: 集合名称
+        """
+        raise ValueError(f"{self.__class__.__name__} 不支持重建向量索引")
+
+    def release_collection(self, collection_name: str) -> None:
+        """
+        释放集合相关的缓存资源（例如知识库被删除时），默认无需操作
+
+        Args:
+            collection_name: 集合名称
+        """
+        pass
+
+    def warm_up(self, collection_names: Iterable[str]) -> None:
+        """
+        预热集合：提前创建集合句柄，需要加载集合的后端会同时完成加载，
+        避免第一次查询承担初始化耗时
+
+        Args:
+            collection_names: 集合名称列表
+        """
+        for collection_name in collection_names:
+            self.get_or_create_collection(collection_name)
+
     @abstractmethod
     def add_documents(
         self,
@@ -40,13 +158,44 @@ class VectorDBInterface(ABC):
         """
         pass
 
+    @abstractmethod
+    def add_embeddings(
+        self,
+        collection_name: str,
+        documents: List[Document],
+        embeddings: List[List[float]],
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """
+        添加已经计算好向量的文档到向量存储（不再调用 Embedding 模型）
+
+        Args:
+            collection_name: 集合名称
+            documents: Document 列表
+            embeddings: 与 documents 一一对应的向量列表
+            ids: 文档ID列表（可选）
+
+        Returns:
+            添加的文档ID列表
+        """
+        pass
+
+    def flush(self, collection_name: str) -> None:
+        """
+        将之前写入的数据持久化，默认无需操作，需要显式刷新的后端可以覆盖
+
+        Args:
+            collection_name: 集合名称
+        """
+        pass
+
     @abstractmethod
     def delete_documents(
         self,
         collection_name: str,
         ids: Optional[List[str]] = None,
         filter: Optional[Dict] = None,
-    ) -> None:
+    ) -> int:
         """
         删除文档
 
@@ -54,10 +203,197 @@ class VectorDBInterface(ABC):
             collection_name: 集合名称
             ids: 要删除的文档ID列表（可选）
             filter: 过滤条件（可选）
+
+        Returns:
+            删除的文档数
         """
         # 子类需要实现具体逻辑
         pass
 
+    @abstractmethod
+    def delete_collection(self, collection_name: str) -> int:
+        """
+        删除整个集合（例如知识库被删除时），同时释放集合的缓存资源
+
+        Args:
+            collection_name: 集合名称
+
+        Returns:
+            集合中被删除的文档数，集合不存在时为 0
+        """
+        pass
+
+    @abstractmethod
+    def get_ids(self, collection_name: str, filter: Dict) -> List[str]:
+        """
+        查询满足过滤条件的所有文档ID（只返回ID，不读取向量和文本）
+
+        Args:
+            collection_name: 集合名称
+            filter: 过滤条件，例如 {"doc_id": "xxx"}
+
+        Returns:
+            文档ID列表，集合不存在时返回空列表
+        """
+        pass
+
+    @abstractmethod
+    def list_chunks(
+        self, collection_name: str, doc_id: str, offset: int = 0, limit: int = 100
+    ) -> List[Document]:
+        """
+        按分块序号分页列出某个文档的分块，只用于分块表上线之前处理的文档：
+        这些文档的向量元数据中带有从 0 开始连续的 chunk_index，
+        按序号范围过滤，只读取当前页的分块（不计算查询向量）
+
+        Args:
+            collection_name: 集合名称
+            doc_id: 文档ID
+            offset: 当前页第一个分块的序号
+            limit: 最多返回的分块数
+
+        Returns:
+            chunk_index 在 [offset, offset + limit) 范围内的分块，按 chunk_index 升序排列
+        """
+        pass
+
+    def embed_query(self, query: str) -> List[float]:
+        """
+        计算查询向量，结果可以在多个集合、多次检索之间复用
+
+        Args:
+            query: 查询文本
+
+        Returns:
+            查询向量
+        """
+        return self.embeddings.embed_query(query)
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        批量计算多个查询的向量，一次模型调用完成
+
+        Args:
+            queries: 查询文本列表
+
+        Returns:
+            与 queries 一一对应的查询向量列表
+        """
+        if not queries:
+            return []
+        embeddings = self.embeddings
+        # 经过查询向量缓存，跳过文档向量缓存
+        if isinstance(embeddings, CachedEmbeddings):
+            return embeddings.embed_queries(queries)
+        return embed_queries_uncached(embeddings, queries)
+
+    def search_by_vector(
+        self,
+        collection_name: str,
+        vector: List[float],
+        k: int = 5,
+        filter: Optional[Dict] = None,
+        search_params: Optional[Dict] = None,
+    ) -> List[Tuple[Document, float]]:
+        """
+        使用已经计算好的查询向量检索
+
+        Args:
+            collection_name: 集合名称
+            vector: 查询向量
+            k: 返回结果数量
+            filter: 元数据过滤条件
+            search_params: 近似索引的检索参数，如 {"nprobe": 16, "ef": 64}
+
+        Returns:
+            (Document, score) 元组列表，score 的含义与 similarity_search_with_score 一致
+        """
+        return self.search_by_vectors(
+            collection_name, [vector], k=k, filter=filter, search_params=search_params
+        )[0]
+
+    @abstractmethod
+    def search_by_vectors(
+        self,
+        collection_name: str,
+        vectors: List[List[float]],
+        k: int = 5,
+        filter: Optional[Dict] = None,
+        search_params: Optional[Dict] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        使用多个查询向量批量检索，一次请求完成
+
+        Args:
+            collection_name: 集合名称
+            vectors: 查询向量列表
+            k: 每个查询返回的结果数量
+            filter: 元数据过滤条件
+            search_params: 近似索引的检索参数，如 {"nprobe": 16, "ef": 64}，
+                后端只使用自己支持的参数
+
+        Returns:
+            与 vectors 一一对应的 (Document, score) 元组列表
+        """
+        pass
+
+    def relevance_scores(
+        self, collection_name: str, scores: List[float]
+    ) -> np.ndarray:
+        """
+        将 search_by_vector(s) 返回的原始分数（距离或相似度）转换为 [0, 1] 的相关度，越大越相关
+
+        默认逐个调用 LangChain 向量存储的相关度函数，子类可以按度量类型批量计算
+
+        Args:
+            collection_name: 集合名称
+            scores: 原始分数列表
+
+        Returns:
+            相关度数组
+        """
+        if not scores:
+            return np.zeros(0, dtype=np.float32)
+        relevance_fn = self.get_or_create_collection(
+            collection_name
+        )._select_relevance_score_fn()
+        relevance = np.fromiter(
+            (relevance_fn(score) for score in scores), dtype=np.float32
+        )
+        return np.clip(relevance, 0.0, 1.0)
+
+    def search_collections(
+        self,
+        collection_names: List[str],
+        query: str,
+        k: int = 5,
+        filter: Optional[Dict] = None,
+    ) -> Dict[str, List[Tuple[Document, float]]]:
+        """
+        在多个集合中检索同一个查询：查询向量只计算一次，各集合并发检索
+
+        Args:
+            collection_names: 集合名称列表
+            query: 查询文本
+            k: 每个集合返回的结果数量
+            filter: 元数据过滤条件
+
+        Returns:
+            集合名称 -> (Document, score) 元组列表
+        """
+        if not collection_names:
+            return {}
+        vector = self.embed_query(query)
+        if len(collection_names) == 1:
+            name = collection_names[0]
+            return {name: self.search_by_vector(name, vector, k=k, filter=filter)}
+        with ThreadPoolExecutor(max_workers=min(len(collection_names), 8)) as pool:
+            futures = {
+                name: pool.submit(self.search_by_vector, name, vector, k, filter)
+                for name in collection_names
+            }
+            return {name: future.result() for name, future in futures.items()}
+
     @abstractmethod
     def similarity_search(
         self,
@@ -5,8 +5,14 @@ ChromaDB 向量数据库实现
 # 导入日志模块
 import logging
 
+# 导入uuid模块，用于生成文档ID
+import uuid
+
 # 导入需要的类型提示
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
+
+# 导入numpy，用于批量归一化分数
+import numpy as np
 
 # 导入 LangChain 的 Chroma 类
 from langchain_chroma import Chroma
@@ -17,21 +23,44 @@ from langchain_core.documents import Document
 # 导入向量数据库接口基类
 from app.services.vectordb.base import VectorDBInterface
 
+# 导入集合句柄缓存
+from app.services.vectordb.handle_cache import CollectionHandleCache
+
 # 导入全局配置
 from app.config import Config
 
-# 导入嵌入模型工厂
-from app.utils.embedding_factory import EmbeddingFactory
-
 # 获取日志记录器
 logger = logging.getLogger(__name__)
 
-import chromadb
+# 按过滤条件删除时每页读取的 ID 数
+DELETE_BATCH_SIZE = 5000
+
+
+# 将过滤条件字典转换为 chromadb 的 where 条件
+def build_where(filter: Optional[Dict]) -> Optional[Dict]:
+    """
+    {"doc_id": "a"} -> {"doc_id": "a"}
+    {"doc_id": ["a", "b"]} -> {"doc_id": {"$in": ["a", "b"]}}
+    多个字段时使用 $and 组合
+    """
+    if not filter:
+        return None
+    conditions = [
+        {key: {"$in": list(value)} if isinstance(value, (list, tuple, set)) else value}
+        for key, value in filter.items()
+    ]
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
 
 
 # 定义 Chroma 向量数据库实现类
 class ChromaVectorDB(VectorDBInterface):
 
+    # Chroma 始终以全精度存储向量
+    SUPPORTED_PRECISIONS = ("float32",)
+
+    # 创建集合时不传入任何索引选项，也不支持重建索引，所有选项都不能修改
+    FIXED_OPTIONS = ("precision", "metric_type", "index_type", "index_params")
+
     def __init__(self, persist_directory: Optional[str] = None):
         """
         初始化 ChromaDB 服务
@@ -45,13 +74,21 @@ class ChromaVectorDB(VectorDBInterface):
             persist_directory = Config.CHROMA_PERSIST_DIRECTORY
         # 设置持久化目录属性
         self.persist_directory = persist_directory
-        # 动态创建 Embedding 模型
-        self.embeddings = EmbeddingFactory.create_embeddings()
+        # 集合句柄缓存，避免每次调用都重新创建 Chroma 对象
+        self._handles = CollectionHandleCache()
         # 记录 ChromaDB 初始化信息
         logger.info(f"ChromaDB 已初始化, 持久化目录: {persist_directory}")
 
-    # 获取或创建集合（向量存储）
+    # 获取或创建集合（向量存储），优先从句柄缓存中获取
     def get_or_create_collection(self, collection_name: str) -> Chroma:
+        return self._handles.get(collection_name, self._create_collection)
+
+    # 释放集合句柄
+    def release_collection(self, collection_name: str) -> None:
+        self._handles.invalidate(collection_name)
+
+    # 创建集合（向量存储）对象
+    def _create_collection(self, collection_name: str) -> Chroma:
         # 获取或创建向量存储对象
         vectorstore = Chroma(
             collection_name=collection_name,
@@ -84,80 +121,170 @@ class ChromaVectorDB(VectorDBInterface):
         # 返回已添加文档的 id 列表
         return result_ids
 
+    # 向向量存储添加已计算好向量的文档
+    def add_embeddings(
+        self,
+        collection_name: str,
+        documents: List[Document],
+        embeddings: List[List[float]],
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        # 获取集合
+        vectorstore = self.get_or_create_collection(collection_name)
+        # 未指定 ids 时生成随机 id
+        if not ids:
+            ids = [uuid.uuid4().hex for _ in documents]
+        # 直接写入底层 chromadb 集合，跳过 LangChain 的向量化步骤
+        vectorstore._collection.upsert(
+            ids=ids,
+            embeddings=embeddings,
+            documents=[doc.page_content for doc in documents],
+            metadatas=[doc.metadata for doc in documents],
+        )
+        # 记录日志
+        logger.info(
+            f"已向 ChromaDB 集合 {collection_name} 写入 {len(documents)} 个向量"
+        )
+        return ids
+
     # 删除文档
     def delete_documents(
         self, collection_name: str, ids: Optional[List[str]] = None, filter=None
-    ):
-        vectorstore = self.get_or_create_collection(collection_name)
+    ) -> int:
+        collection = self.get_or_create_collection(collection_name)._collection
         if ids:
-            vectorstore.delete(ids=ids)
+            collection.delete(ids=ids)
+            deleted = len(ids)
         elif filter:
-            # ChromaDB 不支持直接使用 filter 参数删除
-            # 需要先查询出符合条件的文档 IDs，然后删除
-            try:
-                # 方法1: 尝试通过 vectorstore 的 _collection 属性访问
-                if hasattr(vectorstore, "_collection"):
-                    collection = vectorstore._collection
-                    # 使用 where 条件查询匹配的文档
-                    # filter 格式: {"doc_id": "xxx"}
-                    where = filter
-                    results = collection.get(where=where)
-                    if results and "ids" in results and results["ids"]:
-                        matched_ids = results["ids"]
-                        vectorstore.delete(ids=matched_ids)
-                        logger.info(f"已通过filter条件删除{len(matched_ids)}个文档")
-                    else:
-                        logger.info(f"未找到匹配filter条件的文档，无需删除")
-                else:
-                    # 方法2: 直接使用 ChromaDB 客户端访问集合
-                    client = chromadb.PersistentClient(path=self.persist_directory)
-                    try:
-                        collection = client.get_collection(name=collection_name)
-                        # 使用 where 条件查询匹配的文档
-                        where = filter
-                        results = collection.get(where=where)
-                        if results and "ids" in results and results["ids"]:
-                            matched_ids = results["ids"]
-                            vectorstore.delete(ids=matched_ids)
-                            logger.info(f"已通过filter条件删除{len(matched_ids)}个文档")
-                        else:
-                            logger.info(f"未找到匹配filter条件的文档，无需删除")
-                    except Exception as client_error:
-                        logger.warning(
-                            f"通过ChromaDB客户端访问集合失败: {client_error}"
-                        )
-                        # 如果集合不存在，说明没有数据需要删除
-                        logger.info(f"集合{collection_name}不存在，无需删除")
-            except Exception as e:
-                logger.error(f"使用filter删除文档时出错: {e}", exc_info=True)
-                raise
+            # 分页只取 ID（不读取文本、元数据和向量），逐页按 ID 删除，同时统计删除数
+            where = build_where(filter)
+            deleted = 0
+            while True:
+                page_ids = collection.get(
+                    where=where, include=[], limit=DELETE_BATCH_SIZE
+                )["ids"]
+                if not page_ids:
+                    break
+                collection.delete(ids=page_ids)
+                deleted += len(page_ids)
+                if len(page_ids) < DELETE_BATCH_SIZE:
+                    break
         else:
             raise ValueError(f"你既没有传ids,也没有传filter")
-        logger.info(f"已经从ChromDB集合{collection_name}删除文档")
+        logger.info(f"已经从ChromDB集合{collection_name}删除{deleted}个文档")
+        return deleted
 
-    # 定义相似度方法
-    def similarity_search(
-        self, collection_name, query, k=5, filter=None
+    # 删除整个集合
+    def delete_collection(self, collection_name: str) -> int:
+        vectorstore = self.get_or_create_collection(collection_name)
+        deleted = vectorstore._collection.count()
+        vectorstore.delete_collection()
+        self.release_collection(collection_name)
+        logger.info(f"已删除ChromaDB集合{collection_name}，共{deleted}个文档")
+        return deleted
+
+    # 查询满足过滤条件的所有文档ID
+    def get_ids(self, collection_name: str, filter: Dict) -> List[str]:
+        vectorstore = self.get_or_create_collection(collection_name)
+        # include 为空时 chromadb 只返回 ID，不读取向量、文本和元数据
+        results = vectorstore._collection.get(where=build_where(filter), include=[])
+        return list(results.get("ids") or [])
+
+    # 按分块序号分页列出文档的分块
+    def list_chunks(
+        self, collection_name: str, doc_id: str, offset: int = 0, limit: int = 100
     ) -> List[Document]:
-        # 获取或创建集合对应的向量存储对象
+        collection = self.get_or_create_collection(collection_name)._collection
+        # 按文档ID和当前页的序号过滤，只读取当前页的分块
+        results = collection.get(
+            where=build_where(
+                {"doc_id": doc_id, "chunk_index": list(range(offset, offset + limit))}
+            ),
+            include=["documents", "metadatas"],
+        )
+        chunks = [
+            Document(id=id, page_content=text, metadata=metadata or {})
+            for id, text, metadata in zip(
+                results["ids"], results["documents"], results["metadatas"]
+            )
+        ]
+        chunks.sort(key=lambda d: d.metadata.get("chunk_index", 0))
+        return chunks
+
+    # 使用多个查询向量批量检索
+    def search_by_vectors(
+        self,
+        collection_name: str,
+        vectors: List[List[float]],
+        k: int = 5,
+        filter: Optional[Dict] = None,
+        search_params: Optional[Dict] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        if not vectors:
+            return []
         vectorstore = self.get_or_create_collection(collection_name)
+        # Chroma 的 HNSW 检索参数在集合级别配置，忽略 search_params
+        # 直接调用底层 chromadb 集合，一次请求完成所有查询
+        results = vectorstore._collection.query(
+            query_embeddings=vectors,
+            n_results=k,
+            where=build_where(filter),
+            include=["documents", "metadatas", "distances"],
+        )
+        batches = []
+        for ids, texts, metadatas, distances in zip(
+            results["ids"],
+            results["documents"],
+            results["metadatas"],
+            results["distances"],
+        ):
+            # 分数为距离，与 LangChain Chroma 的 similarity_search_with_score 一致
+            batches.append(
+                [
+                    (
+                        Document(id=doc_id, page_content=text, metadata=metadata or {}),
+                        distance,
+                    )
+                    for doc_id, text, metadata, distance in zip(
+                        ids, texts, metadatas, distances
+                    )
+                ]
+            )
+        return batches
 
-        # 如何指定了过滤条件
-        if filter:
-            result = vectorstore.similarity_search(query=query, k=k, filter=filter)
+    # 将距离批量转换为 [0, 1] 的相关度，与 LangChain Chroma 的相关度函数一致
+    def relevance_scores(self, collection_name: str, scores: List[float]) -> np.ndarray:
+        if not scores:
+            return np.zeros(0, dtype=np.float32)
+        collection = self.get_or_create_collection(collection_name)._collection
+        configuration = collection.configuration or {}
+        space = None
+        for key in ("hnsw", "spann"):
+            if configuration.get(key):
+                space = configuration[key].get("space") or space
+        distances = np.asarray(scores, dtype=np.float32)
+        if space == "cosine":
+            relevance = 1.0 - distances
+        elif space == "ip":
+            relevance = np.where(distances > 0, 1.0 - distances, -distances)
         else:
-            result = vectorstore.similarity_search(query=query, k=k)
-        return result
+            # 默认 l2 距离
+            relevance = 1.0 - distances / np.sqrt(2)
+        return np.clip(relevance, 0.0, 1.0)
+
+    # 定义相似度方法
+    def similarity_search(
+        self, collection_name, query, k=5, filter=None
+    ) -> List[Document]:
+        results = self.similarity_search_with_score(
+            collection_name, query, k=k, filter=filter
+        )
+        return [doc for doc, _ in results]
 
     # 定义带分数的相似度搜索方法
     def similarity_search_with_score(
         self, collection_name, query, k=5, filter=None
-    ) -> List[Document]:
-        vectorstore = self.get_or_create_collection(collection_name)
-        if filter:
-            result = vectorstore.similarity_search_with_score(
-                query=query, k=k, filter=filter
-            )
-        else:
-            result = vectorstore.similarity_search_with_score(query=query, k=k)
-        return result
+    ) -> List[Tuple[Document, float]]:
+        # 先计算查询向量，再按向量检索
+        vector = self.embed_query(query)
+        return self.search_by_vector(collection_name, vector, k=k, filter=filter)
@@ -17,6 +17,9 @@ from app.services.vectordb.chroma import ChromaVectorDB
 # 导入 Milvus 的向量数据库实现
 from app.services.vectordb.milvus import MilvusVectorDB
 
+# 导入嵌入式 numpy 向量数据库实现
+from app.services.vectordb.numpy_db import NumpyVectorDB
+
 # 导入全局配置
 from app.config import Config
 
@@ -40,7 +43,7 @@ class VectorDBFactory:
         创建向量数据库实例
 
         Args:
-            vectordb_type: 向量数据库类型 ('chroma' 或 'milvus')，如果为None则从配置读取
+            vectordb_type: 向量数据库类型 ('chroma'、'milvus' 或 'numpy')，如果为None则从配置读取
             settings: 设置字典，用于创建Embedding模型
             **kwargs: 向量数据库的初始化参数
 
@@ -67,8 +70,15 @@ class VectorDBFactory:
                 "host": getattr(Config, "MILVUS_HOST", "localhost"),
                 "port": getattr(Config, "MILVUS_PORT", "19530"),
             }
-            # 创建 MilvusVectorDB 实例，并传入连接参数
-            return MilvusVectorDB(connection_args=connection_args)
+            # 创建 MilvusVectorDB 实例，并传入连接参数；partition_mode 为可选的分区方式
+            return MilvusVectorDB(
+                connection_args=connection_args,
+                partition_mode=kwargs.get("partition_mode"),
+            )
+
+        elif vectordb_type == "numpy":
+            # 嵌入式向量库，不依赖外部服务，index_dir 为可选的索引根目录
+            return NumpyVectorDB(index_dir=kwargs.get("index_dir"))
         else:
             # 其他类型暂不支持，抛出异常
             raise ValueError(f"Unsupported vector database type: {vectordb_type}")
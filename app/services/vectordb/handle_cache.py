@@ -0,0 +1,158 @@
+"""
+向量库集合句柄缓存
+"""
+
+# 导入日志模块
+import logging
+
+# 导入线程模块，用于加锁
+import threading
+
+# 导入time模块，用于记录最近访问时间
+import time
+
+# 导入有序字典，用于实现 LRU
+from collections import OrderedDict
+
+# 导入类型提示
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# 导入全局配置
+from app.config import Config
+
+# 导入 Embedding 模型注册表，用于感知模型切换
+from app.utils.embedding_factory import embedding_registry
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+
+class CollectionHandleCache:
+    """
+    线程安全的集合句柄缓存（LRU + 空闲过期）
+
+    缓存键为 (集合名称, Embedding 模型版本)，模型切换后旧句柄自然失效；
+    同一集合的句柄只会被创建一次，并发请求等待同一次创建
+    """
+
+    def __init__(
+        self, max_size: Optional[int] = None, idle_seconds: Optional[int] = None
+    ):
+        """
+        参数:
+            max_size: 最多缓存的句柄数，超过时淘汰最久未使用的句柄
+            idle_seconds: 句柄空闲超过该秒数后被淘汰
+        """
+        self.max_size = max_size or Config.VECTOR_HANDLE_CACHE_SIZE
+        self.idle_seconds = idle_seconds or Config.VECTOR_HANDLE_IDLE_SECONDS
+        # 键 -> (句柄, 最近访问时间)，按访问顺序排列
+        self._handles: "OrderedDict[Tuple[str, int], Tuple[Any, float]]" = (
+            OrderedDict()
+        )
+        # 保护 _handles 的锁
+        self._lock = threading.Lock()
+        # 每个集合一把创建锁，避免并发重复创建同一个句柄
+        self._create_locks: Dict[str, threading.Lock] = {}
+        # 命中、未命中和淘汰次数
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(
+        self,
+        collection_name: str,
+        factory: Callable[[str], Any],
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        获取集合句柄，不存在时调用 factory(collection_name) 创建
+
+        参数:
+            collection_name: 集合名称
+            factory: 创建句柄的函数
+            cacheable: 可选，判断新建的句柄能否缓存；返回 False 时句柄只供本次调用使用，
+                例如集合尚不存在、之后由其他进程创建时，旧句柄中的字段信息会过期
+
+        返回:
+            集合句柄
+        """
+        key = (collection_name, embedding_registry.version)
+        handle = self._lookup(key)
+        if handle is not None:
+            return handle
+
+        with self._lock:
+            create_lock = self._create_locks.setdefault(
+                collection_name, threading.Lock()
+            )
+        with create_lock:
+            # 等待锁期间其他线程可能已经创建好
+            handle = self._lookup(key)
+            if handle is not None:
+                return handle
+            handle = factory(collection_name)
+            if cacheable is not None and not cacheable(handle):
+                with self._lock:
+                    self.misses += 1
+                return handle
+            with self._lock:
+                self.misses += 1
+                # 删除该集合其他模型版本的旧句柄
+                for old_key in [k for k in self._handles if k[0] == collection_name]:
+                    del self._handles[old_key]
+                self._handles[key] = (handle, time.monotonic())
+                self._evict()
+            return handle
+
+    def _lookup(self, key: Tuple[str, int]) -> Optional[Any]:
+        """查找未过期的句柄并刷新其访问时间"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._handles.get(key)
+            if entry is None:
+                return None
+            handle, last_access = entry
+            if now - last_access > self.idle_seconds:
+                del self._handles[key]
+                self.evictions += 1
+                return None
+            self._handles[key] = (handle, now)
+            self._handles.move_to_end(key)
+            self.hits += 1
+            return handle
+
+    def _evict(self) -> None:
+        """淘汰空闲过期和超出数量上限的句柄（调用方需持有 _lock）"""
+        now = time.monotonic()
+        for key in [
+            k for k, (_, t) in self._handles.items() if now - t > self.idle_seconds
+        ]:
+            del self._handles[key]
+            self.evictions += 1
+        while len(self._handles) > self.max_size:
+            self._handles.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, collection_name: str) -> None:
+        """删除某个集合的所有句柄，例如知识库被删除时"""
+        with self._lock:
+            for key in [k for k in self._handles if k[0] == collection_name]:
+                del self._handles[key]
+            self._create_locks.pop(collection_name, None)
+        logger.debug(f"已清除集合 {collection_name} 的句柄缓存")
+
+    def clear(self) -> None:
+        """清空所有句柄"""
+        with self._lock:
+            self._handles.clear()
+
+    def stats(self) -> dict:
+        """返回缓存统计信息"""
+        with self._lock:
+            return {
+                "size": len(self._handles),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -5,11 +5,23 @@ Milvus 向量数据库实现
 # 导入日志模块
 import logging
 
+# 导入正则模块，用于生成分区名
+import re
+
+# 导入线程模块，用于保护加载状态
+import threading
+
 # 导入Milvus类
 from langchain_milvus import Milvus
 
+# 导入numpy，用于批量归一化分数
+import numpy as np
+
+# 导入字段类型，用于声明分区键字段
+from pymilvus import DataType
+
 # 导入类型提示相关模块
-from typing import List, Dict, Optional, Any
+from typing import Callable, Iterable, List, Dict, Optional, Any, Tuple, TypeVar
 
 # 导入LangChain的文档类型
 from langchain_core.documents import Document
@@ -17,25 +29,117 @@ from langchain_core.documents import Document
 # 导入向量数据库接口基类
 from app.services.vectordb.base import VectorDBInterface
 
-# 导入Embedding工厂方法
-from app.utils.embedding_factory import EmbeddingFactory
+# 导入集合句柄缓存
+from app.services.vectordb.handle_cache import CollectionHandleCache
+
+# 导入全局配置
+from app.config import Config
 
 # 获取日志记录器
 logger = logging.getLogger(__name__)
 
+# 按条件查询ID时每批读取的数量
+QUERY_BATCH_SIZE = 1000
+
+T = TypeVar("T")
+
+# 存储精度对应的 Milvus 索引，只在第一次写入创建集合时生效；度量类型与 LangChain Milvus 的默认值一致。
+# LangChain Milvus 创建的向量字段固定为 FloatVector，float16 不会节省内存，因此不支持
+PRECISION_INDEX_PARAMS = {
+    "float32": {"index_type": "HNSW", "params": {"M": 16, "efConstruction": 200}},
+    "int8": {"index_type": "IVF_SQ8", "params": {"nlist": 1024}},
+    "pq": {"index_type": "IVF_PQ", "params": {"nlist": 1024, "nbits": 8}},
+}
+# IVF_PQ 每个子空间的目标维度
+PQ_SUBVECTOR_DIM = 4
+
+# 支持的分区方式
+PARTITION_MODES = ("none", "partition_key", "document")
+# 集合的默认分区，document 方式开启前写入的分块和无法创建分区的文档都在该分区中
+DEFAULT_PARTITION = "_default"
+# 分区键字段的最大长度，与 LangChain Milvus 推断的 VARCHAR 字段一致
+PARTITION_KEY_MAX_LENGTH = 65_535
+
+
+# 将单个值转换为 Milvus 表达式中的字面量
+def _expr_literal(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    # 字符串需要转义反斜杠和双引号
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+# IVF_PQ 的子空间数必须整除向量维度，取不超过 维度 / PQ_SUBVECTOR_DIM 的最大因数
+def _pq_m(dim: int) -> int:
+    for m in range(max(1, dim // PQ_SUBVECTOR_DIM), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+# 文档对应的分区名，分区名只能包含字母、数字和下划线
+def _document_partition(doc_id: Any) -> str:
+    return "doc_" + re.sub(r"[^0-9A-Za-z_]", "_", str(doc_id))
+
+
+# 取出过滤条件中的文档ID列表，未按 doc_id 过滤时返回 None
+def _filter_doc_ids(filter: Optional[Dict]) -> Optional[List[Any]]:
+    if not filter or "doc_id" not in filter:
+        return None
+    value = filter["doc_id"]
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+# 将过滤条件字典转换为 Milvus 过滤表达式
+def build_filter_expr(filter: Optional[Dict]) -> Optional[str]:
+    """
+    {"doc_id": "a"} -> doc_id == "a"
+    {"doc_id": ["a", "b"]} -> doc_id in ["a", "b"]
+    多个字段时使用 and 组合
+    """
+    if not filter:
+        return None
+    conditions = []
+    for key, value in filter.items():
+        if isinstance(value, (list, tuple, set)):
+            values = ", ".join(_expr_literal(v) for v in value)
+            conditions.append(f"{key} in [{values}]")
+        else:
+            conditions.append(f"{key} == {_expr_literal(value)}")
+    return " and ".join(conditions)
+
+
+# 判断异常是否由集合未加载引起（集合被 release 或 Milvus 重启后会出现）
+def _is_not_loaded_error(error: Exception) -> bool:
+    return "not loaded" in str(error).lower()
+
+
+# 判断异常是否与分区有关（分区被其他进程删除后会出现）
+def _is_partition_error(error: Exception) -> bool:
+    return "partition" in str(error).lower()
+
 
 # 定义 Milvus 向量数据库实现类，继承接口基类
 class MilvusVectorDB(VectorDBInterface):
     """Milvus 向量数据库实现"""
 
+    # 支持的存储精度
+    SUPPORTED_PRECISIONS = tuple(PRECISION_INDEX_PARAMS)
+
     # 初始化方法，设置连接参数和embedding模型
-    def __init__(self, connection_args: Optional[Dict] = None):
+    def __init__(
+        self, connection_args: Optional[Dict] = None, partition_mode: Optional[str] = None
+    ):
         """
         初始化 Milvus 服务
 
         Args:
             connection_args: Milvus连接参数，例如：
                 {'host': 'localhost', 'port': '19530'}
+            partition_mode: 分区方式 none / partition_key / document，为 None 时使用配置中的值
         """
         # 如果没有传递连接参数，则使用默认主机和端口
         if connection_args is None:
@@ -48,41 +152,336 @@ class MilvusVectorDB(VectorDBInterface):
 
         # 保存连接参数到实例
         self.connection_args = connection_args
+        # 集合句柄缓存，避免每次调用都重新连接和描述集合
+        self._handles = CollectionHandleCache()
+        # 已加载到内存中的集合名称，查询前只需检查该集合，无需每次调用 load
+        self._loaded = set()
+        # 保护 _loaded 的锁
+        self._load_lock = threading.Lock()
+        # 分区方式
+        partition_mode = (partition_mode or Config.MILVUS_PARTITION_MODE).lower()
+        if partition_mode not in PARTITION_MODES:
+            raise ValueError(f"不支持的 Milvus 分区方式: {partition_mode}")
+        self.partition_mode = partition_mode
+        # document 方式下每个集合已有的分区名，缓存中没有时再从 Milvus 读取
+        self._partitions: Dict[str, set] = {}
+        # 保护 _partitions 的锁
+        self._partition_lock = threading.Lock()
 
-        # 动态创建 Embedding 模型
-        self.embeddings = EmbeddingFactory.create_embeddings()
         # 打印初始化日志
-        logger.info(f"Milvus 已初始化, 连接参数: {connection_args}")
+        logger.info(
+            f"Milvus 已初始化, 连接参数: {connection_args}, 分区方式: {partition_mode}"
+        )
 
-    # 获取或创建 Milvus 向量集合的方法
+    # 获取或创建 Milvus 向量集合的方法，优先从句柄缓存中获取
     def get_or_create_collection(self, collection_name: str) -> Milvus:
         """获取或创建向量存储"""
+        # 集合还不存在时不缓存句柄：集合可能随后由其他进程创建，
+        # 而句柄中的字段、检索参数等只在打开已存在的集合时读取
+        return self._handles.get(
+            collection_name,
+            self._create_collection,
+            cacheable=lambda vectorstore: vectorstore.col is not None,
+        )
+
+    # 释放集合句柄
+    def release_collection(self, collection_name: str) -> None:
+        self._handles.invalidate(collection_name)
+        with self._load_lock:
+            self._loaded.discard(collection_name)
+        with self._partition_lock:
+            self._partitions.pop(collection_name, None)
+
+    # 确保集合已加载，已加载的集合直接返回，不再发起 RPC
+    def _ensure_loaded(self, collection_name: str, vectorstore: Milvus) -> None:
+        if collection_name in self._loaded:
+            return
+        with self._load_lock:
+            if collection_name in self._loaded:
+                return
+            # 集合还不存在时无需加载
+            if vectorstore.col is None:
+                return
+            vectorstore.client.load_collection(collection_name)
+            self._loaded.add(collection_name)
+            logger.info(f"已加载 Milvus 集合 {collection_name}")
+
+    # 在已加载的集合上执行查询，集合被释放时重新加载并重试一次
+    def _run_loaded(
+        self, collection_name: str, vectorstore: Milvus, func: Callable[[], T]
+    ) -> T:
+        self._ensure_loaded(collection_name, vectorstore)
+        try:
+            return func()
+        except Exception as e:
+            if not _is_not_loaded_error(e):
+                raise
+            logger.warning(f"Milvus 集合 {collection_name} 未加载，重新加载后重试: {e}")
+            with self._load_lock:
+                self._loaded.discard(collection_name)
+            self._ensure_loaded(collection_name, vectorstore)
+            return func()
+
+    # 预热：提前创建句柄并加载集合，避免第一次查询承担加载耗时
+    def warm_up(self, collection_names: Iterable[str]) -> None:
+        for collection_name in collection_names:
+            vectorstore = self.get_or_create_collection(collection_name)
+            self._ensure_loaded(collection_name, vectorstore)
+
+    # 创建 Milvus 向量存储对象
+    def _create_collection(self, collection_name: str) -> Milvus:
+        """创建向量存储"""
         # 拷贝一份连接参数，检查端口类型
         connection_args = self.connection_args.copy()
         if "port" in connection_args and isinstance(connection_args["port"], int):
             connection_args["port"] = str(connection_args["port"])
 
+        kwargs = {}
+        if self.partition_mode == "partition_key":
+            # 以 doc_id 为分区键，按文档过滤时 Milvus 只检索文档所在的分区；只在创建集合时生效
+            kwargs["metadata_schema"] = {
+                "doc_id": {
+                    "dtype": DataType.VARCHAR,
+                    "kwargs": {
+                        "max_length": PARTITION_KEY_MAX_LENGTH,
+                        "is_partition_key": True,
+                    },
+                }
+            }
+            kwargs["num_partitions"] = Config.MILVUS_NUM_PARTITIONS
+
         # 创建 Milvus 向量存储对象，如果集合不存在会自动创建
         # LangChain Milvus 会自动处理集合、索引创建和加载
         vectorstore = Milvus(
             collection_name=collection_name,  # 集合名称
             embedding_function=self.embeddings,  # embedding模型
             connection_args=connection_args,  # 连接参数
+            index_params=self._index_params(collection_name),  # 集合不存在时使用的索引参数
+            **kwargs,
         )
 
-        # 如果集合对象有 _collection 属性，尝试加载已有集合（如果已经存在）
-        if hasattr(vectorstore, "_collection"):
-            try:
-                # 尝试加载集合
-                vectorstore._collection.load()
-                logger.debug(f"已加载 Milvus 集合 {collection_name}")
-            except Exception as e:
-                # 集合不存在或为空时输出Debug日志
-                logger.debug(f"集合 {collection_name} 可能不存在或为空: {e}")
+        # 集合已存在时 LangChain Milvus 在初始化过程中已经加载，记录加载状态
+        if vectorstore.col is not None:
+            with self._load_lock:
+                self._loaded.add(collection_name)
+            # 以集合实际的索引为准，创建后修改的存储精度不会影响已有集合
+            index = vectorstore._get_index(vectorstore._as_list(vectorstore._vector_field)[0])
+            if index is not None:
+                vectorstore.index_params = index["index_param"]
 
         # 返回vectorstore对象
         return vectorstore
 
+    # 根据集合的选项选择索引参数：指定了索引类型时直接使用，否则按存储精度选择，
+    # 都未设置时使用 LangChain Milvus 的默认索引
+    def _index_params(self, collection_name: str) -> Optional[dict]:
+        options = self.collection_options(collection_name)
+        precision = options.get("precision")
+        if precision and precision not in PRECISION_INDEX_PARAMS:
+            # 旧版本允许设置的 float16 等精度，按全精度处理
+            logger.warning(
+                f"Milvus 不支持集合 {collection_name} 的存储精度 {precision}，按 float32 处理"
+            )
+            precision = "float32"
+        if options.get("index_type"):
+            index_params = {
+                "index_type": options["index_type"],
+                "params": dict(options.get("index_params") or {}),
+            }
+        elif precision in PRECISION_INDEX_PARAMS:
+            index_params = dict(PRECISION_INDEX_PARAMS[precision])
+            index_params["params"] = dict(index_params["params"])
+        elif options.get("metric_type"):
+            index_params = {"index_type": "AUTOINDEX", "params": {}}
+        else:
+            return None
+        index_params["metric_type"] = options.get("metric_type") or "L2"
+        if index_params["index_type"] == "IVF_PQ" and "m" not in index_params["params"]:
+            # 查询向量经过缓存，只在第一次打开集合时计算
+            index_params["params"]["m"] = _pq_m(len(self.embed_query("dimension")))
+        return index_params
+
+    # 按集合当前的选项原地重建索引：释放集合、删除旧索引、创建新索引后重新加载
+    def rebuild_index(self, collection_name: str) -> None:
+        # 重新打开句柄，读取最新的集合选项
+        self.release_collection(collection_name)
+        vectorstore = self.get_or_create_collection(collection_name)
+        if vectorstore.col is None:
+            logger.info(f"Milvus 集合 {collection_name} 不存在，无需重建索引")
+            return
+        index_params = self._index_params(collection_name) or {
+            "metric_type": "L2",
+            "index_type": "AUTOINDEX",
+            "params": {},
+        }
+        client = vectorstore.client
+        vector_field = vectorstore._as_list(vectorstore._vector_field)[0]
+        client.release_collection(collection_name)
+        try:
+            for index_name in client.list_indexes(collection_name, field_name=vector_field):
+                client.drop_index(collection_name, index_name)
+            prepared = client.prepare_index_params()
+            prepared.add_index(field_name=vector_field, **index_params)
+            client.create_index(collection_name, prepared)
+        finally:
+            # 句柄中的索引和检索参数基于旧索引，释放后重新创建
+            self.release_collection(collection_name)
+        # 加载会等待索引构建完成
+        client.load_collection(collection_name)
+        logger.info(f"已重建 Milvus 集合 {collection_name} 的索引: {index_params}")
+
+    # 集合已有的分区名，refresh 为 True 时从 Milvus 重新读取
+    def _list_partitions(
+        self, collection_name: str, vectorstore: Milvus, refresh: bool = False
+    ) -> set:
+        partitions = self._partitions.get(collection_name)
+        if partitions is None or refresh:
+            partitions = set(vectorstore.client.list_partitions(collection_name))
+            self._partitions[collection_name] = partitions
+        return partitions
+
+    # 查找文档已存在的分区，缓存中缺少时重新读取一次（分区可能由其他进程创建）
+    def _document_partitions(
+        self, collection_name: str, vectorstore: Milvus, doc_ids: List[Any]
+    ) -> Dict[Any, str]:
+        names = {doc_id: _document_partition(doc_id) for doc_id in doc_ids}
+        with self._partition_lock:
+            partitions = self._list_partitions(collection_name, vectorstore)
+            if not partitions.issuperset(names.values()):
+                partitions = self._list_partitions(
+                    collection_name, vectorstore, refresh=True
+                )
+        return {doc_id: name for doc_id, name in names.items() if name in partitions}
+
+    # 获取文档的分区，不存在时创建；分区数达到上限等原因创建失败时使用默认分区
+    def _ensure_partition(
+        self, collection_name: str, vectorstore: Milvus, doc_id: Any
+    ) -> str:
+        name = _document_partition(doc_id)
+        with self._partition_lock:
+            if name in self._list_partitions(collection_name, vectorstore):
+                return name
+            try:
+                vectorstore.client.create_partition(collection_name, name)
+            except Exception as e:
+                # 分区可能已由其他进程创建
+                if name in self._list_partitions(collection_name, vectorstore, refresh=True):
+                    return name
+                logger.warning(
+                    f"创建 Milvus 分区 {collection_name}/{name} 失败，"
+                    f"文档 {doc_id} 写入默认分区: {e}"
+                )
+                return DEFAULT_PARTITION
+            self._partitions[collection_name].add(name)
+        # 集合已加载时新分区也需要加载后才能检索
+        if collection_name in self._loaded:
+            vectorstore.client.load_partitions(collection_name, [name])
+        logger.info(f"已创建 Milvus 分区 {collection_name}/{name}")
+        return name
+
+    # document 方式下按文档分组，把每组分块写入文档自己的分区
+    def _add_to_partitions(
+        self,
+        collection_name: str,
+        vectorstore: Milvus,
+        documents: List[Document],
+        embeddings: List[List[float]],
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        if vectorstore.col is None:
+            # 分区只能在集合存在后创建，先按第一条向量和元数据创建集合、索引并加载
+            vectorstore._init(
+                embeddings=[embeddings[:1]], metadatas=[documents[0].metadata]
+            )
+            with self._load_lock:
+                self._loaded.add(collection_name)
+        groups: Dict[Any, List[int]] = {}
+        for i, doc in enumerate(documents):
+            groups.setdefault(doc.metadata.get("doc_id"), []).append(i)
+        result_ids: List[str] = [None] * len(documents)
+        for doc_id, positions in groups.items():
+            partition = (
+                self._ensure_partition(collection_name, vectorstore, doc_id)
+                if doc_id is not None
+                else DEFAULT_PARTITION
+            )
+            group_ids = vectorstore.add_embeddings(
+                texts=[documents[i].page_content for i in positions],
+                embeddings=[embeddings[i] for i in positions],
+                metadatas=[documents[i].metadata for i in positions],
+                ids=[ids[i] for i in positions] if ids else None,
+                partition_name=partition,
+            )
+            for i, pk in zip(positions, group_ids):
+                result_ids[i] = pk
+        return result_ids
+
+    # document 方式下删除文档：删除文档的分区，默认分区中的旧分块仍按表达式删除
+    def _drop_document_partitions(
+        self, collection_name: str, vectorstore: Milvus, doc_ids: List[Any]
+    ) -> int:
+        client = vectorstore.client
+        deleted = 0
+        for doc_id, name in self._document_partitions(
+            collection_name, vectorstore, doc_ids
+        ).items():
+            # 删除前统计分区中的分块数
+            rows = self._run_loaded(
+                collection_name,
+                vectorstore,
+                lambda: client.query(
+                    collection_name, output_fields=["count(*)"], partition_names=[name]
+                ),
+            )
+            deleted += rows[0]["count(*)"] if rows else 0
+            # 分区需要先释放才能删除
+            client.release_partitions(collection_name, [name])
+            client.drop_partition(collection_name, name)
+            with self._partition_lock:
+                self._partitions.get(collection_name, set()).discard(name)
+            logger.info(f"已删除文档 {doc_id} 的 Milvus 分区 {collection_name}/{name}")
+        result = client.delete(
+            collection_name,
+            filter=build_filter_expr({"doc_id": doc_ids}),
+            partition_name=DEFAULT_PARTITION,
+        )
+        return deleted + (result.get("delete_count", 0) if isinstance(result, dict) else 0)
+
+    # 按 doc_id 过滤时需要检索的分区；未使用 document 方式或未按文档过滤时返回 None，检索所有分区
+    def _scoped_partitions(
+        self, collection_name: str, vectorstore: Milvus, filter: Optional[Dict]
+    ) -> Optional[List[str]]:
+        doc_ids = _filter_doc_ids(filter)
+        if self.partition_mode != "document" or doc_ids is None:
+            return None
+        partitions = self._document_partitions(collection_name, vectorstore, doc_ids)
+        # 默认分区中可能有开启 document 方式前写入的分块
+        return [DEFAULT_PARTITION] + sorted(set(partitions.values()))
+
+    # 在过滤条件对应的分区上执行查询，分区已被删除时重新读取分区后重试一次
+    def _run_scoped(
+        self,
+        collection_name: str,
+        vectorstore: Milvus,
+        filter: Optional[Dict],
+        func: Callable[[Optional[List[str]]], T],
+    ) -> T:
+        partition_names = self._scoped_partitions(collection_name, vectorstore, filter)
+        try:
+            return self._run_loaded(
+                collection_name, vectorstore, lambda: func(partition_names)
+            )
+        except Exception as e:
+            if partition_names is None or not _is_partition_error(e):
+                raise
+            logger.warning(f"Milvus 集合 {collection_name} 的分区已变化，重新读取后重试: {e}")
+            with self._partition_lock:
+                self._partitions.pop(collection_name, None)
+            partition_names = self._scoped_partitions(collection_name, vectorstore, filter)
+            return self._run_loaded(
+                collection_name, vectorstore, lambda: func(partition_names)
+            )
+
     # 添加文档到 Milvus 的方法
     def add_documents(
         self,
@@ -95,8 +494,16 @@ class MilvusVectorDB(VectorDBInterface):
         vectorstore = self.get_or_create_collection(collection_name)
 
         try:
+            # document 方式下先向量化，再按文档写入各自的分区
+            if self.partition_mode == "document":
+                embeddings = self.embeddings.embed_documents(
+                    [doc.page_content for doc in documents]
+                )
+                result_ids = self._add_to_partitions(
+                    collection_name, vectorstore, documents, embeddings, ids=ids
+                )
             # 指定了ID则传入，否则直接添加
-            if ids:
+            elif ids:
                 result_ids = vectorstore.add_documents(documents=documents, ids=ids)
             else:
                 result_ids = vectorstore.add_documents(documents=documents)
@@ -119,47 +526,254 @@ class MilvusVectorDB(VectorDBInterface):
             )
             raise
 
+    # 添加已计算好向量的文档到 Milvus 的方法
+    def add_embeddings(
+        self,
+        collection_name: str,
+        documents: List[Document],
+        embeddings: List[List[float]],
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """添加已计算好向量的文档（不刷新，由调用方在全部批次写入后调用 flush）"""
+        # 获取（或创建）对应的集合
+        vectorstore = self.get_or_create_collection(collection_name)
+        try:
+            # document 方式下按文档写入各自的分区
+            if self.partition_mode == "document":
+                result_ids = self._add_to_partitions(
+                    collection_name, vectorstore, documents, embeddings, ids=ids
+                )
+            else:
+                # 集合不存在时 LangChain 会根据第一批向量和元数据创建集合
+                result_ids = vectorstore.add_embeddings(
+                    texts=[doc.page_content for doc in documents],
+                    embeddings=embeddings,
+                    metadatas=[doc.metadata for doc in documents],
+                    ids=ids,
+                )
+            logger.info(
+                f"已向 Milvus 集合 {collection_name} 写入 {len(documents)} 个向量"
+            )
+            return result_ids
+        except Exception as e:
+            logger.error(
+                f"向 Milvus 集合 {collection_name} 写入向量时出错: {e}", exc_info=True
+            )
+            raise
+
+    # 刷新集合，保证写入的数据落盘
+    def flush(self, collection_name: str) -> None:
+        vectorstore = self.get_or_create_collection(collection_name)
+        vectorstore.client.flush(collection_name)
+        logger.debug(f"已刷新 Milvus 集合 {collection_name}")
+
     # 删除文档的方法
     def delete_documents(
         self,
         collection_name: str,
         ids: Optional[List[str]] = None,
         filter: Optional[Dict] = None,
-    ) -> None:
-        """删除文档"""
+    ) -> int:
+        """删除文档，返回删除的文档数"""
         # 获取（或创建）指定名称的向量集合
         vectorstore = self.get_or_create_collection(collection_name)
+        # 集合还不存在时没有任何数据
+        if vectorstore.col is None:
+            return 0
+        doc_ids = _filter_doc_ids(filter)
         # 如果传入了ids，按id删除文档
         if ids:
-            vectorstore.delete(ids=ids)
-        # 如果传入了filter，根据过滤条件删除文档
+            result = vectorstore.client.delete(collection_name, ids=ids)
+        # document 方式下只按 doc_id 删除时直接删除文档的分区，不写删除标记
+        elif self.partition_mode == "document" and doc_ids is not None and len(filter) == 1:
+            result = {
+                "delete_count": self._drop_document_partitions(
+                    collection_name, vectorstore, doc_ids
+                )
+            }
+        # 如果传入了filter，根据过滤条件删除文档（服务端按表达式删除，不读取数据）
         elif filter:
-            # 构造Milvus的表达式字符串，这里只处理doc_id的情况
-            expr = f'doc_id=="{filter["doc_id"]}"'
-            vectorstore.delete(expr=expr)
+            result = vectorstore.client.delete(
+                collection_name, filter=build_filter_expr(filter)
+            )
         # ids和filter都未传，抛出异常
         else:
             raise ValueError(f"你既没有传ids,也没有传filter")
-        # 如果集合对象有_collection属性，则刷新集合，保证删除操作落盘
-        if hasattr(vectorstore, "_collection"):
-            vectorstore._collection.flush()
+        deleted = result.get("delete_count", 0) if isinstance(result, dict) else 0
         # 记录删除操作的日志
-        logger.info(f"已经从ChromDB集合{collection_name}删除文档")
+        logger.info(f"已经从Milvus集合{collection_name}删除{deleted}个文档")
+        return deleted
 
-    # 定义相似度搜索方法
-    def similarity_search(self, collection_name, query, k=5, filter=None):
+    # 删除整个集合
+    def delete_collection(self, collection_name: str) -> int:
         vectorstore = self.get_or_create_collection(collection_name)
-        # 检查集合是否已被加载（LangChain Milvus 一般自动处理，这里显式保证）
-        if hasattr(vectorstore, "_collection"):
+        deleted = 0
+        if vectorstore.col is not None:
+            deleted = vectorstore.col.num_entities
+            vectorstore.client.drop_collection(collection_name)
+        self.release_collection(collection_name)
+        logger.info(f"已删除Milvus集合{collection_name}，共{deleted}个文档")
+        return deleted
+
+    # 查询满足过滤条件的所有文档ID
+    def get_ids(self, collection_name: str, filter: Dict) -> List[str]:
+        vectorstore = self.get_or_create_collection(collection_name)
+        # 集合还不存在时没有任何数据
+        if vectorstore.col is None:
+            return []
+        rows = self._query_all(
+            collection_name, vectorstore, filter, [vectorstore._primary_field]
+        )
+        return [row[vectorstore._primary_field] for row in rows]
+
+    # 读取满足过滤条件的所有行的指定字段
+    def _query_all(
+        self,
+        collection_name: str,
+        vectorstore: Milvus,
+        filter: Optional[Dict],
+        output_fields: List[str],
+    ) -> List[dict]:
+        # 构造过滤表达式，例如 doc_id == "xxx"
+        expr = build_filter_expr(filter)
+
+        # 使用查询迭代器分批读取，避免超过单次查询的数量上限
+        def query_rows(partition_names: Optional[List[str]]) -> List[dict]:
+            iterator = vectorstore.col.query_iterator(
+                batch_size=QUERY_BATCH_SIZE,
+                expr=expr,
+                output_fields=output_fields,
+                partition_names=partition_names,
+            )
+            result = []
             try:
-                vectorstore._collection.load()
-            except Exception as e:
-                logger.debug(f"集合可能已加载或加载失败: {e}")
-        if filter:
-            results = vectorstore.similarity_search(query=query, k=k, expr=filter)
+                while True:
+                    rows = iterator.next()
+                    if not rows:
+                        break
+                    result.extend(rows)
+            finally:
+                iterator.close()
+            return result
+
+        # 查询迭代器要求集合已加载
+        return self._run_scoped(collection_name, vectorstore, filter, query_rows)
+
+    # 按分块序号分页列出文档的分块
+    def list_chunks(
+        self, collection_name: str, doc_id: str, offset: int = 0, limit: int = 100
+    ) -> List[Document]:
+        vectorstore = self.get_or_create_collection(collection_name)
+        # 集合还不存在时没有任何数据
+        if vectorstore.col is None:
+            return []
+        # 输出除向量外的所有字段
+        if vectorstore.enable_dynamic_field:
+            output_fields = ["*"]
+        else:
+            output_fields = vectorstore._remove_forbidden_fields(vectorstore.fields[:])
+        # 按文档ID和当前页的序号过滤，只读取当前页的分块
+        filter = {"doc_id": doc_id, "chunk_index": list(range(offset, offset + limit))}
+        expr = build_filter_expr(filter)
+        rows = self._run_scoped(
+            collection_name,
+            vectorstore,
+            filter,
+            lambda partition_names: vectorstore.client.query(
+                collection_name,
+                filter=expr,
+                output_fields=output_fields,
+                limit=limit,
+                partition_names=partition_names,
+            ),
+        )
+        chunks = [vectorstore._parse_document(row) for row in rows]
+        chunks.sort(key=lambda d: d.metadata.get("chunk_index", 0))
+        return chunks
+
+    # 使用多个查询向量批量检索
+    def search_by_vectors(
+        self,
+        collection_name: str,
+        vectors: List[List[float]],
+        k: int = 5,
+        filter: Optional[Dict] = None,
+        search_params: Optional[Dict] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        if not vectors:
+            return []
+        vectorstore = self.get_or_create_collection(collection_name)
+        # 集合还不存在时没有任何数据
+        if vectorstore.col is None:
+            return [[] for _ in vectors]
+        # 输出字段与 LangChain Milvus 保持一致
+        if vectorstore.enable_dynamic_field:
+            output_fields = ["*"]
+        else:
+            output_fields = vectorstore._remove_forbidden_fields(vectorstore.fields[:])
+        # 直接调用 MilvusClient，一次 RPC 完成所有查询；按文档过滤时只检索相关的分区
+        results = self._run_scoped(
+            collection_name,
+            vectorstore,
+            filter,
+            lambda partition_names: vectorstore.client.search(
+                collection_name,
+                data=vectors,
+                anns_field=vectorstore._vector_field,
+                search_params=self._search_params(vectorstore, search_params, k),
+                limit=k,
+                filter=build_filter_expr(filter) or "",
+                output_fields=output_fields,
+                partition_names=partition_names,
+            ),
+        )
+        # 分数为 Milvus 返回的距离，与 similarity_search_with_score 一致
+        return [
+            [(vectorstore._parse_document(hit["entity"]), hit["distance"]) for hit in hits]
+            for hits in results
+        ]
+
+    # 合并默认检索参数和调用方传入的参数，只保留当前索引类型支持的参数
+    @staticmethod
+    def _search_params(vectorstore: Milvus, overrides: Optional[Dict], k: int) -> dict:
+        params = dict(vectorstore._as_list(vectorstore.search_params)[0] or {})
+        index_params = vectorstore._as_list(vectorstore.index_params or {})
+        index_type = (index_params[0] if index_params else {}).get("index_type", "")
+        supported = {
+            key: value
+            for key, value in (overrides or {}).items()
+            if (key == "ef" and index_type.startswith("HNSW"))
+            or (key == "nprobe" and index_type.startswith(("IVF", "SCANN")))
+        }
+        if "ef" in supported:
+            # HNSW 要求 ef 不小于返回的结果数
+            supported["ef"] = max(int(supported["ef"]), k)
+        if supported:
+            params["params"] = {**(params.get("params") or {}), **supported}
+        return params
+
+    # 将原始分数批量转换为 [0, 1] 的相关度，与 LangChain Milvus 的相关度函数一致
+    def relevance_scores(self, collection_name: str, scores: List[float]) -> np.ndarray:
+        if not scores:
+            return np.zeros(0, dtype=np.float32)
+        vectorstore = self.get_or_create_collection(collection_name)
+        index_params = vectorstore._as_list(vectorstore.index_params or {})
+        metric_type = (index_params[0] if index_params else {}).get("metric_type", "L2")
+        values = np.asarray(scores, dtype=np.float32)
+        if metric_type in ("IP", "COSINE"):
+            # 相似度范围 [-1, 1]
+            relevance = (values + 1.0) / 2.0
         else:
-            results = vectorstore.similarity_search(query=query, k=k)
-        return results
+            # L2 距离（未开方）范围 [0, 4]
+            relevance = 1.0 - values / 4.0
+        return np.clip(relevance, 0.0, 1.0)
+
+    # 定义相似度搜索方法
+    def similarity_search(self, collection_name, query, k=5, filter=None):
+        results = self.similarity_search_with_score(
+            collection_name, query, k=k, filter=filter
+        )
+        return [doc for doc, _ in results]
 
     # 定义带分数的相似度搜索方法
     def similarity_search_with_score(
@@ -169,28 +783,6 @@ class MilvusVectorDB(VectorDBInterface):
         k: int = 5,
         filter: Optional[Dict] = None,
     ) -> List[tuple]:
-        # 获取对应名称的向量存储集合
-        vectorstore = self.get_or_create_collection(collection_name)
-        # 判断集合对象是否有"_collection"属性（Milvus 后端可能有，需要显式加载）
-        if hasattr(vectorstore, "_collection"):
-            try:
-                # 显式加载集合（加速后续搜索操作）
-                vectorstore._collection.load()
-                logger.info(f"已经加载集合{collection_name}")
-            except Exception as e:
-                # 加载失败/集合不存在时记录日志，不影响流程
-                logger.info(f"集合可能不存在：{e}")
-        # 如果传递了过滤条件
-        if filter:
-            # 根据过滤条件构造Milvus的过滤表达式，只支持doc_id精准查询
-            expr = f'doc_id=="{filter["doc_id"]}"'
-            # 带过滤表达式执行相似度检索，并拿到分数
-            results = vectorstore.similarity_search_with_score(
-                query=query, k=k, expr=expr
-            )
-            print("filter_results", len(results))
-        else:
-            # 如果没有过滤条件，直接执行检索
-            results = vectorstore.similarity_search_with_score(query=query, k=k)
-        # 返回(检索文档, 分数)结果列表
-        return results
+        # 先计算查询向量，再按向量检索，返回(检索文档, 分数)结果列表
+        vector = self.embed_query(query)
+        return self.search_by_vector(collection_name, vector, k=k, filter=filter)
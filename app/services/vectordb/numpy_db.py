@@ -0,0 +1,224 @@
+# 嵌入式 numpy 向量数据库实现
+"""
+嵌入式 numpy 向量数据库实现
+每个集合保存为本地目录中的内存映射向量矩阵，不依赖任何外部服务，适合单机部署
+"""
+# 导入日志模块
+import logging
+
+# 导入os模块，用于处理索引目录
+import os
+
+# 导入uuid模块，用于生成文档ID
+import uuid
+
+# 导入需要的类型提示
+from typing import List, Dict, Optional, Tuple
+
+# 导入numpy，用于批量归一化分数
+import numpy as np
+
+# 导入 Document 类
+from langchain_core.documents import Document
+
+# 导入向量数据库接口基类
+from app.services.vectordb.base import VectorDBInterface
+
+# 导入集合句柄缓存
+from app.services.vectordb.handle_cache import CollectionHandleCache
+
+# 导入嵌入式向量索引
+from app.utils.vector_index import MANIFEST_FILE, VectorIndex
+
+# 导入全局配置
+from app.config import Config
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+
+# 定义 numpy 向量数据库实现类
+class NumpyVectorDB(VectorDBInterface):
+    """嵌入式 numpy 向量数据库实现"""
+
+    # 度量类型写入清单，重建只改变存储精度
+    FIXED_OPTIONS = ("metric_type",)
+
+    def __init__(self, index_dir: Optional[str] = None):
+        """
+        初始化 numpy 向量数据库
+
+        Args:
+            index_dir: 索引根目录，为 None 时使用配置中的值，相对路径基于项目根目录
+        """
+        if index_dir is None:
+            index_dir = Config.NUMPY_VECTOR_DIR or os.path.join(
+                Config.STORAGE_DIR, "vector_index"
+            )
+        if not os.path.isabs(index_dir):
+            index_dir = os.path.join(Config.BASE_DIR, index_dir)
+        self.index_dir = index_dir
+        # 集合句柄缓存，空闲的集合会被淘汰以释放内存映射
+        self._handles = CollectionHandleCache()
+        logger.info(f"numpy 向量库已初始化, 索引目录: {index_dir}")
+
+    # 获取或创建集合（向量索引），优先从句柄缓存中获取
+    def get_or_create_collection(self, collection_name: str) -> VectorIndex:
+        return self._handles.get(collection_name, self._create_collection)
+
+    # 释放集合句柄
+    def release_collection(self, collection_name: str) -> None:
+        self._handles.invalidate(collection_name)
+
+    # 打开集合对应的向量索引，目录在第一次写入时创建，度量类型和存储精度只在创建时生效
+    def _create_collection(self, collection_name: str) -> VectorIndex:
+        options = self.collection_options(collection_name)
+        return VectorIndex(
+            os.path.join(self.index_dir, collection_name),
+            metric=(options.get("metric_type") or Config.NUMPY_VECTOR_METRIC).lower(),
+            dtype=options.get("precision") or Config.NUMPY_VECTOR_DTYPE,
+            max_segments=Config.NUMPY_VECTOR_MAX_SEGMENTS,
+            merge_factor=Config.NUMPY_VECTOR_MERGE_FACTOR,
+            compact_dead_ratio=Config.NUMPY_VECTOR_COMPACT_DEAD_RATIO,
+            ivf_min_rows=Config.NUMPY_VECTOR_IVF_MIN_ROWS,
+            ivf_nlist=Config.NUMPY_VECTOR_IVF_NLIST,
+            nprobe=Config.NUMPY_VECTOR_NPROBE,
+            pq_m=Config.NUMPY_VECTOR_PQ_M,
+            rerank_factor=Config.NUMPY_VECTOR_RERANK_FACTOR,
+        )
+
+    # 清单在第一次写入时创建，之前修改度量类型仍然有效
+    def collection_exists(self, collection_name: str) -> bool:
+        return os.path.exists(
+            os.path.join(self.index_dir, collection_name, MANIFEST_FILE)
+        )
+
+    # 按集合当前的存储精度重写所有段，度量类型在创建后不能修改
+    def rebuild_index(self, collection_name: str) -> None:
+        precision = self.collection_options(collection_name).get("precision")
+        count = self.get_or_create_collection(collection_name).rebuild(dtype=precision)
+        logger.info(f"已重建 numpy 集合 {collection_name}，共 {count} 个向量")
+
+    # 向集合添加文档（先向量化）
+    def add_documents(
+        self,
+        collection_name: str,
+        documents: List[Document],
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        embeddings = self.embeddings.embed_documents(
+            [doc.page_content for doc in documents]
+        )
+        return self.add_embeddings(collection_name, documents, embeddings, ids=ids)
+
+    # 向集合添加已计算好向量的文档，相同ID的文档会被替换
+    def add_embeddings(
+        self,
+        collection_name: str,
+        documents: List[Document],
+        embeddings: List[List[float]],
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        if not ids:
+            ids = [uuid.uuid4().hex for _ in documents]
+        self.get_or_create_collection(collection_name).upsert(
+            ids=ids,
+            vectors=embeddings,
+            texts=[doc.page_content for doc in documents],
+            metadatas=[doc.metadata for doc in documents],
+        )
+        logger.info(f"已向 numpy 集合 {collection_name} 写入 {len(documents)} 个向量")
+        return ids
+
+    # 写入已经落盘，刷新时检查是否需要在后台合并段或训练 IVF
+    def flush(self, collection_name: str) -> None:
+        self.get_or_create_collection(collection_name).maybe_compact()
+
+    # 删除文档
+    def delete_documents(
+        self,
+        collection_name: str,
+        ids: Optional[List[str]] = None,
+        filter: Optional[Dict] = None,
+    ) -> int:
+        index = self.get_or_create_collection(collection_name)
+        if ids:
+            deleted = index.delete(ids)
+        elif filter:
+            deleted = index.delete_where(filter)
+        else:
+            raise ValueError("你既没有传ids,也没有传filter")
+        # 删除较多时在后台重写段
+        index.maybe_compact()
+        logger.info(f"已经从numpy集合{collection_name}删除{deleted}个文档")
+        return deleted
+
+    # 删除整个集合
+    def delete_collection(self, collection_name: str) -> int:
+        deleted = self.get_or_create_collection(collection_name).drop()
+        self.release_collection(collection_name)
+        logger.info(f"已删除numpy集合{collection_name}，共{deleted}个文档")
+        return deleted
+
+    # 查询满足过滤条件的所有文档ID
+    def get_ids(self, collection_name: str, filter: Dict) -> List[str]:
+        return self.get_or_create_collection(collection_name).get_ids(filter)
+
+    # 按分块序号分页列出文档的分块
+    def list_chunks(
+        self, collection_name: str, doc_id: str, offset: int = 0, limit: int = 100
+    ) -> List[Document]:
+        # 按文档ID和当前页的序号过滤，只解码当前页分块的文本
+        documents = self.get_or_create_collection(collection_name).get_documents(
+            {"doc_id": doc_id, "chunk_index": list(range(offset, offset + limit))}
+        )
+        documents.sort(key=lambda d: d.metadata.get("chunk_index", 0))
+        return documents
+
+    # 使用多个查询向量批量检索
+    def search_by_vectors(
+        self,
+        collection_name: str,
+        vectors: List[List[float]],
+        k: int = 5,
+        filter: Optional[Dict] = None,
+        search_params: Optional[Dict] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        if not vectors:
+            return []
+        return self.get_or_create_collection(collection_name).search(
+            vectors, k=k, filter=filter, nprobe=(search_params or {}).get("nprobe")
+        )
+
+    # 将原始分数批量转换为 [0, 1] 的相关度
+    def relevance_scores(self, collection_name: str, scores: List[float]) -> np.ndarray:
+        if not scores:
+            return np.zeros(0, dtype=np.float32)
+        metric = self.get_or_create_collection(collection_name).metric
+        values = np.asarray(scores, dtype=np.float32)
+        if metric == "cosine":
+            # 余弦相似度，与 Chroma 的 1 - 余弦距离一致
+            relevance = values
+        elif metric == "ip":
+            # 归一化向量的内积范围 [-1, 1]
+            relevance = (values + 1.0) / 2.0
+        else:
+            # 归一化向量的平方欧氏距离范围 [0, 4]
+            relevance = 1.0 - values / 4.0
+        return np.clip(relevance, 0.0, 1.0)
+
+    # 定义相似度方法
+    def similarity_search(
+        self, collection_name, query, k=5, filter=None
+    ) -> List[Document]:
+        results = self.similarity_search_with_score(
+            collection_name, query, k=k, filter=filter
+        )
+        return [doc for doc, _ in results]
+
+    # 定义带分数的相似度搜索方法
+    def similarity_search_with_score(
+        self, collection_name, query, k=5, filter=None
+    ) -> List[Tuple[Document, float]]:
+        vector = self.embed_query(query)
+        return self.search_by_vector(collection_name, vector, k=k, filter=filter)
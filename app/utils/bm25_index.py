@@ -0,0 +1,556 @@
+"""
+BM25 关键词索引
+每个知识库一个索引目录，由若干不可变的段（segment）和一个清单文件（manifest）组成：
+- 每次处理文档写入一个新段，删除文档只记录墓碑，不修改已有的段
+- 段内的倒排表、词频、文档长度和文本都保存为 numpy 数组，加载时内存映射
+- 段数或已删除比例超过阈值时合并为一个段
+"""
+
+# 导入json模块，用于读写清单和元数据
+import json
+
+# 导入日志模块
+import logging
+
+# 导入math模块，用于计算 idf
+import math
+
+# 导入os模块，用于处理文件和路径
+import os
+
+# 导入shutil模块，用于删除段目录
+import shutil
+
+# 导入线程模块，用于加锁
+import threading
+
+# 导入上下文管理器装饰器
+from contextlib import contextmanager
+
+# 导入计数器，用于统计词频
+from collections import Counter, defaultdict
+
+# 导入类型提示
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 导入jieba分词
+import jieba
+
+# 导入numpy，用于存储倒排表和计算分数
+import numpy as np
+
+# 导入 LangChain 的 Document 类型
+from langchain_core.documents import Document
+
+# fcntl 只在类 Unix 系统上可用，用于多进程写入时加文件锁
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 关闭 jieba 初始化时的调试输出
+jieba.setLogLevel(logging.WARNING)
+
+# 清单文件名
+MANIFEST_FILE = "manifest.json"
+# 锁文件名
+LOCK_FILE = ".lock"
+# 构建段时复制文本字节的块大小
+TEXT_COPY_BLOCK_BYTES = 1 << 20
+
+
+# 分词：中文使用 jieba 搜索引擎模式，英文转为小写，去掉空白和标点
+def tokenize(text: str) -> List[str]:
+    return [
+        token
+        for token in jieba.cut_for_search(text.lower())
+        if token.strip() and any(ch.isalnum() for ch in token)
+    ]
+
+
+# 定义 BM25 段
+class BM25Segment:
+    """
+    不可变的索引段，目录中包含：
+    - terms.json: 词 -> 倒排表在数组中的 [起始, 结束) 位置
+    - postings.npy: 段内分块序号（int32），按词连续存放
+    - freqs.npy: 对应的词频（uint16）
+    - doc_len.npy: 每个分块的词数（int32）
+    - texts.npy / text_offsets.npy: 所有分块文本的 utf-8 字节及偏移
+    - chunks.json: 分块ID、文档ID和元数据
+    """
+
+    def __init__(self, path: str, seq: int):
+        """
+        加载段，数组以内存映射方式打开
+
+        参数:
+            path: 段目录
+            seq: 段序号，用于判断墓碑
+        """
+        self.path = path
+        self.seq = seq
+        with open(os.path.join(path, "terms.json"), "r", encoding="utf-8") as f:
+            self.terms: Dict[str, List[int]] = json.load(f)
+        with open(os.path.join(path, "chunks.json"), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        self.chunk_ids: List[str] = chunks["chunk_ids"]
+        self.doc_ids: List[str] = chunks["doc_ids"]
+        self.metadatas: List[dict] = chunks["metadatas"]
+        self.postings = np.load(os.path.join(path, "postings.npy"), mmap_mode="r")
+        self.freqs = np.load(os.path.join(path, "freqs.npy"), mmap_mode="r")
+        self.doc_len = np.load(os.path.join(path, "doc_len.npy"), mmap_mode="r")
+        self.texts = np.load(os.path.join(path, "texts.npy"), mmap_mode="r")
+        self.text_offsets = np.load(
+            os.path.join(path, "text_offsets.npy"), mmap_mode="r"
+        )
+
+    # 段内分块数
+    @property
+    def size(self) -> int:
+        return len(self.chunk_ids)
+
+    # 获取某个词的倒排表
+    def get_postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        span = self.terms.get(term)
+        if span is None:
+            return None
+        start, end = span
+        return self.postings[start:end], self.freqs[start:end]
+
+    # 读取分块文本
+    def get_text(self, index: int) -> str:
+        start, end = self.text_offsets[index], self.text_offsets[index + 1]
+        return bytes(self.texts[start:end]).decode("utf-8")
+
+    # 读取分块对象
+    def get_document(self, index: int) -> Document:
+        return Document(
+            id=self.chunk_ids[index],
+            page_content=self.get_text(index),
+            metadata=dict(self.metadatas[index]),
+        )
+
+    # 遍历段内满足条件的分块
+    def iter_documents(self, live: np.ndarray) -> Iterator[Tuple[str, Document]]:
+        for index in np.flatnonzero(live):
+            yield self.doc_ids[index], self.get_document(int(index))
+
+    # 根据分块构建一个新段
+    @classmethod
+    def build(
+        cls, path: str, seq: int, chunks: Iterable[Tuple[str, Document]]
+    ) -> Optional["BM25Segment"]:
+        """
+        构建段并写入磁盘，分块文本边读边写入临时文件，不在内存中拼接
+
+        参数:
+            path: 段目录
+            seq: 段序号
+            chunks: (文档ID, 分块 Document) 的可迭代对象，分块ID取自 Document.id 或元数据中的 chunk_id
+
+        返回:
+            加载好的段，没有任何分块时返回 None
+        """
+        # 先写入临时目录，完成后重命名，避免留下不完整的段
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        # 词 -> [(分块序号, 词频)]
+        inverted: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        chunk_ids, doc_ids, metadatas, doc_len = [], [], [], []
+        text_offsets = [0]
+        with open(os.path.join(tmp_path, "texts.bin"), "wb") as text_file:
+            for index, (doc_id, doc) in enumerate(chunks):
+                tokens = tokenize(doc.page_content)
+                for term, tf in Counter(tokens).items():
+                    inverted[term].append((index, tf))
+                chunk_ids.append(doc.id or doc.metadata.get("chunk_id"))
+                doc_ids.append(doc_id)
+                metadatas.append(doc.metadata)
+                doc_len.append(len(tokens))
+                encoded = doc.page_content.encode("utf-8")
+                text_file.write(encoded)
+                text_offsets.append(text_offsets[-1] + len(encoded))
+        if not chunk_ids:
+            shutil.rmtree(tmp_path)
+            return None
+
+        # 倒排表按词连续存放
+        terms, postings, freqs = {}, [], []
+        position = 0
+        for term, entries in inverted.items():
+            terms[term] = [position, position + len(entries)]
+            position += len(entries)
+            for index, tf in entries:
+                postings.append(index)
+                freqs.append(min(tf, np.iinfo(np.uint16).max))
+
+        with open(os.path.join(tmp_path, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+        with open(os.path.join(tmp_path, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {"chunk_ids": chunk_ids, "doc_ids": doc_ids, "metadatas": metadatas},
+                f,
+                ensure_ascii=False,
+            )
+        np.save(os.path.join(tmp_path, "postings.npy"), np.asarray(postings, np.int32))
+        np.save(os.path.join(tmp_path, "freqs.npy"), np.asarray(freqs, np.uint16))
+        np.save(os.path.join(tmp_path, "doc_len.npy"), np.asarray(doc_len, np.int32))
+        cls._write_texts(tmp_path, text_offsets[-1])
+        np.save(
+            os.path.join(tmp_path, "text_offsets.npy"),
+            np.asarray(text_offsets, np.int64),
+        )
+        os.replace(tmp_path, path)
+        return cls(path, seq)
+
+    # 把临时文件中的文本字节分块复制到 texts.npy
+    @staticmethod
+    def _write_texts(path: str, size: int) -> None:
+        raw_path = os.path.join(path, "texts.bin")
+        if not size:
+            np.save(os.path.join(path, "texts.npy"), np.zeros(0, dtype=np.uint8))
+            os.remove(raw_path)
+            return
+        texts = np.lib.format.open_memmap(
+            os.path.join(path, "texts.npy"), mode="w+", dtype=np.uint8, shape=(size,)
+        )
+        position = 0
+        with open(raw_path, "rb") as f:
+            while True:
+                block = f.read(TEXT_COPY_BLOCK_BYTES)
+                if not block:
+                    break
+                texts[position : position + len(block)] = np.frombuffer(block, np.uint8)
+                position += len(block)
+        texts.flush()
+        del texts
+        os.remove(raw_path)
+
+
+# 定义 BM25 索引
+class BM25Index:
+    """
+    单个知识库的 BM25 索引
+
+    清单文件记录段列表、墓碑和下一个序号。墓碑 {文档ID: 序号} 表示该文档在序号
+    小于该值的段中的分块均已失效：重新处理文档时写入新段并把墓碑设为新段的序号，
+    删除文档时把墓碑设为下一个序号
+    """
+
+    def __init__(
+        self,
+        path: str,
+        k1: float = 1.5,
+        b: float = 0.75,
+        max_segments: int = 8,
+        compact_dead_ratio: float = 0.3,
+    ):
+        """
+        参数:
+            path: 索引目录
+            k1: BM25 词频饱和参数
+            b: BM25 文档长度归一化参数
+            max_segments: 段数超过该值时合并
+            compact_dead_ratio: 已删除分块比例超过该值时合并
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        self.compact_dead_ratio = compact_dead_ratio
+        # 保护内存中索引状态的锁，检索时只在读取快照时持有
+        self._lock = threading.RLock()
+        # 串行化写入的锁，构建段期间不阻塞检索
+        self._write_mutex = threading.Lock()
+        # 已加载的清单修改时间，变化时重新加载（其他进程可能写入了新段）
+        self._manifest_mtime: Optional[float] = None
+        self._segments: List[BM25Segment] = []
+        self._tombstones: Dict[str, int] = {}
+        self._next_seq = 0
+        # 每个段的存活分块掩码
+        self._live: List[np.ndarray] = []
+        # 存活分块数和总词数，用于计算 idf 和平均长度
+        self._live_count = 0
+        self._live_tokens = 0
+        self._dead_count = 0
+
+    # 清单文件路径
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.path, MANIFEST_FILE)
+
+    # 跨进程的写锁
+    @contextmanager
+    def _write_lock(self):
+        with self._write_mutex:
+            os.makedirs(self.path, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.path, LOCK_FILE), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # 读取清单，清单不存在时返回空索引
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"segments": [], "tombstones": {}, "next_seq": 0}
+
+    # 原子地写入清单
+    def _write_manifest(self) -> None:
+        manifest = {
+            "segments": [os.path.basename(seg.path) for seg in self._segments],
+            "tombstones": self._tombstones,
+            "next_seq": self._next_seq,
+        }
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+
+    # 清单变化时重新加载，已打开的段会被复用（调用方需持有 _lock）
+    def _refresh(self, force: bool = False) -> None:
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if not force and mtime == self._manifest_mtime:
+            return
+        opened = {os.path.basename(seg.path): seg for seg in self._segments}
+        # 其他进程可能在读取清单后合并并删除了段，此时重新读取清单
+        for attempt in range(3):
+            manifest = self._read_manifest()
+            try:
+                segments = [
+                    opened.get(name)
+                    or BM25Segment(
+                        os.path.join(self.path, name), int(name.split("_")[1])
+                    )
+                    for name in manifest["segments"]
+                ]
+                break
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+        self._segments = segments
+        self._tombstones = manifest["tombstones"]
+        self._next_seq = manifest["next_seq"]
+        self._manifest_mtime = mtime
+        self._update_live()
+
+    # 根据墓碑重新计算每个段的存活掩码和统计信息（调用方需持有 _lock）
+    def _update_live(self) -> None:
+        lives = []
+        self._live_count = 0
+        self._live_tokens = 0
+        self._dead_count = 0
+        for segment in self._segments:
+            live = np.fromiter(
+                (
+                    self._tombstones.get(doc_id, -1) <= segment.seq
+                    for doc_id in segment.doc_ids
+                ),
+                dtype=bool,
+                count=segment.size,
+            )
+            lives.append(live)
+            self._live_count += int(live.sum())
+            self._live_tokens += int(segment.doc_len[live].sum())
+            self._dead_count += segment.size - int(live.sum())
+        # 整体替换，检索线程持有的旧快照不受影响
+        self._live = lives
+
+    # 新段的目录
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.path, f"seg_{seq:08d}")
+
+    # 写入或替换一个文档的所有分块
+    def add_document(self, doc_id: str, documents: Iterable[Document]) -> None:
+        """
+        为文档写入一个新段，并使该文档在旧段中的分块失效
+
+        参数:
+            doc_id: 文档ID
+            documents: 文档当前版本的所有分块
+        """
+        with self._write_lock():
+            with self._lock:
+                self._refresh(force=True)
+                seq = self._next_seq
+            # 构建段时不持有 _lock，检索不受影响
+            segment = BM25Segment.build(
+                self._segment_path(seq), seq, ((doc_id, doc) for doc in documents)
+            )
+            with self._lock:
+                if segment is not None:
+                    self._segments = self._segments + [segment]
+                self._tombstones[doc_id] = seq
+                self._next_seq = seq + 1
+                self._update_live()
+                self._write_manifest()
+            self._maybe_compact()
+
+    # 删除一个文档的所有分块
+    def delete_document(self, doc_id: str) -> None:
+        """使该文档在所有段中的分块失效"""
+        with self._write_lock():
+            with self._lock:
+                self._refresh(force=True)
+                self._tombstones[doc_id] = self._next_seq
+                self._next_seq += 1
+                self._update_live()
+                self._write_manifest()
+            self._maybe_compact()
+
+    # 段数或已删除比例超过阈值时合并（调用方需持有写锁）
+    def _maybe_compact(self) -> None:
+        total = self._live_count + self._dead_count
+        if len(self._segments) > self.max_segments or (
+            total and self._dead_count / total > self.compact_dead_ratio
+        ):
+            self._compact()
+
+    # 合并所有段为一个新段，并清空墓碑
+    def compact(self) -> None:
+        with self._write_lock():
+            with self._lock:
+                self._refresh(force=True)
+            self._compact()
+
+    # 合并（调用方需持有写锁）
+    def _compact(self) -> None:
+        with self._lock:
+            old_segments, old_live = self._segments, self._live
+            seq = self._next_seq
+
+        def iter_live():
+            for segment, live in zip(old_segments, old_live):
+                yield from segment.iter_documents(live)
+
+        # 构建新段时不持有 _lock，检索继续使用旧段
+        segment = BM25Segment.build(self._segment_path(seq), seq, iter_live())
+        with self._lock:
+            self._segments = [segment] if segment is not None else []
+            # 新段序号大于所有墓碑，墓碑已无意义
+            self._tombstones = {}
+            self._next_seq = seq + 1
+            self._update_live()
+            self._write_manifest()
+        # 旧段文件可以直接删除，已打开的内存映射在 Linux 上仍然有效
+        for old in old_segments:
+            shutil.rmtree(old.path, ignore_errors=True)
+        logger.info(
+            f"关键词索引 {self.path} 已合并 {len(old_segments)} 个段, 存活分块 {self._live_count} 个"
+        )
+
+    # 关键词检索
+    def search(
+        self, query: str, k: int = 5, doc_ids: Optional[Iterable[str]] = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        BM25 检索，只读取查询词的倒排表，不扫描所有分块
+
+        参数:
+            query: 查询文本
+            k: 返回结果数量
+            doc_ids: 只在这些文档中检索（可选）
+
+        返回:
+            按分数从高到低排序的 (Document, BM25 分数) 列表
+        """
+        with self._lock:
+            self._refresh()
+            segments, lives = list(self._segments), list(self._live)
+            live_count, live_tokens = self._live_count, self._live_tokens
+        terms = set(tokenize(query))
+        if not terms or not live_count:
+            return []
+        avgdl = live_tokens / live_count
+        allowed = set(doc_ids) if doc_ids is not None else None
+
+        # 统计每个词在存活分块中的文档频率
+        term_postings = {}
+        for term in terms:
+            per_segment = []
+            df = 0
+            for segment, live in zip(segments, lives):
+                postings = segment.get_postings(term)
+                if postings is None:
+                    continue
+                docs, tfs = postings
+                docs = np.asarray(docs)
+                mask = live[docs]
+                df += int(mask.sum())
+                per_segment.append((segment, docs[mask], np.asarray(tfs)[mask]))
+            if df:
+                idf = math.log(1 + (live_count - df + 0.5) / (df + 0.5))
+                term_postings[term] = (idf, per_segment)
+
+        # 每个段内累加各个词的分数，只处理命中的分块
+        candidates: List[Tuple[float, BM25Segment, int]] = []
+        for segment in segments:
+            docs_list, weights_list = [], []
+            for idf, per_segment in term_postings.values():
+                for seg, docs, tfs in per_segment:
+                    if seg is not segment or not len(docs):
+                        continue
+                    tf = tfs.astype(np.float32)
+                    dl = np.asarray(segment.doc_len)[docs].astype(np.float32)
+                    weights = (
+                        idf
+                        * tf
+                        * (self.k1 + 1)
+                        / (tf + self.k1 * (1 - self.b + self.b * dl / avgdl))
+                    )
+                    docs_list.append(docs)
+                    weights_list.append(weights)
+            if not docs_list:
+                continue
+            unique_docs, inverse = np.unique(
+                np.concatenate(docs_list), return_inverse=True
+            )
+            scores = np.bincount(inverse, weights=np.concatenate(weights_list))
+            if allowed is not None:
+                keep = np.fromiter(
+                    (segment.doc_ids[i] in allowed for i in unique_docs),
+                    dtype=bool,
+                    count=len(unique_docs),
+                )
+                unique_docs, scores = unique_docs[keep], scores[keep]
+            if len(scores) > k:
+                top = np.argpartition(-scores, k)[:k]
+                unique_docs, scores = unique_docs[top], scores[top]
+            candidates.extend(
+                (float(score), segment, int(index))
+                for index, score in zip(unique_docs, scores)
+            )
+
+        candidates.sort(key=lambda item: item[0], reverse=True)
+        return [
+            (segment.get_document(index), score)
+            for score, segment, index in candidates[:k]
+        ]
+
+    # 索引统计信息
+    def stats(self) -> dict:
+        with self._lock:
+            self._refresh()
+            return {
+                "segments": len(self._segments),
+                "live_chunks": self._live_count,
+                "dead_chunks": self._dead_count,
+                "tombstones": len(self._tombstones),
+            }
@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.schema import CreateColumn
 from app.config import Config
 from sqlalchemy.pool import QueuePool
 from sqlalchemy.orm import sessionmaker
@@ -10,6 +11,24 @@ from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# 已有表中新增的列 (表名, 列名)。create_all 只创建不存在的表，不会修改已有的表，
+# 启动时为旧数据库补齐这些列及其单列索引；新增的表由 create_all 直接创建
+SCHEMA_UPGRADES = [
+    # 上传时计算的文件内容 sha256 哈希
+    ("document", "file_hash"),
+    # 知识库的向量检索参数
+    ("knowledgebase", "search_params"),
+    # 系统设置中的 IVF / HNSW 检索参数默认值
+    ("settings", "vector_nprobe"),
+    ("settings", "vector_ef"),
+    # 知识库的向量存储精度
+    ("knowledgebase", "vector_precision"),
+    # 知识库的度量类型、索引类型和索引构建参数
+    ("knowledgebase", "metric_type"),
+    ("knowledgebase", "index_type"),
+    ("knowledgebase", "index_params"),
+]
+
 
 def get_database_url():
     return (
@@ -70,10 +89,45 @@ def db_transaction():
         session.close()
 
 
+def upgrade_schema(bind=None):
+    """
+    为已有的表补齐 SCHEMA_UPGRADES 中缺少的列，可重复执行
+
+    参数:
+        bind: 数据库引擎，为 None 时使用默认引擎
+    """
+    bind = bind or engine
+    inspector = inspect(bind)
+    quote = bind.dialect.identifier_preparer.quote
+    for table_name, column_name in SCHEMA_UPGRADES:
+        existing = {column["name"] for column in inspector.get_columns(table_name)}
+        if column_name in existing:
+            continue
+        table = Base.metadata.tables[table_name]
+        column = table.columns[column_name]
+        column_ddl = CreateColumn(column).compile(dialect=bind.dialect)
+        with bind.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {quote(table_name)} ADD COLUMN {column_ddl}"))
+            # 已有的行按列的默认值回填
+            if column.default is not None and column.default.is_scalar:
+                conn.execute(
+                    table.update()
+                    .where(column.is_(None))
+                    .values({column_name: column.default.arg})
+                )
+            # 创建只包含该列的索引
+            for index in table.indexes:
+                if [c.name for c in index.columns] == [column_name]:
+                    index.create(conn)
+        logger.info(f"已为表 {table_name} 添加列 {column_name}")
+
+
 def init_db():
     try:
         # 使用引擎来创建数据库的表结构
         Base.metadata.create_all(engine)
+        # 为已有的表补齐新增的列
+        upgrade_schema()
     except Exception as e:
         logger.error(f"初始化数据库失败:{e}")
         raise
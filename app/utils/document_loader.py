@@ -6,7 +6,7 @@
 import logging
 
 # 导入类型注解
-from typing import List
+from typing import Iterator, List
 
 # 导入LangChain社区的文档加载器
 from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
@@ -169,3 +169,59 @@ class DocumentLoader:
         else:
             # 不支持文件类型抛异常
             raise ValueError(f"Unsupported file type: {file_type}")
+
+    @staticmethod
+    def lazy_load(file_path: str, file_type: str) -> Iterator[Document]:
+        """
+        按页（或按文件）惰性加载本地文件，每次只在内存中保留一页内容
+
+        Args:
+            file_path: 本地文件路径
+            file_type: 文件类型（pdf/docx/txt/md）
+
+        Yields:
+            Document 对象
+        """
+        # 文件类型小写化，统一处理
+        file_type = file_type.lower()
+        # PDF文件，逐页产出
+        if file_type == "pdf":
+            loader = PyPDFLoader(file_path)
+        # DOCX文件，整个文件作为一个 Document
+        elif file_type == "docx":
+            loader = Docx2txtLoader(file_path)
+        # 文本文件/markdown
+        elif file_type in ["txt", "md"]:
+            yield from DocumentLoader._lazy_load_text(file_path)
+            return
+        else:
+            # 不支持文件类型抛异常
+            raise ValueError(f"Unsupported file type: {file_type}")
+        try:
+            yield from loader.lazy_load()
+        except Exception as e:
+            logger.error(f"加载 {file_type.upper()} 时出错: {e}")
+            raise ValueError(f"Failed to load {file_type.upper()}: {str(e)}")
+
+    @staticmethod
+    def _lazy_load_text(file_path: str) -> Iterator[Document]:
+        """
+        惰性加载文本文件，utf-8 解码失败时用 gbk 重试
+
+        Args:
+            file_path: 本地文件路径
+
+        Yields:
+            Document 对象
+        """
+        try:
+            # 优先尝试 utf-8 编码
+            documents = list(TextLoader(file_path, encoding="utf-8").lazy_load())
+        except (UnicodeDecodeError, RuntimeError):
+            # 编码失败自动用gbk重试
+            try:
+                documents = list(TextLoader(file_path, encoding="gbk").lazy_load())
+            except Exception as e:
+                logger.error(f"加载文本文件时出错: {e}")
+                raise ValueError(f"Failed to load text file: {str(e)}")
+        yield from documents
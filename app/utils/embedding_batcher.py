@@ -0,0 +1,143 @@
+"""
+Embedding 批处理器
+按文本长度分组，控制每批的数量和总字符数，避免一次性向量化过多分块
+"""
+
+# 导入日志模块
+import logging
+
+# 导入时间模块，用于统计每批耗时
+import time
+
+# 导入类型提示
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+# 导入 LangChain 的 Document 类型
+from langchain_core.documents import Document
+
+# 导入全局配置
+from app.config import Config
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+
+# 定义 Embedding 批处理器
+class EmbeddingBatcher:
+    """Embedding 批处理器"""
+
+    def __init__(
+        self,
+        max_batch_size: Optional[int] = None,
+        max_batch_chars: Optional[int] = None,
+        length_function: Callable[[str], int] = len,
+        window_batches: Optional[int] = None,
+    ):
+        """
+        初始化批处理器
+
+        Args:
+            max_batch_size: 每批最多的分块数，为 None 时使用 Config.EMBED_BATCH_SIZE
+            max_batch_chars: 每批最多的字符数，为 None 时使用 Config.EMBED_BATCH_MAX_CHARS
+            length_function: 计算文本长度的函数，用作 token 数的近似
+            window_batches: 流式分批时，每次缓冲多少个批次的数据用于按长度排序，
+                为 None 时使用 Config.EMBED_BATCH_WINDOW
+        """
+        self.max_batch_size = max_batch_size or Config.EMBED_BATCH_SIZE
+        self.max_batch_chars = max_batch_chars or Config.EMBED_BATCH_MAX_CHARS
+        self.length_function = length_function
+        self.window_batches = window_batches or Config.EMBED_BATCH_WINDOW
+
+    # 将文档划分为若干批次
+    def make_batches(
+        self, documents: List[Document], ids: List[str]
+    ) -> Iterator[Tuple[List[Document], List[str]]]:
+        """
+        将文档划分为批次：先按长度排序，使同一批内长度相近以减少 padding，
+        再按数量和总字符数两个上限切分
+
+        Args:
+            documents: Document 列表
+            ids: 与 documents 一一对应的ID列表
+
+        Yields:
+            (Document 列表, ID列表) 元组
+        """
+        # 计算每个文档的长度
+        lengths = [self.length_function(doc.page_content) for doc in documents]
+        # 按长度排序下标
+        order = sorted(range(len(documents)), key=lambda i: lengths[i])
+
+        batch: List[int] = []
+        batch_chars = 0
+        for i in order:
+            # 当前批次已满（数量或字符数达到上限），先输出
+            if batch and (
+                len(batch) >= self.max_batch_size
+                or batch_chars + lengths[i] > self.max_batch_chars
+            ):
+                yield [documents[j] for j in batch], [ids[j] for j in batch]
+                batch, batch_chars = [], 0
+            batch.append(i)
+            batch_chars += lengths[i]
+        # 输出最后一个批次
+        if batch:
+            yield [documents[j] for j in batch], [ids[j] for j in batch]
+
+    # 对数据流进行分批
+    def iter_batches(
+        self, pairs: Iterable[Tuple[Document, str]]
+    ) -> Iterator[Tuple[List[Document], List[str]]]:
+        """
+        对 (Document, ID) 数据流进行分批：每次只缓冲 window_batches 个批次的数据，
+        在缓冲窗口内按长度排序切分，内存占用与批大小成正比而不是与文档大小成正比
+
+        Args:
+            pairs: (Document, ID) 可迭代对象
+
+        Yields:
+            (Document 列表, ID列表) 元组
+        """
+        window_size = self.max_batch_size * self.window_batches
+        documents: List[Document] = []
+        ids: List[str] = []
+        for document, doc_id in pairs:
+            documents.append(document)
+            ids.append(doc_id)
+            # 缓冲窗口已满，切分并输出
+            if len(documents) >= window_size:
+                yield from self.make_batches(documents, ids)
+                documents, ids = [], []
+        # 输出剩余数据
+        if documents:
+            yield from self.make_batches(documents, ids)
+
+    # 分批执行处理函数并统计耗时
+    def run(
+        self,
+        pairs: Iterable[Tuple[Document, str]],
+        handler: Callable[[List[Document], List[str]], object],
+    ) -> List[dict]:
+        """
+        流式分批调用 handler，并记录每批的耗时
+
+        Args:
+            pairs: (Document, ID) 可迭代对象，可以是生成器
+            handler: 处理一批数据的函数，参数为 (Document 列表, ID列表)
+
+        Returns:
+            每批的统计信息列表，包含 batch, size, chars, seconds
+        """
+        stats = []
+        for index, (batch_docs, batch_ids) in enumerate(self.iter_batches(pairs)):
+            chars = sum(self.length_function(d.page_content) for d in batch_docs)
+            start = time.perf_counter()
+            handler(batch_docs, batch_ids)
+            elapsed = time.perf_counter() - start
+            stats.append(
+                {"batch": index, "size": len(batch_docs), "chars": chars, "seconds": elapsed}
+            )
+            logger.info(
+                f"批次 {index}: {len(batch_docs)} 个分块, {chars} 字符, 耗时 {elapsed * 1000:.1f} ms"
+            )
+        return stats
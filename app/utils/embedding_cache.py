@@ -0,0 +1,460 @@
+"""
+Embedding 缓存
+按 (模型, 文本 sha256) 持久化缓存文本向量，避免重复计算未变化的分块；
+查询向量另有一层进程内 LRU 缓存，重复和热门查询无需再调用模型
+"""
+
+# 导入哈希模块，用于计算文本摘要
+import hashlib
+
+# 导入日志模块
+import logging
+
+# 导入 os 模块，用于处理缓存文件路径
+import os
+
+# 导入 sqlite3，作为持久化存储
+import sqlite3
+
+# 导入线程模块，保护数据库连接
+import threading
+
+# 导入时间模块，用于记录最近访问时间
+import time
+
+# 导入有序字典，用于实现查询向量的 LRU
+from collections import OrderedDict
+
+# 导入类型提示
+from typing import Dict, List, Optional, Tuple
+
+# 导入 numpy，用于向量的二进制编码
+import numpy as np
+
+# 导入 LangChain 的 Embeddings 抽象类型
+from langchain_core.embeddings import Embeddings
+
+# 导入 Ollama Embeddings 类，其查询和文档向量化使用不同的指令前缀
+from langchain_community.embeddings import OllamaEmbeddings
+
+# 导入全局配置
+from app.config import Config
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+
+# 计算文本的 sha256 摘要
+def text_hash(text: str) -> str:
+    """返回文本的 sha256 十六进制摘要"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# 定义基于 SQLite 的持久化 Embedding 缓存
+class EmbeddingCache:
+    """基于 SQLite 的持久化 Embedding 缓存，按最近访问时间做 LRU 淘汰"""
+
+    def __init__(self, path: str, max_entries: int = 500000):
+        """
+        初始化缓存
+
+        Args:
+            path: SQLite 文件路径
+            max_entries: 缓存的最大条目数，超过后淘汰最久未访问的条目
+        """
+        # 保证缓存目录存在
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        # 单连接 + 锁，允许多个线程共享
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # WAL 模式允许多个进程同时读写
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_access "
+            "ON embedding_cache (last_access)"
+        )
+        self._conn.commit()
+        # 近似的条目数，避免每次写入都执行 COUNT(*)
+        self._size = self._conn.execute(
+            "SELECT COUNT(*) FROM embedding_cache"
+        ).fetchone()[0]
+        # 命中与未命中计数
+        self.hits = 0
+        self.misses = 0
+        logger.info(f"Embedding 缓存已初始化: {path}, 条目数: {self._size}")
+
+    # 批量查询缓存
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """
+        批量查询缓存
+
+        Args:
+            model: 模型标识
+            hashes: 文本摘要列表
+
+        Returns:
+            命中的 {文本摘要: 向量} 字典
+        """
+        if not hashes:
+            return {}
+        found: Dict[str, List[float]] = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        with self._lock:
+            # SQLite 单条语句的参数个数有限，分批查询
+            for i in range(0, len(unique_hashes), 500):
+                batch = unique_hashes[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embedding_cache "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+            # 更新命中条目的最近访问时间
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embedding_cache SET last_access = ? "
+                    "WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found],
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(unique_hashes) - len(found)
+        return found
+
+    # 批量写入缓存
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        """
+        批量写入缓存
+
+        Args:
+            model: 模型标识
+            items: {文本摘要: 向量} 字典
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (model, h, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for h, vector in items.items()
+        ]
+        with self._lock:
+            # INSERT OR REPLACE 覆盖已有条目时不增加行数，只统计新增的条目
+            existing = 0
+            hashes = list(items)
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                existing += self._conn.execute(
+                    f"SELECT COUNT(*) FROM embedding_cache "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache "
+                "(model, text_hash, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._size += len(rows) - existing
+            # 超过容量时淘汰最久未访问的条目
+            if self._size > self.max_entries:
+                self._evict(self._size - self.max_entries)
+            self._conn.commit()
+
+    # 淘汰最久未访问的条目（调用方需持有锁）
+    def _evict(self, count: int) -> None:
+        """淘汰 count 条最久未访问的条目"""
+        cursor = self._conn.execute(
+            "DELETE FROM embedding_cache WHERE rowid IN ("
+            "SELECT rowid FROM embedding_cache ORDER BY last_access LIMIT ?)",
+            (count,),
+        )
+        # 其他进程也可能写入同一个缓存文件，淘汰后按实际行数重新同步
+        self._size = self._conn.execute(
+            "SELECT COUNT(*) FROM embedding_cache"
+        ).fetchone()[0]
+        logger.debug(f"Embedding 缓存淘汰 {cursor.rowcount} 条")
+
+    # 获取缓存统计信息
+    def stats(self) -> dict:
+        """返回条目数、命中数、未命中数和命中率"""
+        total = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+# 定义查询向量缓存
+class QueryEmbeddingCache:
+    """
+    查询向量的进程内 LRU 缓存，键为 (模型, 查询文本)
+
+    可选地以 SQLite 缓存作为二级缓存，在多个 worker 进程之间共享查询向量
+    """
+
+    def __init__(self, max_entries: int = 2048, shared: Optional[EmbeddingCache] = None):
+        """
+        初始化
+
+        Args:
+            max_entries: 内存中最多缓存的查询数
+            shared: 多进程共享的二级缓存，为 None 时只使用内存
+        """
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 命中（内存/共享缓存）与未命中计数
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    # 共享缓存中查询向量使用独立的模型标识，避免与同文本的文档向量混用
+    @staticmethod
+    def _shared_model(model: str) -> str:
+        return f"query:{model}"
+
+    # 批量查询缓存
+    def get_many(self, model: str, queries: List[str]) -> Dict[str, List[float]]:
+        """
+        批量查询缓存
+
+        Args:
+            model: 模型标识
+            queries: 查询文本列表
+
+        Returns:
+            命中的 {查询文本: 向量} 字典
+        """
+        found: Dict[str, List[float]] = {}
+        missing: List[str] = []
+        with self._lock:
+            for query in dict.fromkeys(queries):
+                vector = self._entries.get((model, query))
+                if vector is None:
+                    missing.append(query)
+                    continue
+                self._entries.move_to_end((model, query))
+                found[query] = vector
+            self.hits += len(found)
+        # 内存未命中的再查共享缓存，命中后回填内存
+        if missing and self.shared is not None:
+            hashes = {text_hash(query): query for query in missing}
+            shared = self.shared.get_many(self._shared_model(model), list(hashes))
+            if shared:
+                items = {hashes[h]: vector for h, vector in shared.items()}
+                self._put_memory(model, items)
+                found.update(items)
+                with self._lock:
+                    self.shared_hits += len(items)
+            missing = [query for query in missing if query not in found]
+        with self._lock:
+            self.misses += len(missing)
+        return found
+
+    # 批量写入缓存
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        """
+        批量写入缓存
+
+        Args:
+            model: 模型标识
+            items: {查询文本: 向量} 字典
+        """
+        if not items:
+            return
+        self._put_memory(model, items)
+        if self.shared is not None:
+            self.shared.put_many(
+                self._shared_model(model),
+                {text_hash(query): vector for query, vector in items.items()},
+            )
+
+    # 写入内存缓存，超出上限时淘汰最久未使用的查询
+    def _put_memory(self, model: str, items: Dict[str, List[float]]) -> None:
+        with self._lock:
+            for query, vector in items.items():
+                self._entries[(model, query)] = vector
+                self._entries.move_to_end((model, query))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # 获取缓存统计信息
+    def stats(self) -> dict:
+        """返回条目数、命中数、未命中数和命中率"""
+        with self._lock:
+            hits = self.hits + self.shared_hits
+            total = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+            }
+
+
+# 不经缓存地批量计算查询向量
+def embed_queries_uncached(model: Embeddings, queries: List[str]) -> List[List[float]]:
+    """一次模型调用计算多个查询的向量"""
+    if not queries:
+        return []
+    # Ollama 的查询和文档使用不同的指令前缀，只能逐个计算
+    if isinstance(model, OllamaEmbeddings):
+        return [model.embed_query(query) for query in queries]
+    # 其余模型的查询向量与单条文档向量一致，可以批量计算
+    return model.embed_documents(queries)
+
+
+# 定义带缓存的 Embeddings 包装类
+class CachedEmbeddings(Embeddings):
+    """
+    在 Embeddings 对象前加一层缓存：文档向量按内容寻址持久化缓存，
+    查询向量按 (模型, 查询文本) 做 LRU 缓存，只为未命中的文本调用模型
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_key: str,
+        cache: Optional[EmbeddingCache] = None,
+        query_cache: Optional[QueryEmbeddingCache] = None,
+    ):
+        """
+        初始化
+
+        Args:
+            embeddings: 被包装的 Embeddings 对象
+            model_key: 模型标识，不同模型的向量互不复用
+            cache: 文档向量缓存，为 None 时不缓存文档向量
+            query_cache: 查询向量缓存，为 None 时不缓存查询向量
+        """
+        self.embeddings = embeddings
+        self.model_key = model_key
+        self.cache = cache
+        self.query_cache = query_cache
+
+    # 向量化文档列表
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.cache is None:
+            return self.embeddings.embed_documents(texts)
+        # 计算所有文本的摘要
+        hashes = [text_hash(text) for text in texts]
+        # 查询缓存
+        cached = self.cache.get_many(self.model_key, hashes)
+        # 收集未命中的文本（同一批次中相同文本只计算一次）
+        missing: Dict[str, str] = {}
+        for h, text in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = text
+        # 只为未命中的文本调用模型
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_key, computed)
+            cached.update(computed)
+        logger.debug(
+            f"Embedding 缓存: 共 {len(texts)} 条, 计算 {len(missing)} 条"
+        )
+        # 按原始顺序返回向量
+        return [cached[h] for h in hashes]
+
+    # 向量化查询文本
+    def embed_query(self, text: str) -> List[float]:
+        if self.query_cache is None:
+            return self.embeddings.embed_query(text)
+        cached = self.query_cache.get_many(self.model_key, [text])
+        if text in cached:
+            return cached[text]
+        vector = self.embeddings.embed_query(text)
+        self.query_cache.put_many(self.model_key, {text: vector})
+        return vector
+
+    # 批量向量化查询文本
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """批量计算查询向量，只为缓存未命中的查询调用一次模型"""
+        if self.query_cache is None:
+            return embed_queries_uncached(self.embeddings, queries)
+        cached = self.query_cache.get_many(self.model_key, queries)
+        missing = [query for query in dict.fromkeys(queries) if query not in cached]
+        if missing:
+            computed = dict(
+                zip(missing, embed_queries_uncached(self.embeddings, missing))
+            )
+            self.query_cache.put_many(self.model_key, computed)
+            cached.update(computed)
+        return [cached[query] for query in queries]
+
+
+# 解析缓存文件路径
+def get_cache_path() -> str:
+    """返回 Embedding 缓存文件路径，相对路径基于项目根目录"""
+    path = Config.EMBEDDING_CACHE_PATH or os.path.join(
+        Config.STORAGE_DIR, "cache", "embedding_cache.db"
+    )
+    if not os.path.isabs(path):
+        path = os.path.join(Config.BASE_DIR, path)
+    return path
+
+
+# 懒加载的全局缓存实例
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+# 获取全局 Embedding 缓存
+def get_embedding_cache() -> EmbeddingCache:
+    """获取进程内共享的 Embedding 缓存（懒加载）"""
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache(
+                    get_cache_path(), max_entries=Config.EMBEDDING_CACHE_MAX_ENTRIES
+                )
+    return _embedding_cache
+
+
+# 懒加载的全局查询向量缓存实例
+_query_embedding_cache: Optional[QueryEmbeddingCache] = None
+_query_embedding_cache_lock = threading.Lock()
+
+
+# 获取全局查询向量缓存
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    """获取进程内共享的查询向量缓存（懒加载），切换模型后仍可复用，键中包含模型标识"""
+    global _query_embedding_cache
+    if _query_embedding_cache is None:
+        with _query_embedding_cache_lock:
+            if _query_embedding_cache is None:
+                # 启用共享时复用文档向量的 SQLite 缓存文件作为二级缓存
+                shared = (
+                    get_embedding_cache()
+                    if Config.QUERY_EMBEDDING_CACHE_SHARED
+                    else None
+                )
+                _query_embedding_cache = QueryEmbeddingCache(
+                    max_entries=Config.QUERY_EMBEDDING_CACHE_SIZE, shared=shared
+                )
+    return _query_embedding_cache
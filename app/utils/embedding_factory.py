@@ -6,6 +6,15 @@ Embedding 模型工厂
 # 导入日志模块
 import logging
 
+# 导入线程模块，用于注册表的并发保护
+import threading
+
+# 导入类型提示
+from typing import Dict, Optional, Tuple
+
+# 导入 LangChain 的 Embeddings 抽象类型
+from langchain_core.embeddings import Embeddings
+
 # 导入 HuggingFace Embeddings 类
 from langchain_huggingface import HuggingFaceEmbeddings
 
@@ -18,9 +27,27 @@ from langchain_community.embeddings import OllamaEmbeddings
 # 导入全局设置服务
 from app.services.settings_service import settings_service
 
+# 导入全局配置
+from app.config import Config
+
+# 导入 Embedding 缓存
+from app.utils.embedding_cache import (
+    CachedEmbeddings,
+    get_embedding_cache,
+    get_query_embedding_cache,
+)
+
 # 获取 logger 对象
 logger = logging.getLogger(__name__)
 
+# 与 Embedding 模型相关的设置字段，任一字段变化都需要切换模型
+EMBEDDING_SETTING_FIELDS = (
+    "embedding_provider",
+    "embedding_model_name",
+    "embedding_api_key",
+    "embedding_base_url",
+)
+
 
 # 定义 Embedding 工厂类
 class EmbeddingFactory:
@@ -31,18 +58,26 @@ class EmbeddingFactory:
 
     # 定义静态方法，用于创建 embedding 对象
     @staticmethod
-    def create_embeddings():
+    def create_embeddings(
+        settings: Optional[dict] = None, device: Optional[str] = None
+    ) -> Embeddings:
         """
-        创建 Embedding 模型
+        创建 Embedding 模型（每次调用都会加载一个新的模型实例）
 
         Args:
             settings: 设置字典，包含 embedding_provider, embedding_model_name, embedding_api_key, embedding_base_url
+                      为 None 时从 settings_service 读取
+            device: 本地模型运行的设备，为 None 时使用 Config.EMBEDDING_DEVICE
 
         Returns:
             Embeddings 对象
         """
-        # 从 settings_service 获取嵌入设置
-        settings = settings_service.get()
+        # 未传入设置时，从 settings_service 获取嵌入设置
+        if settings is None:
+            settings = settings_service.get()
+        # 未指定设备时使用配置中的设备
+        if device is None:
+            device = Config.EMBEDDING_DEVICE
         # 获取 embedding 提供商，默认为 huggingface
         provider = settings.get("embedding_provider", "huggingface")
         # 获取 embedding 模型名称
@@ -58,11 +93,11 @@ class EmbeddingFactory:
                 # 创建 HuggingFace Embeddings 对象
                 embeddings = HuggingFaceEmbeddings(
                     model_name=model_name,
-                    model_kwargs={"device": "cpu"},
+                    model_kwargs={"device": device},
                     encode_kwargs={"normalize_embeddings": True},
                 )
                 # 记录日志
-                logger.info(f"创建 HuggingFace Embeddings: {model_name}")
+                logger.info(f"创建 HuggingFace Embeddings: {model_name}, device: {device}")
 
             # 如果提供商为 openai
             elif provider == "openai":
@@ -93,7 +128,7 @@ class EmbeddingFactory:
                 )
                 embeddings = HuggingFaceEmbeddings(
                     model_name=EmbeddingFactory.DEFAULT_MODEL_NAME,
-                    model_kwargs={"device": "cpu"},
+                    model_kwargs={"device": device},
                     encode_kwargs={"normalize_embeddings": True},
                 )
 
@@ -109,6 +144,184 @@ class EmbeddingFactory:
             )
             return HuggingFaceEmbeddings(
                 model_name=EmbeddingFactory.DEFAULT_MODEL_NAME,
-                model_kwargs={"device": "cpu"},
+                model_kwargs={"device": device},
                 encode_kwargs={"normalize_embeddings": True},
             )
+
+    # 根据实际加载的模型计算缓存使用的模型标识
+    @staticmethod
+    def model_key(embeddings: Embeddings) -> str:
+        """
+        根据实际加载的模型（而不是请求的设置）计算模型标识，包含服务地址；
+        创建失败回退到默认模型时，向量会缓存在默认模型名下，不会混入所请求模型的缓存
+
+        Args:
+            embeddings: create_embeddings 返回的 Embeddings 对象，或注册表包装后的 CachedEmbeddings
+
+        Returns:
+            形如 provider:model 或 provider:model@base_url 的字符串
+        """
+        if isinstance(embeddings, CachedEmbeddings):
+            return embeddings.model_key
+        if isinstance(embeddings, HuggingFaceEmbeddings):
+            return f"huggingface:{embeddings.model_name}"
+        if isinstance(embeddings, OpenAIEmbeddings):
+            key, base_url = f"openai:{embeddings.model}", embeddings.openai_api_base
+        elif isinstance(embeddings, OllamaEmbeddings):
+            key, base_url = f"ollama:{embeddings.model}", embeddings.base_url
+        else:
+            return type(embeddings).__name__
+        return f"{key}@{base_url}" if base_url else key
+
+    # 获取进程内共享的 Embedding 模型
+    @staticmethod
+    def get_embeddings() -> Embeddings:
+        """
+        获取进程内共享的 Embedding 模型（由 embedding_registry 管理）
+
+        Returns:
+            Embeddings 对象
+        """
+        return embedding_registry.get_embeddings()
+
+
+# 定义进程级 Embedding 模型注册表
+class EmbeddingRegistry:
+    """
+    进程级 Embedding 模型注册表
+
+    每个 (provider, model_name, device) 最多只加载一个模型实例，所有向量数据库后端共享；
+    设置变更时先在锁外加载新模型，再原子地切换当前模型并释放旧模型
+    """
+
+    def __init__(self, device: Optional[str] = None):
+        """
+        初始化注册表
+
+        Args:
+            device: 本地模型运行的设备，为 None 时使用 Config.EMBEDDING_DEVICE
+        """
+        # 本地模型运行的设备
+        self.device = device or Config.EMBEDDING_DEVICE
+        # 保护注册表状态的锁
+        self._lock = threading.RLock()
+        # 串行化模型加载，避免并发重复加载同一个模型
+        self._load_lock = threading.Lock()
+        # 已加载的模型：key -> Embeddings
+        self._models: Dict[Tuple[str, str, str], Embeddings] = {}
+        # 每个模型对应的完整设置签名（包含 api_key/base_url）
+        self._signatures: Dict[Tuple[str, str, str], tuple] = {}
+        # 当前生效的模型 key
+        self._current_key: Optional[Tuple[str, str, str]] = None
+        # 版本号，每次切换模型时加一，供缓存了模型引用的组件判断是否过期
+        self.version = 0
+
+    # 根据设置计算注册表 key
+    def make_key(self, settings: dict) -> Tuple[str, str, str]:
+        """根据设置计算 (provider, model_name, device)"""
+        return (
+            settings.get("embedding_provider") or "huggingface",
+            settings.get("embedding_model_name") or EmbeddingFactory.DEFAULT_MODEL_NAME,
+            self.device,
+        )
+
+    # 计算设置签名
+    @staticmethod
+    def _make_signature(settings: dict) -> tuple:
+        """返回所有 Embedding 相关字段组成的签名"""
+        return tuple(settings.get(field) for field in EMBEDDING_SETTING_FIELDS)
+
+    # 获取当前生效的 Embedding 模型
+    def get_embeddings(self) -> Embeddings:
+        """
+        获取当前生效的共享 Embedding 模型，首次调用时从设置中懒加载
+
+        Returns:
+            Embeddings 对象
+        """
+        # 快路径：已有当前模型则直接返回，不读取数据库
+        with self._lock:
+            if self._current_key is not None:
+                return self._models[self._current_key]
+        # 首次调用，从设置中加载
+        self.reload()
+        with self._lock:
+            return self._models[self._current_key]
+
+    # 根据设置重新加载（必要时切换）模型
+    def reload(self, settings: Optional[dict] = None) -> bool:
+        """
+        根据设置切换当前模型，设置未变化时不做任何操作
+
+        Args:
+            settings: 设置字典，为 None 时从 settings_service 读取
+
+        Returns:
+            是否发生了模型切换
+        """
+        # 未传入设置则从数据库读取
+        if settings is None:
+            settings = settings_service.get()
+        key = self.make_key(settings)
+        signature = self._make_signature(settings)
+
+        with self._load_lock:
+            # 当前模型与目标设置一致，无需切换
+            with self._lock:
+                if (
+                    self._current_key == key
+                    and self._signatures.get(key) == signature
+                ):
+                    return False
+                # 已加载过相同设置的模型，直接复用
+                embeddings = (
+                    self._models.get(key)
+                    if self._signatures.get(key) == signature
+                    else None
+                )
+            # 在状态锁之外加载模型，加载期间读请求继续使用旧模型
+            if embeddings is None:
+                embeddings = EmbeddingFactory.create_embeddings(
+                    settings=settings, device=self.device
+                )
+                # 缓存按实际加载的模型区分，创建失败回退到默认模型时不会写入所请求模型的缓存
+                model_key = EmbeddingFactory.model_key(embeddings)
+                if model_key.split("@")[0] != f"{key[0]}:{key[1]}":
+                    logger.warning(
+                        f"请求的 Embedding 模型为 {key[0]}:{key[1]}，实际使用 {model_key}"
+                    )
+                # 启用缓存时，在模型前加一层缓存：文档向量按内容寻址持久化，查询向量做 LRU
+                if Config.EMBEDDING_CACHE_ENABLED or Config.QUERY_EMBEDDING_CACHE_SIZE > 0:
+                    embeddings = CachedEmbeddings(
+                        embeddings,
+                        model_key=model_key,
+                        cache=(
+                            get_embedding_cache()
+                            if Config.EMBEDDING_CACHE_ENABLED
+                            else None
+                        ),
+                        query_cache=(
+                            get_query_embedding_cache()
+                            if Config.QUERY_EMBEDDING_CACHE_SIZE > 0
+                            else None
+                        ),
+                    )
+            # 原子切换：只保留新模型，释放旧模型的引用
+            with self._lock:
+                old_key = self._current_key
+                self._models = {key: embeddings}
+                self._signatures = {key: signature}
+                self._current_key = key
+                self.version += 1
+        logger.info(f"Embedding 模型已切换: {old_key} -> {key}, 版本: {self.version}")
+        return True
+
+    # 判断设置变更是否涉及 Embedding 字段
+    @staticmethod
+    def is_embedding_change(data: dict) -> bool:
+        """判断更新的数据中是否包含 Embedding 相关字段"""
+        return any(field in data for field in EMBEDDING_SETTING_FIELDS)
+
+
+# 创建进程级 Embedding 模型注册表单例
+embedding_registry = EmbeddingRegistry()
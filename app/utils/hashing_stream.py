@@ -0,0 +1,42 @@
+"""
+边读边计算大小和哈希的流包装器
+"""
+
+# 导入hashlib模块，用于计算内容哈希
+import hashlib
+
+# 导入类型提示
+from typing import BinaryIO, Optional
+
+
+class HashingStream:
+    """
+    包装一个可读的二进制流，在数据被读取的同时累计大小并计算 sha256，
+    超过大小上限时抛出 ValueError，从而无需把整个文件读入内存
+    """
+
+    def __init__(self, stream: BinaryIO, max_size: Optional[int] = None):
+        """
+        参数:
+            stream: 原始二进制流（需要支持 read）
+            max_size: 允许读取的最大字节数，None 表示不限制
+        """
+        self._stream = stream
+        self._max_size = max_size
+        self._hash = hashlib.sha256()
+        # 已读取的字节数
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        """读取数据并同步更新大小和哈希"""
+        data = self._stream.read(size)
+        if data:
+            self.size += len(data)
+            if self._max_size is not None and self.size > self._max_size:
+                raise ValueError(f"文件大小超过上限 {self._max_size} 字节")
+            self._hash.update(data)
+        return data
+
+    def hexdigest(self) -> str:
+        """返回已读取内容的 sha256 十六进制摘要"""
+        return self._hash.hexdigest()
@@ -0,0 +1,256 @@
+"""
+多阶段流水线执行器
+各阶段拥有独立的线程池，阶段之间通过有界队列连接以实现背压，
+使解析、向量化和写入向量库可以同时进行
+"""
+
+# 导入日志模块
+import logging
+
+# 导入队列模块
+import queue
+
+# 导入线程模块
+import threading
+
+# 导入时间模块，用于统计各阶段耗时
+import time
+
+# 导入类型提示
+from typing import Any, Callable, Iterable, List, Optional
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 队列结束标记
+_SENTINEL = object()
+
+
+# 定义流水线阶段
+class PipelineStage:
+    """流水线中的一个阶段"""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Any], Any],
+        workers: int = 1,
+        queue_size: int = 2,
+    ):
+        """
+        初始化阶段
+
+        Args:
+            name: 阶段名称
+            func: 处理单个元素的函数，返回值会传给下一个阶段
+            workers: 该阶段的工作线程数
+            queue_size: 该阶段输入队列的容量，队列满时上游阻塞（背压）
+        """
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.input = queue.Queue(maxsize=max(1, queue_size))
+        # 统计信息
+        self.items = 0
+        self.busy_seconds = 0.0
+        self._stats_lock = threading.Lock()
+        # 尚未结束的工作线程数，最后一个结束的线程负责通知下游
+        self._alive = self.workers
+        self._alive_lock = threading.Lock()
+
+    # 记录一次处理的耗时
+    def record(self, seconds: float) -> None:
+        with self._stats_lock:
+            self.items += 1
+            self.busy_seconds += seconds
+
+    # 工作线程结束，返回自己是否是最后一个结束的线程
+    def worker_done(self) -> bool:
+        with self._alive_lock:
+            self._alive -= 1
+            return self._alive == 0
+
+
+# 定义多阶段流水线
+class StagedPipeline:
+    """多阶段流水线执行器"""
+
+    def __init__(self, name: str = "pipeline", poll_interval: float = 0.1):
+        """
+        初始化流水线
+
+        Args:
+            name: 流水线名称，用于线程名和日志
+            poll_interval: 阻塞等待队列时检查停止信号的间隔（秒）
+        """
+        self.name = name
+        self.poll_interval = poll_interval
+        self.stages: List[PipelineStage] = []
+        # 出错时通知所有线程停止
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._error_lock = threading.Lock()
+        # 最后一个阶段的输出
+        self._results: List[Any] = []
+        self._results_lock = threading.Lock()
+        # 数据源的统计信息
+        self.source_items = 0
+        self.source_seconds = 0.0
+        # 整条流水线的运行时间
+        self.wall_seconds = 0.0
+
+    # 添加一个阶段
+    def add_stage(
+        self,
+        name: str,
+        func: Callable[[Any], Any],
+        workers: int = 1,
+        queue_size: int = 2,
+    ) -> "StagedPipeline":
+        """
+        添加一个阶段，阶段按添加顺序串联
+
+        Args:
+            name: 阶段名称
+            func: 处理单个元素的函数
+            workers: 工作线程数
+            queue_size: 输入队列容量
+
+        Returns:
+            流水线本身，便于链式调用
+        """
+        self.stages.append(PipelineStage(name, func, workers, queue_size))
+        return self
+
+    # 记录第一个错误并通知停止
+    def _fail(self, error: BaseException) -> None:
+        with self._error_lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+
+    # 可被停止信号打断的 put
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # 可被停止信号打断的 get
+    def _get(self, q: queue.Queue) -> Any:
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+        return _SENTINEL
+
+    # 通知下一个阶段的所有工作线程结束
+    def _close(self, index: int) -> None:
+        if index < len(self.stages):
+            for _ in range(self.stages[index].workers):
+                self._put(self.stages[index].input, _SENTINEL)
+
+    # 数据源线程：迭代数据源并送入第一个阶段
+    def _feed(self, source: Iterable) -> None:
+        try:
+            iterator = iter(source)
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                self.source_seconds += time.perf_counter() - start
+                self.source_items += 1
+                if not self._put(self.stages[0].input, item):
+                    break
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._close(0)
+
+    # 阶段工作线程：从输入队列取元素，处理后送入下一个阶段
+    def _work(self, index: int) -> None:
+        stage = self.stages[index]
+        is_last = index == len(self.stages) - 1
+        try:
+            while True:
+                item = self._get(stage.input)
+                if item is _SENTINEL:
+                    break
+                start = time.perf_counter()
+                result = stage.func(item)
+                stage.record(time.perf_counter() - start)
+                if is_last:
+                    with self._results_lock:
+                        self._results.append(result)
+                elif not self._put(self.stages[index + 1].input, result):
+                    break
+        except BaseException as e:
+            logger.error(f"流水线 {self.name} 阶段 {stage.name} 出错: {e}")
+            self._fail(e)
+        finally:
+            # 最后一个结束的线程通知下游结束
+            if stage.worker_done():
+                self._close(index + 1)
+
+    # 运行流水线
+    def run(self, source: Iterable) -> List[Any]:
+        """
+        运行流水线直到数据源耗尽且所有阶段处理完毕
+
+        Args:
+            source: 数据源，可以是生成器；在独立线程中迭代，与后续阶段并行
+
+        Returns:
+            最后一个阶段的输出列表（顺序不保证与输入一致）
+
+        Raises:
+            任意阶段抛出的第一个异常
+        """
+        if not self.stages:
+            raise ValueError("流水线至少需要一个阶段")
+        start = time.perf_counter()
+        threads = [
+            threading.Thread(
+                target=self._feed, args=(source,), name=f"{self.name}-source", daemon=True
+            )
+        ]
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                threads.append(
+                    threading.Thread(
+                        target=self._work,
+                        args=(index,),
+                        name=f"{self.name}-{stage.name}-{n}",
+                        daemon=True,
+                    )
+                )
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.wall_seconds = time.perf_counter() - start
+        logger.info(f"流水线 {self.name} 完成: {self.stats()}")
+        if self._error is not None:
+            raise self._error
+        return self._results
+
+    # 获取统计信息
+    def stats(self) -> dict:
+        """返回数据源和各阶段处理的元素数和累计耗时"""
+        result = {
+            "source": {"items": self.source_items, "seconds": round(self.source_seconds, 3)}
+        }
+        for stage in self.stages:
+            result[stage.name] = {
+                "items": stage.items,
+                "seconds": round(stage.busy_seconds, 3),
+                "workers": stage.workers,
+            }
+        result["wall_seconds"] = round(self.wall_seconds, 3)
+        return result
@@ -0,0 +1,205 @@
+"""
+检索结果缓存
+进程内 LRU + TTL 缓存检索结果；每个知识库有一个代数（generation），保存在多进程共享的
+SQLite 文件中，文档处理完成或删除时代数加一，缓存键包含代数，因此不会返回过期结果
+"""
+
+# 导入日志模块
+import logging
+
+# 导入 os 模块，用于处理缓存文件路径
+import os
+
+# 导入 re 模块，用于规范化查询文本
+import re
+
+# 导入 sqlite3，作为多进程共享的代数存储
+import sqlite3
+
+# 导入线程模块，用于加锁
+import threading
+
+# 导入时间模块，用于判断过期
+import time
+
+# 导入 unicodedata，用于全角半角统一
+import unicodedata
+
+# 导入有序字典，用于实现 LRU
+from collections import OrderedDict
+
+# 导入类型提示
+from typing import Any, Hashable, Optional, Tuple
+
+# 导入全局配置
+from app.config import Config
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+
+# 规范化查询文本：统一全角半角、转小写、合并空白
+def normalize_query(query: str) -> str:
+    query = unicodedata.normalize("NFKC", query).lower()
+    return re.sub(r"\s+", " ", query).strip()
+
+
+# 定义知识库代数存储
+class GenerationStore:
+    """基于 SQLite 的知识库代数存储，Web 进程和处理文档的 worker 进程共享"""
+
+    def __init__(self, path: str):
+        # 保证目录存在
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # WAL 模式允许多个进程同时读写
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS kb_generation (
+                kb_id TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, kb_id: str) -> int:
+        """获取知识库当前代数，从未变更过时为 0"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT generation FROM kb_generation WHERE kb_id = ?", (kb_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, kb_id: str) -> int:
+        """知识库内容发生变化，代数加一并返回新代数"""
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO kb_generation (kb_id, generation) VALUES (?, 1)
+                ON CONFLICT(kb_id) DO UPDATE SET generation = generation + 1
+                """,
+                (kb_id,),
+            )
+            self._conn.commit()
+            row = self._conn.execute(
+                "SELECT generation FROM kb_generation WHERE kb_id = ?", (kb_id,)
+            ).fetchone()
+        return row[0]
+
+
+# 定义检索结果缓存
+class QueryResultCache:
+    """线程安全的 LRU + TTL 检索结果缓存"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300):
+        """
+        参数:
+            max_entries: 最多缓存的结果数
+            ttl: 结果的存活秒数
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # 键 -> (过期时间, 结果)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """查询缓存，未命中或已过期时返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """写入缓存，超出数量上限时淘汰最久未使用的结果"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """返回命中率等统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+# 解析代数存储文件路径
+def get_generation_path() -> str:
+    """返回代数存储文件路径，相对路径基于项目根目录"""
+    path = Config.QUERY_CACHE_GENERATION_PATH or os.path.join(
+        Config.STORAGE_DIR, "cache", "kb_generation.db"
+    )
+    if not os.path.isabs(path):
+        path = os.path.join(Config.BASE_DIR, path)
+    return path
+
+
+# 懒加载的全局实例
+_generation_store: Optional[GenerationStore] = None
+_query_cache: Optional[QueryResultCache] = None
+_instance_lock = threading.Lock()
+
+
+# 获取全局代数存储
+def get_generation_store() -> GenerationStore:
+    """获取进程内共享的代数存储（懒加载）"""
+    global _generation_store
+    if _generation_store is None:
+        with _instance_lock:
+            if _generation_store is None:
+                _generation_store = GenerationStore(get_generation_path())
+    return _generation_store
+
+
+# 获取全局检索结果缓存
+def get_query_cache() -> QueryResultCache:
+    """获取进程内共享的检索结果缓存（懒加载）"""
+    global _query_cache
+    if _query_cache is None:
+        with _instance_lock:
+            if _query_cache is None:
+                _query_cache = QueryResultCache(
+                    max_entries=Config.QUERY_CACHE_MAX_ENTRIES,
+                    ttl=Config.QUERY_CACHE_TTL,
+                )
+    return _query_cache
+
+
+# 知识库内容发生变化时调用，使该知识库的缓存结果失效
+def invalidate_kb(kb_id: str) -> None:
+    """知识库内容变化后使其缓存结果失效，失败时只记录日志"""
+    try:
+        get_generation_store().bump(kb_id)
+    except Exception as e:
+        logger.warning(f"更新知识库 {kb_id} 的缓存代数失败: {e}")
@@ -6,8 +6,11 @@
 # 导入日志模块
 import logging
 
+# 导入hashlib模块，用于根据内容生成块ID
+import hashlib
+
 # 导入类型提示
-from typing import List
+from typing import Iterable, Iterator, List
 
 # 导入递归字符切分器
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -19,6 +22,50 @@ from langchain_core.documents import Document
 logger = logging.getLogger(__name__)
 
 
+# 计算块内容的摘要
+def chunk_digest(text: str, model_key: str = "") -> str:
+    """
+    计算块内容（及 Embedding 模型标识）的摘要
+
+    Args:
+        text: 块文本内容
+        model_key: Embedding 模型标识，切换模型后相同内容的摘要也不同
+
+    Returns:
+        sha256 十六进制摘要的前16位
+    """
+    data = f"{model_key}\0{text}" if model_key else text
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+# 根据块内容生成稳定的块ID
+def make_chunk_id(
+    doc_id: str, text: str, occurrence: int = 0, model_key: str = "", digest: str = None
+) -> str:
+    """
+    生成由内容决定的块ID：文档内容不变的块在重新处理时ID保持不变，
+    插入或删除一段文本不会导致后续所有块的ID变化；ID包含 Embedding 模型标识，
+    切换模型后所有块都会重新向量化，不会与旧模型的向量混在一起
+
+    Args:
+        doc_id: 文档ID
+        text: 块文本内容
+        occurrence: 同一文档中相同内容已出现的次数，用于区分重复块
+        model_key: Embedding 模型标识
+        digest: 已计算好的 chunk_digest(text, model_key)，为 None 时重新计算
+
+    Returns:
+        块ID，格式为 {doc_id}_{内容哈希前16位}[_{序号}]
+    """
+    if digest is None:
+        digest = chunk_digest(text, model_key)
+    chunk_id = f"{doc_id}_{digest}" if doc_id else digest
+    # 重复内容追加出现序号，保证同一文档内ID唯一
+    if occurrence:
+        chunk_id = f"{chunk_id}_{occurrence}"
+    return chunk_id
+
+
 # 定义文本分割器类
 class TextSplitter:
     # 文本分割器封装
@@ -42,6 +89,7 @@ class TextSplitter:
             chunk_size=chunk_size,  # 块大小
             chunk_overlap=chunk_overlap,  # 块之间的重叠字符数
             length_function=len,  # 长度函数
+            add_start_index=True,  # 在元数据中记录块在原文中的起始位置
             separators=[
                 "\n\n",
                 "\n",
@@ -58,7 +106,7 @@ class TextSplitter:
 
     # 分割文档列表为若干块
     def split_documents(
-        self, documents: List[Document], doc_id: str = None
+        self, documents: List[Document], doc_id: str = None, model_key: str = ""
     ) -> List[dict]:
         """
         分割文档列表
@@ -66,6 +114,7 @@ class TextSplitter:
         Args:
             documents: Document 列表
             doc_id: 文档ID（用于生成块ID）
+            model_key: Embedding 模型标识（用于生成块ID）
 
         Returns:
             块列表，每个块包含 id, text, chunk_index, metadata
@@ -76,22 +125,50 @@ class TextSplitter:
 
         # 使用分割器分割文档
         chunks = self.splitter.split_documents(documents)
+        # 为每个分割块生成块信息
+        return list(self._iter_chunks(chunks, doc_id, model_key))
+
+    # 增量分割文档流
+    def iter_split(
+        self, documents: Iterable[Document], doc_id: str = None, model_key: str = ""
+    ) -> Iterator[dict]:
+        """
+        增量分割文档流：逐个读取 Document（例如逐页），分割后立即产出分块
 
-        # 结果列表
-        result = []
-        # 遍历每个分割块
+        Args:
+            documents: Document 可迭代对象
+            doc_id: 文档ID（用于生成块ID）
+            model_key: Embedding 模型标识（用于生成块ID）
+
+        Yields:
+            块字典，包含 id, text, chunk_index, metadata
+        """
+        # 每次只分割一页，与 split_documents 的结果一致
+        chunks = (
+            chunk
+            for document in documents
+            for chunk in self.splitter.split_documents([document])
+        )
+        return self._iter_chunks(chunks, doc_id, model_key)
+
+    # 为分割块生成ID和序号
+    @staticmethod
+    def _iter_chunks(
+        chunks: Iterable[Document], doc_id: str, model_key: str
+    ) -> Iterator[dict]:
+        # 每种内容已出现的次数，按摘要计数，不保留块文本
+        occurrences = {}
+        # 全局块序号，跨页连续
         for i, chunk in enumerate(chunks):
-            # 生成块ID，包含文档ID和序号
-            chunk_id = f"{doc_id}_{i}" if doc_id else str(i)
-            # 把块信息添加到结果中
-            result.append(
-                {
-                    "id": chunk_id,  # 块ID
-                    "text": chunk.page_content,  # 块文本内容
-                    "chunk_index": i,  # 块索引
-                    "metadata": chunk.metadata,  # 块元数据
-                }
-            )
-
-        # 返回所有分割块
-        return result
+            # 根据内容生成块ID
+            digest = chunk_digest(chunk.page_content, model_key)
+            occurrence = occurrences.get(digest, 0)
+            occurrences[digest] = occurrence + 1
+            yield {
+                "id": make_chunk_id(
+                    doc_id, chunk.page_content, occurrence, digest=digest
+                ),  # 块ID
+                "text": chunk.page_content,  # 块文本内容
+                "chunk_index": i,  # 块索引
+                "metadata": chunk.metadata,  # 块元数据
+            }
@@ -0,0 +1,1410 @@
+"""
+嵌入式向量索引
+每个集合一个索引目录，由若干不可变的段（segment）和一个清单文件（manifest）组成：
+- 每次写入一批向量生成一个新段，向量矩阵以 .npy 保存，检索时内存映射
+- 删除只在清单中记录被删除的行号，不修改已有的段；写入已存在的ID时删除旧行
+- 段数或某个段的已删除比例超过阈值时，在后台线程中合并较小的段
+- 检索为分块的矩阵-向量乘法加 argpartition 取前 k 个，结果精确
+- 存储精度可选 float32 / float16 / int8（按维度缩放）/ pq（乘积量化），量化的段检索时
+  扫描压缩后的编码，再用磁盘上的全精度向量对候选重排；pq 的码本按集合训练一次，
+  与 IVF 聚类中心一样在清单中记录版本，各段只按当前版本的码本编码
+- 存活分块数达到阈值后在后台训练 IVF 聚类中心，每个段记录每行所属的倒排列表，
+  检索时只扫描与查询最接近的 nprobe 个列表（近似检索，nprobe 越大召回率越高）
+"""
+
+# 导入json模块，用于读写清单和元数据
+import json
+
+# 导入日志模块
+import logging
+
+# 导入os模块，用于处理文件和路径
+import os
+
+# 导入shutil模块，用于删除段目录
+import shutil
+
+# 导入线程模块，用于加锁和后台合并
+import threading
+
+# 导入上下文管理器装饰器
+from contextlib import contextmanager
+
+# 导入类型提示
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 导入numpy，用于存储向量和计算相似度
+import numpy as np
+
+# 导入 LangChain 的 Document 类型
+from langchain_core.documents import Document
+
+# fcntl 只在类 Unix 系统上可用，用于多进程写入时加文件锁
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 清单文件名
+MANIFEST_FILE = "manifest.json"
+# 锁文件名
+LOCK_FILE = ".lock"
+# 检索时每次参与矩阵乘法的行数，限制 float16 转换时的临时内存
+SEARCH_BLOCK_ROWS = 65536
+# 支持的度量类型：余弦相似度、内积、欧氏距离（平方）
+METRICS = ("cosine", "ip", "l2")
+# 支持的存储精度
+DTYPES = ("float32", "float16", "int8", "pq")
+# 需要额外保存全精度向量用于重排的存储精度
+QUANTIZED_DTYPES = ("int8", "pq")
+# 训练 PQ 码本的最大样本数
+PQ_TRAIN_SAMPLES = 65536
+# PQ 每个子空间的默认维度，子空间数为 维度 / 该值
+PQ_SUBVECTOR_DIM = 4
+# PQ 每个子空间的码字数，码字以 uint8 保存
+PQ_KSUB = 256
+# 存活分块数达到该值时训练 PQ 码本，之前的 pq 段用全精度向量精确检索
+PQ_MIN_TRAIN_ROWS = 4 * PQ_KSUB
+# 存活分块数增长到上次训练时的该倍数后重新训练 PQ 码本
+PQ_RETRAIN_GROWTH = 4
+# 训练 IVF 聚类中心时每个列表的采样数
+IVF_SAMPLES_PER_LIST = 256
+# k-means 迭代次数
+IVF_TRAIN_ITERATIONS = 10
+# 每个倒排列表的最小平均行数，限制列表数
+IVF_MIN_LIST_SIZE = 32
+# 存活分块数增长到上次训练时的该倍数后重新训练
+IVF_RETRAIN_GROWTH = 4
+
+
+# 计算向量与聚类中心的相关度，越大越相关
+def _list_scores(vectors: np.ndarray, centroids: np.ndarray, metric: str) -> np.ndarray:
+    scores = vectors @ centroids.T
+    if metric == "l2":
+        # 向量自身的范数不影响排序，省略
+        scores = 2 * scores - np.einsum("ij,ij->i", centroids, centroids)[None, :]
+    return scores
+
+
+# 由内积得到相关度，l2 取负的平方距离，统一为越大越相关
+def _relevance(
+    dots: np.ndarray, norms: np.ndarray, query_norms: np.ndarray, metric: str
+) -> np.ndarray:
+    if metric == "l2":
+        return (
+            2 * dots
+            - np.asarray(norms, dtype=np.float32)[:, None]
+            - query_norms[None, :]
+        )
+    return dots
+
+
+# 为每个向量分配最接近的倒排列表
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray, metric: str) -> np.ndarray:
+    """分块计算每个向量所属的倒排列表，vectors 可以是内存映射数组"""
+    lists = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+        block = np.asarray(vectors[start : start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+        lists[start : start + len(block)] = _list_scores(block, centroids, metric).argmax(
+            axis=1
+        )
+    return lists
+
+
+# 用 k-means 训练 IVF 聚类中心
+def train_centroids(
+    sample: np.ndarray,
+    nlist: int,
+    metric: str,
+    iterations: int = IVF_TRAIN_ITERATIONS,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    在采样向量上训练聚类中心，cosine 使用球面 k-means（中心归一化）
+
+    参数:
+        sample: 采样向量 (行数, 维度)，float32
+        nlist: 聚类中心数
+        metric: 度量类型
+        iterations: 迭代次数
+        seed: 随机种子
+
+    返回:
+        聚类中心 (nlist, 维度)
+    """
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        lists = assign_lists(sample, centroids, metric)
+        # 按列表排序后分段求和，比 np.add.at 快得多
+        order = np.argsort(lists, kind="stable")
+        counts = np.bincount(lists, minlength=nlist)
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        centroids[nonempty] = np.add.reduceat(sample[order], starts, axis=0) / counts[
+            nonempty
+        ][:, None]
+        # 空列表重新随机选一个样本作为中心
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        if metric == "cosine":
+            centroids /= np.maximum(
+                np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12
+            )
+    return centroids.astype(np.float32)
+
+
+# PQ 各子空间的维度边界
+def pq_bounds(dim: int, m: int) -> np.ndarray:
+    """把 dim 个维度尽量均匀地分成 m 个子空间，子空间 j 为 [bounds[j], bounds[j + 1])"""
+    sizes = [len(part) for part in np.array_split(np.arange(dim), m)]
+    return np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+
+
+# 按码本把向量编码为 PQ 码字
+def encode_pq(vectors: np.ndarray, codebooks: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    """分块编码，vectors 可以是内存映射数组；返回 (行数, 子空间数) 的 uint8 码字"""
+    codes = np.empty((len(vectors), len(bounds) - 1), dtype=np.uint8)
+    for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+        block = np.asarray(vectors[start : start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+        for j in range(len(bounds) - 1):
+            low, high = bounds[j], bounds[j + 1]
+            codes[start : start + len(block), j] = assign_lists(
+                block[:, low:high], codebooks[j, :, : high - low], "l2"
+            )
+    return codes
+
+
+# 计算查询与每个子空间码字的查找表，所有 pq 段共用
+def pq_tables(
+    queries: np.ndarray, codebooks: np.ndarray, bounds: np.ndarray, metric: str
+) -> np.ndarray:
+    """
+    返回 (子空间数, 查询数, 码字数) 的查找表，按编码求和即为近似相关度；
+    l2 的查找表为 -|q_j - c|^2 去掉 -|q_j|^2 的部分，由调用方统一减去
+    """
+    tables = np.empty((len(bounds) - 1, len(queries), codebooks.shape[1]), np.float32)
+    for j in range(len(bounds) - 1):
+        low, high = bounds[j], bounds[j + 1]
+        book = codebooks[j, :, : high - low]
+        table = queries[:, low:high] @ book.T
+        if metric == "l2":
+            table = 2 * table - np.einsum("ij,ij->i", book, book)[None, :]
+        tables[j] = table
+    return tables
+
+
+# 定义向量段
+class VectorSegment:
+    """
+    不可变的向量段，目录中包含：
+    - vectors.npy: 检索时扫描的向量矩阵，float32 / float16 为 (行数, 维度)，
+      int8 为 (行数, 维度) 的编码；pq 段没有该文件
+    - full.npy: 量化段的全精度向量（float32），只在重排、合并和训练时按行读取
+    - int8_scale.npy / int8_offset.npy: int8 每个维度的缩放和偏移，向量约为 offset + scale * 编码
+    - pq_<版本>.npy: pq 段按集合码本编码的 (行数, 子空间数) 码字（训练码本后写入，
+      与索引目录中的码本版本对应）；没有当前版本的码字时扫描全精度向量
+    - norms.npy: 每行向量的平方范数（float32），用于计算欧氏距离
+    - texts.npy / text_offsets.npy: 所有分块文本的 utf-8 字节及偏移
+    - chunks.json: 分块ID和元数据
+    - ivf_<版本>.npy: 每行所属的倒排列表（训练 IVF 后写入，与索引目录中的聚类中心版本对应）
+    """
+
+    def __init__(self, path: str):
+        """
+        加载段，数组以内存映射方式打开
+
+        参数:
+            path: 段目录
+        """
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, "chunks.json"), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        self.ids: List[str] = chunks["ids"]
+        self.metadatas: List[dict] = chunks["metadatas"]
+        self.dtype: str = chunks.get("dtype")
+        if self.dtype == "pq":
+            # pq 的码字按码本版本单独保存，未编码时扫描全精度向量
+            self.vectors = np.load(os.path.join(path, "full.npy"), mmap_mode="r")
+        else:
+            self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            self.dtype = self.dtype or self.vectors.dtype.name
+        # 全精度向量，未量化的段直接使用 vectors
+        self.full = self.vectors
+        if self.dtype == "int8":
+            self.full = np.load(os.path.join(path, "full.npy"), mmap_mode="r")
+            self.scale = np.load(os.path.join(path, "int8_scale.npy"))
+            self.offset = np.load(os.path.join(path, "int8_offset.npy"))
+        self.norms = np.load(os.path.join(path, "norms.npy"), mmap_mode="r")
+        self.texts = np.load(os.path.join(path, "texts.npy"), mmap_mode="r")
+        self.text_offsets = np.load(
+            os.path.join(path, "text_offsets.npy"), mmap_mode="r"
+        )
+        # 元数据字段 -> 每行取值，过滤时懒加载
+        self._fields: Dict[str, np.ndarray] = {}
+        # (IVF 版本, 按列表排序的行号, 每个列表的起始偏移)，第一次检索时加载
+        self._ivf: Optional[Tuple[int, np.ndarray, np.ndarray]] = None
+        # (码本版本, 码字)，第一次检索时加载
+        self._pq: Optional[Tuple[int, np.ndarray]] = None
+
+    # 段内行数
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    # 是否为量化的段
+    @property
+    def quantized(self) -> bool:
+        return self.dtype in QUANTIZED_DTYPES
+
+    # 计算若干行与查询的相关度，量化的段为近似值
+    def scores(
+        self,
+        rows,
+        queries: np.ndarray,
+        query_norms: np.ndarray,
+        metric: str,
+        pq: Optional[Tuple[int, np.ndarray]] = None,
+    ) -> np.ndarray:
+        """
+        参数:
+            rows: 行号数组或切片
+            queries: 查询向量 (查询数, 维度)，float32
+            query_norms: 查询向量的平方范数
+            metric: 度量类型
+            pq: (码本版本, 查找表)，集合还没有码本时为 None
+
+        返回:
+            相关度 (行数, 查询数)，越大越相关
+        """
+        if self.dtype == "pq":
+            codes = self.pq_codes(pq[0]) if pq is not None else None
+            if codes is None:
+                return self.exact_scores(rows, queries, query_norms, metric)
+            return self._pq_scores(np.asarray(codes[rows]), pq[1], query_norms, metric)
+        codes = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.dtype == "int8":
+            # (offset + scale * c) · q = c · (scale * q) + offset · q
+            dots = codes @ (queries * self.scale).T + (queries @ self.offset)[None, :]
+        else:
+            dots = codes @ queries.T
+        return _relevance(dots, self.norms[rows], query_norms, metric)
+
+    # 用全精度向量计算相关度，用于重排
+    def exact_scores(
+        self, rows, queries: np.ndarray, query_norms: np.ndarray, metric: str
+    ) -> np.ndarray:
+        dots = np.asarray(self.full[rows], dtype=np.float32) @ queries.T
+        return _relevance(dots, self.norms[rows], query_norms, metric)
+
+    # 非对称距离计算：按编码在每个子空间的查找表中取值求和
+    @staticmethod
+    def _pq_scores(
+        codes: np.ndarray, tables: np.ndarray, query_norms: np.ndarray, metric: str
+    ) -> np.ndarray:
+        scores = np.zeros((len(codes), tables.shape[1]), dtype=np.float32)
+        for j in range(len(tables)):
+            scores += tables[j][:, codes[:, j]].T
+        if metric == "l2":
+            # -|q_j - c|^2 中的 -|q_j|^2 最后统一减去
+            scores -= query_norms[None, :]
+        return scores
+
+    # 检索时扫描的向量（或编码）占用的字节数
+    def scan_bytes(self, pq_version: Optional[int]) -> int:
+        if self.dtype == "pq" and pq_version is not None:
+            codes = self.pq_codes(pq_version)
+            if codes is not None:
+                return codes.nbytes
+        return self.vectors.nbytes
+
+    # 读取分块文本
+    def get_text(self, index: int) -> str:
+        start, end = self.text_offsets[index], self.text_offsets[index + 1]
+        return bytes(self.texts[start:end]).decode("utf-8")
+
+    # 读取分块对象
+    def get_document(self, index: int) -> Document:
+        return Document(
+            id=self.ids[index],
+            page_content=self.get_text(index),
+            metadata=dict(self.metadatas[index]),
+        )
+
+    # 某个元数据字段在每一行的取值
+    def field(self, key: str) -> np.ndarray:
+        values = self._fields.get(key)
+        if values is None:
+            values = np.empty(self.size, dtype=object)
+            values[:] = [metadata.get(key) for metadata in self.metadatas]
+            self._fields[key] = values
+        return values
+
+    # 计算满足过滤条件的行
+    def match(self, filter: Optional[Dict]) -> np.ndarray:
+        """
+        {"doc_id": "a"} 匹配 doc_id 等于 a 的行，{"doc_id": ["a", "b"]} 匹配其中之一，
+        多个字段同时满足
+        """
+        mask = np.ones(self.size, dtype=bool)
+        for key, value in (filter or {}).items():
+            values = self.field(key)
+            if isinstance(value, (list, tuple, set)):
+                allowed = set(value)
+                mask &= np.fromiter(
+                    (v in allowed for v in values), dtype=bool, count=self.size
+                )
+            else:
+                mask &= values == value
+        return mask
+
+    # 读取某个 IVF 版本的倒排列表
+    def ivf_lists(
+        self, version: int, nlist: int
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        返回 (按列表排序的行号, 每个列表的起始偏移)，列表 l 的行为
+        order[offsets[l]:offsets[l + 1]]；该版本的分配文件不存在时返回 None
+        """
+        cached = self._ivf
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+        try:
+            lists = np.load(os.path.join(self.path, f"ivf_{version:08d}.npy"))
+        except FileNotFoundError:
+            return None
+        order = np.argsort(lists, kind="stable")
+        offsets = np.searchsorted(lists[order], np.arange(nlist + 1))
+        self._ivf = (version, order, offsets)
+        return order, offsets
+
+    # 写入某个 IVF 版本的倒排列表分配，并删除旧版本的分配
+    def write_ivf(self, version: int, lists: np.ndarray) -> None:
+        self._write_versioned("ivf_", version, lists.astype(np.int32))
+
+    # 读取某个码本版本的 PQ 码字，该版本的码字不存在时返回 None
+    def pq_codes(self, version: int) -> Optional[np.ndarray]:
+        cached = self._pq
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        try:
+            codes = np.load(os.path.join(self.path, f"pq_{version:08d}.npy"), mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        self._pq = (version, codes)
+        return codes
+
+    # 写入某个码本版本的 PQ 码字，并删除旧版本的码字
+    def write_pq(self, version: int, codes: np.ndarray) -> None:
+        self._write_versioned("pq_", version, codes)
+
+    # 原子地写入带版本号的文件，并删除同一前缀的旧版本
+    def _write_versioned(self, prefix: str, version: int, array: np.ndarray) -> None:
+        file_name = f"{prefix}{version:08d}.npy"
+        tmp_path = os.path.join(self.path, file_name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(self.path, file_name))
+        for name in os.listdir(self.path):
+            if name.startswith(prefix) and name != file_name:
+                os.remove(os.path.join(self.path, name))
+
+    # 根据分块构建一个新段
+    @classmethod
+    def build(
+        cls,
+        path: str,
+        rows: Iterable[Tuple[str, np.ndarray, str, dict]],
+        count: int,
+        dim: int,
+        dtype: str,
+    ) -> "VectorSegment":
+        """
+        构建段并写入磁盘，向量逐行写入内存映射文件，不需要一次性拼接整个矩阵；
+        量化的段先写入全精度向量，int8 再分块编码，pq 由索引按集合的码本编码
+
+        参数:
+            path: 段目录
+            rows: (分块ID, 向量, 文本, 元数据) 的可迭代对象
+            count: 行数
+            dim: 向量维度
+            dtype: 存储精度
+
+        返回:
+            加载好的段
+        """
+        # 先写入临时目录，完成后重命名，避免留下不完整的段
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        quantized = dtype in QUANTIZED_DTYPES
+        vectors = np.lib.format.open_memmap(
+            os.path.join(tmp_path, "full.npy" if quantized else "vectors.npy"),
+            mode="w+",
+            dtype=np.float32 if quantized else np.dtype(dtype),
+            shape=(count, dim),
+        )
+        norms = np.empty(count, dtype=np.float32)
+        ids, metadatas, text_bytes, text_offsets = [], [], [], [0]
+        for index, (chunk_id, vector, text, metadata) in enumerate(rows):
+            vectors[index] = vector
+            norms[index] = float(np.dot(vector, vector))
+            ids.append(chunk_id)
+            metadatas.append(metadata)
+            encoded = text.encode("utf-8")
+            text_bytes.append(encoded)
+            text_offsets.append(text_offsets[-1] + len(encoded))
+        vectors.flush()
+        del vectors
+        if dtype == "int8":
+            cls._write_int8(tmp_path)
+        np.save(os.path.join(tmp_path, "norms.npy"), norms)
+        np.save(
+            os.path.join(tmp_path, "texts.npy"),
+            np.frombuffer(b"".join(text_bytes), dtype=np.uint8),
+        )
+        np.save(
+            os.path.join(tmp_path, "text_offsets.npy"),
+            np.asarray(text_offsets, np.int64),
+        )
+        with open(os.path.join(tmp_path, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {"ids": ids, "metadatas": metadatas, "dtype": dtype},
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    # 按维度的最小值和最大值把全精度向量编码为 int8
+    @staticmethod
+    def _write_int8(path: str) -> None:
+        full = np.load(os.path.join(path, "full.npy"), mmap_mode="r")
+        low = np.full(full.shape[1], np.inf, dtype=np.float32)
+        high = np.full(full.shape[1], -np.inf, dtype=np.float32)
+        for start in range(0, len(full), SEARCH_BLOCK_ROWS):
+            block = full[start : start + SEARCH_BLOCK_ROWS]
+            low = np.minimum(low, block.min(axis=0))
+            high = np.maximum(high, block.max(axis=0))
+        scale = (high - low) / 255
+        scale[scale == 0] = 1.0
+        # 编码 -128 对应最小值，127 对应最大值
+        offset = low + 128 * scale
+        codes = np.lib.format.open_memmap(
+            os.path.join(path, "vectors.npy"), mode="w+", dtype=np.int8, shape=full.shape
+        )
+        for start in range(0, len(full), SEARCH_BLOCK_ROWS):
+            block = full[start : start + SEARCH_BLOCK_ROWS]
+            codes[start : start + len(block)] = np.clip(
+                np.rint((block - offset) / scale), -128, 127
+            )
+        codes.flush()
+        del codes
+        np.save(os.path.join(path, "int8_scale.npy"), scale.astype(np.float32))
+        np.save(os.path.join(path, "int8_offset.npy"), offset.astype(np.float32))
+
+
+# 定义向量索引
+class VectorIndex:
+    """
+    单个集合的嵌入式向量索引
+
+    清单文件记录段列表、每个段中已删除的行号、下一个段序号、向量维度、度量类型、IVF 和 PQ 码本信息。
+    段按写入批次生成，合并时选择最小的若干个段（以及已删除比例过高的段）写成一个新段，
+    写入成本为 O(N log N)。训练 IVF 和 PQ 码本后新写入的段在构建时即分配倒排列表、
+    按码本编码，无需重新训练
+    """
+
+    def __init__(
+        self,
+        path: str,
+        metric: str = "cosine",
+        dtype: str = "float32",
+        max_segments: int = 16,
+        merge_factor: int = 4,
+        compact_dead_ratio: float = 0.3,
+        ivf_min_rows: int = 0,
+        ivf_nlist: int = 0,
+        nprobe: int = 16,
+        pq_m: int = 0,
+        rerank_factor: int = 4,
+    ):
+        """
+        参数:
+            path: 索引目录
+            metric: 度量类型 cosine / ip / l2，索引创建后以清单中的为准
+            dtype: 存储精度 float32 / float16 / int8 / pq，索引创建后以清单中的为准
+            max_segments: 段数超过该值时合并
+            merge_factor: 每次合并的最小段数
+            compact_dead_ratio: 段的已删除比例超过该值时重写
+            ivf_min_rows: 存活分块数达到该值时训练 IVF，0 表示始终精确检索
+            ivf_nlist: IVF 倒排列表数，0 表示按 4 * sqrt(分块数) 自动选择
+            nprobe: 检索时默认扫描的倒排列表数
+            pq_m: pq 的子空间数，0 表示 维度 / PQ_SUBVECTOR_DIM
+            rerank_factor: 量化的段先取 k * 该值个候选，再用全精度向量重排，0 表示不重排
+        """
+        if metric not in METRICS:
+            raise ValueError(f"度量类型必须是 {' / '.join(METRICS)}")
+        if dtype not in DTYPES:
+            raise ValueError(f"存储精度必须是 {' / '.join(DTYPES)}")
+        self.path = path
+        self.metric = metric
+        self.dtype = dtype
+        self.max_segments = max_segments
+        self.merge_factor = max(2, merge_factor)
+        self.compact_dead_ratio = compact_dead_ratio
+        self.ivf_min_rows = ivf_min_rows
+        self.ivf_nlist = ivf_nlist
+        self.nprobe = max(1, nprobe)
+        self.pq_m = pq_m
+        self.rerank_factor = rerank_factor
+        # 保护内存中索引状态的锁，检索时只在读取快照时持有
+        self._lock = threading.RLock()
+        # 串行化写入的锁，构建段期间不阻塞检索
+        self._write_mutex = threading.Lock()
+        # 已加载的清单修改时间和大小，变化时重新加载（其他进程可能写入了新段）
+        self._manifest_mtime: Optional[Tuple[int, int]] = None
+        self._segments: List[VectorSegment] = []
+        # 段名 -> 已删除的行号
+        self._deleted: Dict[str, List[int]] = {}
+        # 每个段的存活行掩码
+        self._live: List[np.ndarray] = []
+        self._next_seq = 0
+        self.dim: Optional[int] = None
+        # 分块ID -> (段名, 行号)，只在写入时懒加载
+        self._locations: Optional[Dict[str, Tuple[str, int]]] = None
+        # IVF 信息 {"version", "nlist", "trained_rows"} 及聚类中心，未训练时为 None
+        self._ivf: Optional[dict] = None
+        self._centroids: Optional[np.ndarray] = None
+        # PQ 码本信息 {"version", "m", "trained_rows"} 及码本（子空间数, 码字数, 子空间维度），
+        # 未训练时为 None
+        self._pq: Optional[dict] = None
+        self._codebooks: Optional[np.ndarray] = None
+        # 后台合并线程
+        self._compaction_thread: Optional[threading.Thread] = None
+
+    # 清单文件路径
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.path, MANIFEST_FILE)
+
+    # 跨进程的写锁
+    @contextmanager
+    def _write_lock(self):
+        with self._write_mutex:
+            os.makedirs(self.path, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.path, LOCK_FILE), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # 读取清单，清单不存在时返回空索引
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"segments": [], "deleted": {}, "next_seq": 0}
+
+    # 原子地写入清单（调用方需持有写锁和 _lock）
+    def _write_manifest(self) -> None:
+        manifest = {
+            "segments": [segment.name for segment in self._segments],
+            "deleted": self._deleted,
+            "next_seq": self._next_seq,
+            "dim": self.dim,
+            "metric": self.metric,
+            "dtype": self.dtype,
+            "ivf": self._ivf,
+            "pq": self._pq,
+        }
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+        stat = os.stat(self.manifest_path)
+        self._manifest_mtime = (stat.st_mtime_ns, stat.st_size)
+
+    # 清单变化时重新加载，已打开的段会被复用（调用方需持有 _lock）
+    def _refresh(self) -> None:
+        try:
+            stat = os.stat(self.manifest_path)
+            mtime = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._manifest_mtime:
+            return
+        opened = {segment.name: segment for segment in self._segments}
+        # 其他进程可能在读取清单后合并并删除了段，此时重新读取清单
+        for attempt in range(3):
+            manifest = self._read_manifest()
+            try:
+                segments = [
+                    opened.get(name) or VectorSegment(os.path.join(self.path, name))
+                    for name in manifest["segments"]
+                ]
+                ivf = manifest.get("ivf")
+                if ivf is None:
+                    centroids = None
+                elif ivf == self._ivf:
+                    centroids = self._centroids
+                else:
+                    centroids = np.load(self._centroids_path(ivf["version"]))
+                pq = manifest.get("pq")
+                if pq is None:
+                    codebooks = None
+                elif pq == self._pq:
+                    codebooks = self._codebooks
+                else:
+                    codebooks = np.load(self._codebooks_path(pq["version"]))
+                break
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+        self._segments = segments
+        self._deleted = {
+            name: rows
+            for name, rows in manifest["deleted"].items()
+            if name in manifest["segments"]
+        }
+        self._next_seq = manifest["next_seq"]
+        self.dim = manifest.get("dim")
+        self.metric = manifest.get("metric") or self.metric
+        self.dtype = manifest.get("dtype") or self.dtype
+        self._ivf, self._centroids = ivf, centroids
+        self._pq, self._codebooks = pq, codebooks
+        self._manifest_mtime = mtime
+        self._live = []
+        for segment in segments:
+            live = np.ones(segment.size, dtype=bool)
+            live[self._deleted.get(segment.name, [])] = False
+            self._live.append(live)
+        self._locations = None
+
+    # IVF 聚类中心文件路径
+    def _centroids_path(self, version: int) -> str:
+        return os.path.join(self.path, f"ivf_{version:08d}.npy")
+
+    # PQ 码本文件路径
+    def _codebooks_path(self, version: int) -> str:
+        return os.path.join(self.path, f"pq_{version:08d}.npy")
+
+    # 分块ID的位置表（调用方需持有 _lock）
+    def _get_locations(self) -> Dict[str, Tuple[str, int]]:
+        if self._locations is None:
+            locations = {}
+            for segment, live in zip(self._segments, self._live):
+                for row in np.flatnonzero(live):
+                    locations[segment.ids[row]] = (segment.name, int(row))
+            self._locations = locations
+        return self._locations
+
+    # 删除分块所在的行，返回实际删除的行数（调用方需持有写锁和 _lock）
+    def _delete_rows(self, ids: Iterable[str]) -> int:
+        locations = self._get_locations()
+        index_of = {segment.name: i for i, segment in enumerate(self._segments)}
+        lives = list(self._live)
+        copied = set()
+        deleted = 0
+        for chunk_id in ids:
+            location = locations.pop(chunk_id, None)
+            if location is None:
+                continue
+            name, row = location
+            i = index_of[name]
+            # 写时复制，检索线程持有的旧快照不受影响
+            if i not in copied:
+                lives[i] = lives[i].copy()
+                copied.add(i)
+            lives[i][row] = False
+            self._deleted.setdefault(name, []).append(row)
+            deleted += 1
+        self._live = lives
+        return deleted
+
+    # 规范化写入的向量
+    def _prepare(self, vectors: Sequence[Sequence[float]]) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2:
+            raise ValueError("向量必须是二维矩阵")
+        if self.dim is not None and matrix.shape[1] != self.dim:
+            raise ValueError(
+                f"向量维度 {matrix.shape[1]} 与集合维度 {self.dim} 不一致，"
+                f"切换 Embedding 模型后需要重建知识库"
+            )
+        if self.metric == "cosine":
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.maximum(norms, 1e-12)
+        return matrix
+
+    # 写入或替换分块
+    def upsert(
+        self,
+        ids: List[str],
+        vectors: Sequence[Sequence[float]],
+        texts: List[str],
+        metadatas: List[dict],
+    ) -> None:
+        """
+        写入一批分块，生成一个新段；已存在的分块ID会先删除旧行
+
+        参数:
+            ids: 分块ID列表
+            vectors: 向量列表
+            texts: 文本列表
+            metadatas: 元数据列表
+        """
+        if not ids:
+            return
+        # 同一批中重复的ID只保留最后一个
+        positions = list({chunk_id: i for i, chunk_id in enumerate(ids)}.values())
+        with self._write_lock():
+            with self._lock:
+                self._refresh()
+                matrix = self._prepare(vectors)
+            self._append_segment(
+                (
+                    (ids[i], matrix[i], texts[i], metadatas[i] or {})
+                    for i in positions
+                ),
+                count=len(positions),
+                dim=matrix.shape[1],
+            )
+
+    # 把若干行写成一个新段并替换其中已存在的分块（调用方需持有写锁）
+    def _append_segment(
+        self, rows: Iterable[Tuple[str, np.ndarray, str, dict]], count: int, dim: int
+    ) -> None:
+        with self._lock:
+            seq = self._next_seq
+        # 构建段时不持有 _lock，检索不受影响
+        segment = VectorSegment.build(
+            os.path.join(self.path, f"seg_{seq:08d}"),
+            rows,
+            count=count,
+            dim=dim,
+            dtype=self.dtype,
+        )
+        # 已训练 IVF 时直接把新段分配到现有的倒排列表
+        self._assign_segment(segment)
+        with self._lock:
+            self._delete_rows(segment.ids)
+            self._segments = self._segments + [segment]
+            self._live = self._live + [np.ones(segment.size, dtype=bool)]
+            if self._locations is not None:
+                for row, chunk_id in enumerate(segment.ids):
+                    self._locations[chunk_id] = (segment.name, row)
+            self._next_seq = seq + 1
+            self.dim = dim
+            self._write_manifest()
+
+    # 按当前的聚类中心为段分配倒排列表，按当前的码本为 pq 段编码（调用方需持有写锁）
+    def _assign_segment(self, segment: VectorSegment) -> None:
+        if self._ivf is not None:
+            segment.write_ivf(
+                self._ivf["version"],
+                assign_lists(segment.full, self._centroids, self.metric),
+            )
+        if self._pq is not None and segment.dtype == "pq":
+            segment.write_pq(
+                self._pq["version"],
+                encode_pq(
+                    segment.full, self._codebooks, pq_bounds(self.dim, self._pq["m"])
+                ),
+            )
+
+    # 按ID删除分块
+    def delete(self, ids: Iterable[str]) -> int:
+        """删除分块，返回实际删除的分块数"""
+        with self._write_lock():
+            with self._lock:
+                self._refresh()
+                deleted = self._delete_rows(ids)
+                if deleted:
+                    self._write_manifest()
+        return deleted
+
+    # 按过滤条件删除分块
+    def delete_where(self, filter: Dict) -> int:
+        """删除满足过滤条件的分块，返回删除的分块数"""
+        return self.delete(self.get_ids(filter))
+
+    # 读取快照
+    def _snapshot(self) -> Tuple[List[VectorSegment], List[np.ndarray]]:
+        with self._lock:
+            self._refresh()
+            return list(self._segments), list(self._live)
+
+    # 查询满足过滤条件的分块ID
+    def get_ids(self, filter: Optional[Dict] = None) -> List[str]:
+        ids = []
+        for segment, live in zip(*self._snapshot()):
+            for row in np.flatnonzero(live & segment.match(filter)):
+                ids.append(segment.ids[row])
+        return ids
+
+    # 查询满足过滤条件的分块
+    def get_documents(self, filter: Optional[Dict] = None) -> List[Document]:
+        documents = []
+        for segment, live in zip(*self._snapshot()):
+            for row in np.flatnonzero(live & segment.match(filter)):
+                documents.append(segment.get_document(int(row)))
+        return documents
+
+    # 向量检索
+    def search(
+        self,
+        vectors: Sequence[Sequence[float]],
+        k: int = 5,
+        filter: Optional[Dict] = None,
+        nprobe: Optional[int] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        多个查询向量一次检索；未训练 IVF 或 nprobe 不小于列表数、且没有量化的段时为精确检索
+
+        参数:
+            vectors: 查询向量列表
+            k: 每个查询返回的结果数量
+            filter: 元数据过滤条件
+            nprobe: 扫描的倒排列表数，为 None 时使用索引的默认值
+
+        返回:
+            每个查询的 (Document, 分数) 列表；cosine / ip 为相似度（越大越相关），
+            l2 为距离的平方（越小越相关）
+        """
+        with self._lock:
+            self._refresh()
+            segments, lives = list(self._segments), list(self._live)
+            ivf, centroids = self._ivf, self._centroids
+            pq, codebooks = self._pq, self._codebooks
+        queries = np.asarray(vectors, dtype=np.float32)
+        if not len(queries) or not segments:
+            return [[] for _ in range(len(queries))]
+        if self.dim is not None and queries.shape[1] != self.dim:
+            raise ValueError(f"查询向量维度 {queries.shape[1]} 与集合维度 {self.dim} 不一致")
+        if self.metric == "cosine":
+            queries = queries / np.maximum(
+                np.linalg.norm(queries, axis=1, keepdims=True), 1e-12
+            )
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+
+        # 已训练码本时，所有 pq 段共用每个查询的查找表
+        tables = None
+        if pq is not None and any(s.dtype == "pq" for s in segments):
+            tables = pq_tables(
+                queries, codebooks, pq_bounds(queries.shape[1], pq["m"]), self.metric
+            )
+
+        # 每个查询要扫描的倒排列表
+        probes = None
+        nprobe = max(1, int(nprobe or self.nprobe))
+        if ivf is not None and nprobe < ivf["nlist"]:
+            probes = np.argpartition(
+                -_list_scores(queries, centroids, self.metric), nprobe - 1, axis=1
+            )[:, :nprobe]
+
+        # 有量化的段时多取一些候选，再用全精度向量重排
+        rerank = self.rerank_factor > 0 and any(s.quantized for s in segments)
+        fetch_k = k * self.rerank_factor if rerank else k
+
+        # 每个查询的候选：(分数, 段序号, 行号)，越大越相关
+        candidates: List[List[Tuple[np.ndarray, np.ndarray, np.ndarray]]] = [
+            [] for _ in range(len(queries))
+        ]
+        for seg_index, (segment, live) in enumerate(zip(segments, lives)):
+            mask = live & segment.match(filter) if filter else live
+            if not mask.any():
+                continue
+            lists = (
+                segment.ivf_lists(ivf["version"], ivf["nlist"])
+                if probes is not None
+                else None
+            )
+            if lists is None:
+                self._scan_segment(
+                    segment,
+                    seg_index,
+                    mask,
+                    queries,
+                    query_norms,
+                    fetch_k,
+                    candidates,
+                    None if tables is None else (pq["version"], tables),
+                )
+                continue
+            order, offsets = lists
+            for q in range(len(queries)):
+                rows = np.concatenate(
+                    [order[offsets[l] : offsets[l + 1]] for l in probes[q]]
+                )
+                rows = np.sort(rows[mask[rows]])
+                if not len(rows):
+                    continue
+                scores = segment.scores(
+                    rows,
+                    queries[q : q + 1],
+                    query_norms[q : q + 1],
+                    self.metric,
+                    None if tables is None else (pq["version"], tables[:, q : q + 1]),
+                )[:, 0]
+                best = self._top(scores, fetch_k)
+                candidates[q].append(
+                    (scores[best], np.full(len(best), seg_index), rows[best])
+                )
+
+        results = []
+        for q, per_query in enumerate(candidates):
+            if not per_query:
+                results.append([])
+                continue
+            scores = np.concatenate([c[0] for c in per_query])
+            seg_indexes = np.concatenate([c[1] for c in per_query])
+            rows = np.concatenate([c[2] for c in per_query])
+            if rerank:
+                shortlist = np.argsort(-scores, kind="stable")[:fetch_k]
+                scores, seg_indexes, rows = (
+                    self._rerank(
+                        segments,
+                        seg_indexes[shortlist],
+                        rows[shortlist],
+                        queries[q : q + 1],
+                        query_norms[q : q + 1],
+                    ),
+                    seg_indexes[shortlist],
+                    rows[shortlist],
+                )
+            order = np.argsort(-scores, kind="stable")[:k]
+            results.append(
+                [
+                    (
+                        segments[seg_indexes[i]].get_document(int(rows[i])),
+                        float(-scores[i] if self.metric == "l2" else scores[i]),
+                    )
+                    for i in order
+                ]
+            )
+        return results
+
+    # 用全精度向量重新计算候选的分数
+    def _rerank(
+        self,
+        segments: List[VectorSegment],
+        seg_indexes: np.ndarray,
+        rows: np.ndarray,
+        query: np.ndarray,
+        query_norm: np.ndarray,
+    ) -> np.ndarray:
+        scores = np.empty(len(rows), dtype=np.float32)
+        for seg_index in np.unique(seg_indexes):
+            positions = np.flatnonzero(seg_indexes == seg_index)
+            # 按行号顺序读取，减少随机读
+            positions = positions[np.argsort(rows[positions])]
+            scores[positions] = segments[seg_index].exact_scores(
+                rows[positions], query, query_norm, self.metric
+            )[:, 0]
+        return scores
+
+    # 取分数最高的 k 个位置（无序）
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        if len(scores) <= k:
+            return np.arange(len(scores))
+        return np.argpartition(-scores, k - 1)[:k]
+
+    # 精确扫描整个段
+    def _scan_segment(
+        self,
+        segment: VectorSegment,
+        seg_index: int,
+        mask: np.ndarray,
+        queries: np.ndarray,
+        query_norms: np.ndarray,
+        k: int,
+        candidates: List[List[Tuple[np.ndarray, np.ndarray, np.ndarray]]],
+        pq: Optional[Tuple[int, np.ndarray]] = None,
+    ) -> None:
+        for start in range(0, segment.size, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, segment.size)
+            block_mask = mask[start:end]
+            if not block_mask.any():
+                continue
+            rows = np.flatnonzero(block_mask) + start
+            scores = segment.scores(
+                slice(start, end), queries, query_norms, self.metric, pq
+            )
+            scores = scores[block_mask]
+            for q in range(len(queries)):
+                column = scores[:, q]
+                best = self._top(column, k)
+                candidates[q].append(
+                    (column[best], np.full(len(best), seg_index), rows[best])
+                )
+
+    # 判断是否需要合并，返回需要合并的段（调用方需持有 _lock）
+    def _select_merge(self) -> List[int]:
+        selected = set()
+        live_counts = [int(live.sum()) for live in self._live]
+        for i, segment in enumerate(self._segments):
+            if segment.size and 1 - live_counts[i] / segment.size > self.compact_dead_ratio:
+                selected.add(i)
+        if len(self._segments) > self.max_segments:
+            smallest = sorted(range(len(self._segments)), key=lambda i: live_counts[i])
+            selected.update(smallest[: self.merge_factor])
+        return sorted(selected)
+
+    # 在后台线程中合并（已有合并在进行时直接返回）
+    def maybe_compact(self) -> None:
+        with self._lock:
+            self._refresh()
+            if (
+                not self._select_merge()
+                and not self._needs_training()
+                and not self._needs_pq_training()
+            ):
+                return
+            if self._compaction_thread and self._compaction_thread.is_alive():
+                return
+            self._compaction_thread = threading.Thread(
+                target=self._compact_safely,
+                name=f"vector-compact-{os.path.basename(self.path)}",
+                daemon=True,
+            )
+            self._compaction_thread.start()
+
+    # 后台合并的入口，异常只记录日志
+    def _compact_safely(self) -> None:
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error(f"向量索引 {self.path} 合并失败: {e}", exc_info=True)
+
+    # 合并较小的段和已删除比例过高的段
+    def compact(self) -> None:
+        """
+        合并直到不再满足合并条件，之后按需训练 IVF 和 PQ 码本；期间写入等待，检索继续使用旧段
+        """
+        while True:
+            with self._write_lock():
+                with self._lock:
+                    self._refresh()
+                    selected = self._select_merge()
+                    if not selected:
+                        break
+                    merging = [self._segments[i] for i in selected]
+                    lives = [self._live[i] for i in selected]
+                    seq = self._next_seq
+                count = int(sum(live.sum() for live in lives))
+
+                # 构建新段时不持有 _lock，检索继续使用旧段
+                segment = None
+                if count:
+                    segment = VectorSegment.build(
+                        os.path.join(self.path, f"seg_{seq:08d}"),
+                        self._iter_live(merging, lives),
+                        count=count,
+                        dim=self.dim,
+                        dtype=self.dtype,
+                    )
+                    self._assign_segment(segment)
+                with self._lock:
+                    merged = {s.name for s in merging}
+                    keep = [
+                        i for i, s in enumerate(self._segments) if s.name not in merged
+                    ]
+                    self._segments = [self._segments[i] for i in keep]
+                    self._live = [self._live[i] for i in keep]
+                    for name in merged:
+                        self._deleted.pop(name, None)
+                    if segment is not None:
+                        self._segments.append(segment)
+                        self._live.append(np.ones(segment.size, dtype=bool))
+                    self._next_seq = seq + 1
+                    self._locations = None
+                    self._write_manifest()
+            # 旧段文件可以直接删除，已打开的内存映射在 Linux 上仍然有效
+            for old in merging:
+                shutil.rmtree(old.path, ignore_errors=True)
+            logger.info(
+                f"向量索引 {self.path} 已合并 {len(merging)} 个段, 存活分块 {count} 个"
+            )
+        self.train_ivf()
+        self.train_pq()
+
+    # 逐行读取若干段中的存活分块（全精度向量）
+    @staticmethod
+    def _iter_live(segments: List[VectorSegment], lives: List[np.ndarray]):
+        for segment, live in zip(segments, lives):
+            for row in np.flatnonzero(live):
+                yield (
+                    segment.ids[row],
+                    np.asarray(segment.full[row], dtype=np.float32),
+                    segment.get_text(int(row)),
+                    segment.metadatas[row],
+                )
+
+    # 重写所有段
+    def rebuild(self, dtype: Optional[str] = None) -> int:
+        """
+        把所有存活分块重写为一个段，可以同时修改存储精度；已训练的 IVF 保持不变，
+        存储精度为 pq 时在所有存活分块上重新训练码本，改为其他精度时删除码本；
+        期间写入等待，检索继续使用旧段
+
+        参数:
+            dtype: 新的存储精度，为 None 时保持不变
+
+        返回:
+            存活分块数
+        """
+        if dtype is not None and dtype not in DTYPES:
+            raise ValueError(f"存储精度必须是 {' / '.join(DTYPES)}")
+        with self._write_lock():
+            with self._lock:
+                self._refresh()
+                merging, lives = list(self._segments), list(self._live)
+                seq = self._next_seq
+            dtype = dtype or self.dtype
+            count = int(sum(live.sum() for live in lives))
+            segment = None
+            if count:
+                segment = VectorSegment.build(
+                    os.path.join(self.path, f"seg_{seq:08d}"),
+                    self._iter_live(merging, lives),
+                    count=count,
+                    dim=self.dim,
+                    dtype=dtype,
+                )
+                self._assign_segment(segment)
+            with self._lock:
+                old_pq = self._pq if dtype != "pq" else None
+                if old_pq is not None:
+                    self._pq, self._codebooks = None, None
+                self.dtype = dtype
+                self._segments = [segment] if segment is not None else []
+                self._live = (
+                    [np.ones(segment.size, dtype=bool)] if segment is not None else []
+                )
+                self._deleted = {}
+                self._next_seq = seq + 1
+                self._locations = None
+                self._write_manifest()
+        for old in merging:
+            shutil.rmtree(old.path, ignore_errors=True)
+        if old_pq is not None:
+            self._remove_file(self._codebooks_path(old_pq["version"]))
+        logger.info(f"向量索引 {self.path} 已重建, 存储精度 {dtype}, 存活分块 {count} 个")
+        if dtype == "pq":
+            self.train_pq(force=True)
+        return count
+
+    # 是否需要（重新）训练 IVF（调用方需持有 _lock）
+    def _needs_training(self) -> bool:
+        if not self.ivf_min_rows:
+            return False
+        live_count = int(sum(live.sum() for live in self._live))
+        if live_count < self.ivf_min_rows:
+            return False
+        return (
+            self._ivf is None
+            or live_count >= IVF_RETRAIN_GROWTH * self._ivf["trained_rows"]
+        )
+
+    # 训练 IVF 聚类中心并为所有段分配倒排列表
+    def train_ivf(self, force: bool = False) -> bool:
+        """
+        在存活分块的采样上训练聚类中心，随后为每个段写入新版本的倒排列表；
+        新版本写入清单前检索继续使用旧版本（或精确检索）
+
+        参数:
+            force: 为 True 时忽略分块数阈值，只要有足够的分块就训练
+
+        返回:
+            是否进行了训练
+        """
+        with self._write_lock():
+            with self._lock:
+                self._refresh()
+                if not force and not self._needs_training():
+                    return False
+                segments, lives = list(self._segments), list(self._live)
+                old_ivf = self._ivf
+                version = self._next_seq
+            live_count = int(sum(live.sum() for live in lives))
+            nlist = self.ivf_nlist or int(round(4 * np.sqrt(live_count)))
+            nlist = min(nlist, live_count // IVF_MIN_LIST_SIZE)
+            if nlist < 2:
+                return False
+
+            sample_size = min(live_count, nlist * IVF_SAMPLES_PER_LIST)
+            sample = self._sample_live(segments, lives, sample_size, seed=version)
+            centroids = train_centroids(sample, nlist, self.metric)
+
+            os.makedirs(self.path, exist_ok=True)
+            tmp_path = self._centroids_path(version) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, centroids)
+            os.replace(tmp_path, self._centroids_path(version))
+            for segment in segments:
+                segment.write_ivf(
+                    version, assign_lists(segment.full, centroids, self.metric)
+                )
+            with self._lock:
+                self._ivf = {
+                    "version": version,
+                    "nlist": nlist,
+                    "trained_rows": live_count,
+                }
+                self._centroids = centroids
+                self._next_seq = version + 1
+                self._write_manifest()
+        if old_ivf is not None:
+            self._remove_file(self._centroids_path(old_ivf["version"]))
+        logger.info(
+            f"向量索引 {self.path} 已训练 IVF: {nlist} 个列表, 样本 {sample_size} 个"
+        )
+        return True
+
+    # 是否需要（重新）训练 PQ 码本（调用方需持有 _lock）
+    def _needs_pq_training(self) -> bool:
+        if self.dtype != "pq":
+            return False
+        live_count = int(sum(live.sum() for live in self._live))
+        if live_count < PQ_MIN_TRAIN_ROWS:
+            return False
+        return (
+            self._pq is None
+            or live_count >= PQ_RETRAIN_GROWTH * self._pq["trained_rows"]
+        )
+
+    # 训练集合的 PQ 码本并为所有 pq 段编码
+    def train_pq(self, force: bool = False) -> bool:
+        """
+        在存活分块的采样上训练每个子空间的码本，随后为每个 pq 段写入新版本的码字；
+        新版本写入清单前检索继续使用旧版本的码字（或全精度向量）
+
+        参数:
+            force: 为 True 时忽略分块数阈值，只要有分块就训练
+
+        返回:
+            是否进行了训练
+        """
+        with self._write_lock():
+            with self._lock:
+                self._refresh()
+                if self.dtype != "pq" or not force and not self._needs_pq_training():
+                    return False
+                segments, lives = list(self._segments), list(self._live)
+                old_pq = self._pq
+                version = self._next_seq
+            live_count = int(sum(live.sum() for live in lives))
+            if not live_count:
+                return False
+
+            sample = self._sample_live(
+                segments, lives, min(live_count, PQ_TRAIN_SAMPLES), seed=version
+            )
+            m = min(self.pq_m or max(1, self.dim // PQ_SUBVECTOR_DIM), self.dim)
+            bounds = pq_bounds(self.dim, m)
+            ksub = min(PQ_KSUB, len(sample))
+            codebooks = np.zeros(
+                (m, ksub, int(np.diff(bounds).max())), dtype=np.float32
+            )
+            for j in range(m):
+                low, high = bounds[j], bounds[j + 1]
+                codebooks[j, :, : high - low] = train_centroids(
+                    sample[:, low:high], ksub, "l2"
+                )
+
+            tmp_path = self._codebooks_path(version) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, codebooks)
+            os.replace(tmp_path, self._codebooks_path(version))
+            for segment in segments:
+                if segment.dtype == "pq":
+                    segment.write_pq(version, encode_pq(segment.full, codebooks, bounds))
+            with self._lock:
+                self._pq = {"version": version, "m": m, "trained_rows": live_count}
+                self._codebooks = codebooks
+                self._next_seq = version + 1
+                self._write_manifest()
+        if old_pq is not None:
+            self._remove_file(self._codebooks_path(old_pq["version"]))
+        logger.info(
+            f"向量索引 {self.path} 已训练 PQ 码本: {m} 个子空间, 每个 {ksub} 个码字, "
+            f"样本 {len(sample)} 个"
+        )
+        return True
+
+    # 在若干段的存活行中均匀采样全精度向量
+    @staticmethod
+    def _sample_live(
+        segments: List[VectorSegment], lives: List[np.ndarray], size: int, seed: int
+    ) -> np.ndarray:
+        live_count = int(sum(live.sum() for live in lives))
+        rng = np.random.default_rng(seed)
+        picks = np.sort(rng.choice(live_count, size, replace=False))
+        sample, offset = [], 0
+        for segment, live in zip(segments, lives):
+            rows = np.flatnonzero(live)
+            local = picks[(picks >= offset) & (picks < offset + len(rows))] - offset
+            if len(local):
+                sample.append(np.asarray(segment.full[rows[local]], dtype=np.float32))
+            offset += len(rows)
+        return np.concatenate(sample)
+
+    # 删除不再使用的文件，文件不存在时忽略
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    # 删除整个索引
+    def drop(self) -> int:
+        """删除索引目录，返回删除前的存活分块数"""
+        with self._write_lock():
+            with self._lock:
+                self._refresh()
+                count = int(sum(live.sum() for live in self._live))
+                self._segments, self._live, self._deleted = [], [], {}
+                self._ivf, self._centroids = None, None
+                self._pq, self._codebooks = None, None
+                self._locations = None
+                self._manifest_mtime = None
+            shutil.rmtree(self.path, ignore_errors=True)
+        return count
+
+    # 索引统计信息
+    def stats(self) -> dict:
+        with self._lock:
+            self._refresh()
+            live_count = int(sum(live.sum() for live in self._live))
+            total = sum(segment.size for segment in self._segments)
+            # 检索时扫描的向量（或编码）占用的字节数
+            pq_version = self._pq["version"] if self._pq else None
+            vector_bytes = sum(
+                segment.scan_bytes(pq_version) for segment in self._segments
+            )
+            return {
+                "segments": len(self._segments),
+                "live_chunks": live_count,
+                "dead_chunks": total - live_count,
+                "dim": self.dim,
+                "metric": self.metric,
+                "dtype": self.dtype,
+                "vector_bytes": int(vector_bytes),
+                "ivf_lists": self._ivf["nlist"] if self._ivf else None,
+                "pq_subspaces": self._pq["m"] if self._pq else None,
+                "nprobe": self.nprobe,
+            }
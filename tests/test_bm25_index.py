@@ -0,0 +1,119 @@
+"""
+BM25 关键词索引的测试
+"""
+
+from langchain_core.documents import Document
+
+from app.utils.bm25_index import BM25Index
+
+
+# 构造一个文档的分块
+def chunks(doc_id: str, *texts: str) -> list:
+    return [
+        Document(
+            id=f"{doc_id}_{i}",
+            page_content=text,
+            metadata={"doc_id": doc_id, "chunk_index": i},
+        )
+        for i, text in enumerate(texts)
+    ]
+
+
+# 检索结果的分块ID
+def search_ids(index: BM25Index, query: str, **kwargs) -> list:
+    return [doc.id for doc, _ in index.search(query, k=10, **kwargs)]
+
+
+def test_search_ranks_matching_chunks(tmp_path):
+    index = BM25Index(str(tmp_path / "idx"))
+    index.add_document("a", chunks("a", "苹果 香蕉 apple", "橙子 orange"))
+    index.add_document("b", chunks("b", "香蕉 香蕉 banana"))
+
+    assert search_ids(index, "香蕉") == ["b_0", "a_0"]
+    assert search_ids(index, "orange") == ["a_1"]
+    assert search_ids(index, "葡萄") == []
+    assert search_ids(index, "香蕉", doc_ids=["a"]) == ["a_0"]
+    doc, score = index.search("apple", k=1)[0]
+    assert doc.page_content == "苹果 香蕉 apple"
+    assert doc.metadata["doc_id"] == "a"
+    assert score > 0
+
+
+def test_reindexing_document_tombstones_old_chunks(tmp_path):
+    index = BM25Index(str(tmp_path / "idx"), max_segments=100, compact_dead_ratio=1.0)
+    index.add_document("a", chunks("a", "旧版本 old", "保留 keep"))
+    index.add_document("b", chunks("b", "其他 other"))
+    index.add_document("a", chunks("a", "新版本 new", "保留 keep"))
+
+    assert search_ids(index, "old") == []
+    assert search_ids(index, "new") == ["a_0"]
+    assert search_ids(index, "keep") == ["a_1"]
+    stats = index.stats()
+    assert stats["live_chunks"] == 3
+    assert stats["dead_chunks"] == 2
+    assert stats["segments"] == 3
+
+
+def test_delete_document(tmp_path):
+    index = BM25Index(str(tmp_path / "idx"), max_segments=100, compact_dead_ratio=1.0)
+    index.add_document("a", chunks("a", "苹果 apple"))
+    index.add_document("b", chunks("b", "苹果 香蕉"))
+    index.delete_document("a")
+
+    assert search_ids(index, "苹果") == ["b_0"]
+    assert search_ids(index, "apple") == []
+    assert index.stats()["live_chunks"] == 1
+
+
+def test_compaction_drops_dead_chunks_and_tombstones(tmp_path):
+    path = str(tmp_path / "idx")
+    index = BM25Index(path, max_segments=100, compact_dead_ratio=1.0)
+    for i in range(5):
+        index.add_document(f"d{i}", chunks(f"d{i}", f"文本 text{i}", ""))
+    index.add_document("d0", chunks("d0", "替换 replaced"))
+    index.delete_document("d1")
+    before = {query: search_ids(index, query) for query in ("文本", "replaced", "text1")}
+
+    index.compact()
+
+    stats = index.stats()
+    assert stats == {
+        "segments": 1,
+        "live_chunks": 7,
+        "dead_chunks": 0,
+        "tombstones": 0,
+    }
+    assert {query: search_ids(index, query) for query in before} == before
+    # 合并后的段可以从磁盘重新加载
+    reopened = BM25Index(path)
+    assert reopened.stats() == stats
+    assert {query: search_ids(reopened, query) for query in before} == before
+
+
+def test_automatic_compaction_on_dead_ratio(tmp_path):
+    index = BM25Index(str(tmp_path / "idx"), max_segments=100, compact_dead_ratio=0.3)
+    index.add_document("a", chunks("a", "一 one", "二 two"))
+    index.add_document("b", chunks("b", "三 three"))
+    # 替换文档 a 后已删除比例为 2 / 5，超过阈值，自动合并
+    index.add_document("a", chunks("a", "四 four", "五 five"))
+
+    stats = index.stats()
+    assert stats["segments"] == 1
+    assert stats["dead_chunks"] == 0
+    assert search_ids(index, "two") == []
+    assert search_ids(index, "five") == ["a_1"]
+
+
+def test_empty_document_writes_no_segment(tmp_path):
+    index = BM25Index(str(tmp_path / "idx"))
+    index.add_document("a", chunks("a", "苹果"))
+    index.add_document("a", [])
+
+    assert search_ids(index, "苹果") == []
+    # 旧段全部失效，自动合并后不再有段
+    assert index.stats() == {
+        "segments": 0,
+        "live_chunks": 0,
+        "dead_chunks": 0,
+        "tombstones": 0,
+    }
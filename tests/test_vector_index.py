@@ -0,0 +1,198 @@
+"""
+嵌入式向量索引的测试
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from app.utils.vector_index import DTYPES, METRICS, VectorIndex
+
+DIM = 16
+
+
+# 生成随机向量
+def random_vectors(count: int, dim: int = DIM, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+
+# 写入一批分块，ID 为 c<序号>，文本为 t<序号>
+def upsert_rows(index: VectorIndex, vectors: np.ndarray, start: int = 0, doc_id="d"):
+    ids = [f"c{start + i}" for i in range(len(vectors))]
+    index.upsert(
+        ids,
+        vectors,
+        [f"t{start + i}" for i in range(len(vectors))],
+        [{"doc_id": doc_id, "chunk_index": start + i} for i in range(len(vectors))],
+    )
+    return ids
+
+
+# 精确检索的前 k 个结果（与索引的相关度定义一致）
+def exact_top_k(vectors: np.ndarray, query: np.ndarray, k: int, metric: str) -> list:
+    if metric == "cosine":
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        query = query / np.linalg.norm(query)
+    if metric == "l2":
+        scores = -((vectors - query) ** 2).sum(axis=1)
+    else:
+        scores = vectors @ query
+    return [f"c{i}" for i in np.argsort(-scores, kind="stable")[:k]]
+
+
+def test_upsert_replaces_existing_ids(tmp_path):
+    index = VectorIndex(str(tmp_path / "idx"))
+    vectors = random_vectors(10)
+    upsert_rows(index, vectors)
+    new_vector = random_vectors(1, seed=1)
+    index.upsert(["c3"], new_vector, ["new"], [{"doc_id": "d", "chunk_index": 3}])
+
+    documents = {doc.id: doc for doc in index.get_documents()}
+    assert len(documents) == 10
+    assert documents["c3"].page_content == "new"
+    assert index.search(new_vector, k=1)[0][0][0].id == "c3"
+    assert index.stats()["dead_chunks"] == 1
+
+
+def test_delete_and_delete_where(tmp_path):
+    index = VectorIndex(str(tmp_path / "idx"))
+    upsert_rows(index, random_vectors(5), doc_id="a")
+    upsert_rows(index, random_vectors(5, seed=1), start=5, doc_id="b")
+
+    assert index.delete(["c0", "missing"]) == 1
+    assert index.delete_where({"doc_id": "b"}) == 5
+    assert sorted(index.get_ids()) == ["c1", "c2", "c3", "c4"]
+    assert index.get_ids({"doc_id": "b"}) == []
+    results = index.search(random_vectors(1, seed=2), k=10)[0]
+    assert {doc.id for doc, _ in results} == {"c1", "c2", "c3", "c4"}
+
+
+def test_compaction_merges_segments_and_drops_deleted_rows(tmp_path):
+    index = VectorIndex(str(tmp_path / "idx"), max_segments=2, merge_factor=2)
+    vectors = random_vectors(40)
+    for start in range(0, 40, 10):
+        upsert_rows(index, vectors[start : start + 10], start=start)
+    index.delete([f"c{i}" for i in range(0, 40, 3)])
+    query = random_vectors(3, seed=5)
+    before = [[doc.id for doc, _ in hits] for hits in index.search(query, k=5)]
+
+    index.compact()
+
+    stats = index.stats()
+    assert stats["segments"] <= 2
+    assert stats["dead_chunks"] == 0
+    assert stats["live_chunks"] == 40 - len(range(0, 40, 3))
+    assert [[doc.id for doc, _ in hits] for hits in index.search(query, k=5)] == before
+
+
+def test_reopen_from_disk(tmp_path):
+    path = str(tmp_path / "idx")
+    index = VectorIndex(path, metric="l2", dtype="int8")
+    vectors = random_vectors(20)
+    upsert_rows(index, vectors)
+    index.delete(["c4"])
+    query = random_vectors(1, seed=3)
+    before = [doc.id for doc, _ in index.search(query, k=5)[0]]
+
+    # 新实例的度量类型和存储精度以清单为准
+    reopened = VectorIndex(path)
+    assert reopened.stats()["metric"] == "l2"
+    assert reopened.stats()["dtype"] == "int8"
+    assert sorted(reopened.get_ids()) == sorted(f"c{i}" for i in range(20) if i != 4)
+    assert [doc.id for doc, _ in reopened.search(query, k=5)[0]] == before
+    # 重新打开后仍然可以写入和替换
+    upsert_rows(reopened, random_vectors(2, seed=4), start=19)
+    assert len(reopened.get_ids()) == 20
+
+
+@pytest.mark.parametrize("metric", METRICS)
+@pytest.mark.parametrize("dtype", DTYPES)
+def test_search_for_each_dtype_and_metric(tmp_path, dtype, metric):
+    index = VectorIndex(str(tmp_path / "idx"), metric=metric, dtype=dtype)
+    vectors = random_vectors(200)
+    upsert_rows(index, vectors)
+    queries = random_vectors(10, seed=7)
+
+    results = index.search(queries, k=5)
+    for query, hits in zip(queries, results):
+        ids = [doc.id for doc, _ in hits]
+        scores = [score for _, score in hits]
+        assert len(ids) == 5
+        # l2 返回距离的平方，越小越相关
+        assert scores == sorted(scores, reverse=metric != "l2")
+        # 量化的段先取候选再用全精度向量重排，第一名与精确检索一致
+        assert ids[0] == exact_top_k(vectors, query, 1, metric)[0]
+        if dtype == "float32":
+            assert ids == exact_top_k(vectors, query, 5, metric)
+
+
+@pytest.mark.parametrize("metric", METRICS)
+def test_ivf_recall_against_exact_search(tmp_path, metric):
+    # 聚类分布的数据，更接近真实的向量分布
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((20, DIM)) * 5
+    vectors = (
+        centers[rng.integers(0, 20, 4000)] + rng.standard_normal((4000, DIM))
+    ).astype(np.float32)
+    index = VectorIndex(str(tmp_path / "idx"), metric=metric, ivf_nlist=32, nprobe=8)
+    for start in range(0, 4000, 1000):
+        upsert_rows(index, vectors[start : start + 1000], start=start)
+    assert index.train_ivf(force=True)
+    assert index.stats()["ivf_lists"] == 32
+
+    queries = vectors[rng.choice(4000, 50, replace=False)] + 0.1 * rng.standard_normal(
+        (50, DIM)
+    ).astype(np.float32)
+    k = 10
+    exact = [exact_top_k(vectors, query, k, metric) for query in queries]
+
+    # 扫描所有列表时与精确检索一致
+    full = index.search(queries, k=k, nprobe=32)
+    assert [[doc.id for doc, _ in hits] for hits in full] == exact
+
+    approximate = index.search(queries, k=k)
+    recall = np.mean(
+        [
+            len({doc.id for doc, _ in hits} & set(expected)) / k
+            for hits, expected in zip(approximate, exact)
+        ]
+    )
+    assert recall >= 0.9
+
+    # 训练后写入的段直接分配倒排列表，可以被检索到
+    upsert_rows(index, vectors[:1] + 100, start=4000)
+    assert index.search(vectors[:1] + 100, k=1)[0][0][0].id == "c4000"
+
+
+@pytest.mark.parametrize("metric", METRICS)
+def test_pq_codebooks_are_trained_once_per_collection(tmp_path, metric):
+    path = str(tmp_path / "idx")
+    index = VectorIndex(path, metric=metric, dtype="pq", pq_m=4)
+    vectors = random_vectors(1200)
+    for start in range(0, 1200, 300):
+        upsert_rows(index, vectors[start : start + 300], start=start)
+    # 训练码本之前 pq 段扫描全精度向量
+    assert index.stats()["pq_subspaces"] is None
+    assert index.train_pq()
+    assert index.stats()["pq_subspaces"] == 4
+    assert index.stats()["vector_bytes"] == 1200 * 4
+
+    # 训练后写入的段直接按集合的码本编码，分块数增长不多时不重新训练
+    vectors = np.concatenate([vectors, random_vectors(10, seed=1)])
+    upsert_rows(index, vectors[1200:], start=1200)
+    assert index.stats()["vector_bytes"] == 1210 * 4
+    assert not index.train_pq()
+
+    queries = random_vectors(10, seed=2)
+    results = [[doc.id for doc, _ in hits] for hits in index.search(queries, k=5)]
+    for query, ids in zip(queries, results):
+        assert ids[0] == exact_top_k(vectors, query, 1, metric)[0]
+    # 重新打开后使用清单中记录的码本
+    reopened = VectorIndex(path)
+    assert [[doc.id for doc, _ in hits] for hits in reopened.search(queries, k=5)] == results
+
+    # 改为全精度后删除码本
+    index.rebuild(dtype="float32")
+    assert index.stats()["pq_subspaces"] is None
+    assert not [name for name in os.listdir(path) if name.startswith("pq_")]
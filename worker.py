@@ -0,0 +1,27 @@
+import signal
+import threading
+
+from app.utils.logger import get_logger
+from app.services.ingestion_worker import IngestionWorkerPool
+
+logger = get_logger(__name__)
+
+
+# 独立运行的文档处理工作进程，可以启动多个，与 Web 进程共享数据库中的任务队列
+# Web 进程可设置 INGESTION_WORKERS_ENABLED=false，只负责接收请求和提交任务
+if __name__ == "__main__":
+    stop_event = threading.Event()
+    # 收到终止信号时停止领取新任务
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+
+    pool = IngestionWorkerPool(refresh_embeddings=True)
+    logger.info(
+        f"正在启动文档处理工作进程, 线程数: {pool.num_workers}, 模式: {pool.mode}"
+    )
+    pool.start()
+    # 定时唤醒，保证主线程能及时处理信号
+    while not stop_event.wait(1):
+        pass
+    logger.info("正在停止文档处理工作进程，等待当前任务结束")
+    pool.stop()